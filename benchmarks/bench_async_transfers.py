@@ -0,0 +1,56 @@
+"""
+Benchmark: concurrent transfers served by one worker thread, with the
+sync SpotifyClient (one transfer at a time, like a sync gunicorn worker)
+and with the AsyncSpotifyClient (every transfer awaited together).
+Requires httpx.
+
+    $ python benchmarks/bench_async_transfers.py [--transfers 1 8 32] [--songs 50] [--latency 0.05]
+"""
+import argparse
+import asyncio
+
+from common import make_app, make_client, make_songs, timed
+from rythmize.clients.resolution import MemoryBackend, track_cache
+from rythmize.clients.spotify_async import AsyncSpotifyClient, async_transport
+from stub_spotify import StubSpotifyServer
+
+
+def run_sync(server, transfers, songs, workers):
+    for n in range(transfers):
+        client = make_client(server, user_id=n, search_workers=workers, user_rate_limit=1e6)
+        assert client.perform_transfer_tracks(f'sync-{transfers}-{n}', songs[n]) is not None
+
+
+def run_async(server, transfers, songs, workers):
+    async def transfer_all():
+        clients = [make_client(server, user_id=n, client_class=AsyncSpotifyClient,
+                               search_workers=workers, user_rate_limit=1e6) for n in range(transfers)]
+        return await asyncio.gather(*(client.perform_transfer_tracks(f'async-{transfers}-{n}', songs[n])
+                                      for n, client in enumerate(clients)))
+    assert all(async_transport.run(transfer_all()))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transfers', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--songs', type=int, default=50, help='songs per transfer')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per stub request')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent searches per transfer')
+    args = parser.parse_args()
+
+    make_app()
+    server = StubSpotifyServer(latency=args.latency).start()
+    try:
+        for transfers in args.transfers:
+            for label, run in (('sync', run_sync), ('async', run_async)):
+                track_cache.backend = MemoryBackend()   # every transfer searches every song
+                songs = [make_songs(args.songs, prefix=f'{label}{transfers}x{n}x') for n in range(transfers)]
+                _, elapsed = timed(run, server, transfers, songs, args.workers)
+                print(f'{label:<6} transfers={transfers:<4} {elapsed:7.2f}s '
+                      f'{transfers / elapsed:7.2f} transfers/s')
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
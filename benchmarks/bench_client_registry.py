@@ -0,0 +1,72 @@
+"""
+Benchmark: authenticated spotify status requests per second without the
+client registry (before, every request builds its client from the user
+&& its keys) vs with it, && the user loads && sql statements they run.
+The identity cache is on in both runs, it already spares the statements.
+
+    $ python benchmarks/bench_client_registry.py [--requests 2000]
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from common import make_app, timed
+from rythmize import db
+from rythmize.clients.registry import client_registry
+from rythmize.extensions import guard
+from rythmize.models.keys import SpotifyJsonWebToken, YoutubeJsonWebToken
+from rythmize.models.user import User, identity_cache
+
+
+def make_user():
+    user = User(username='user', email='user@example.com', password='password')
+    user.spotify_keys = SpotifyJsonWebToken(jwt_token='token')
+    user.spotify_keys.refresh_token = 'refresh'
+    user.spotify_keys.token_expires_on = datetime.now() + timedelta(hours=1)
+    user.youtube_keys = YoutubeJsonWebToken()
+    db.session.add(user)
+    db.session.commit()
+    return {'Authorization': f'Bearer {guard.encode_jwt_token(user)}'}
+
+
+def measure(label, app, headers, count, cache_size):
+    app.config['SPOTIFY_CLIENT_CACHE_SIZE'] = cache_size
+    client_registry.init_app(app)
+    client = app.test_client()
+
+    def requests():
+        for _ in range(count):
+            db.session.remove()
+            response = client.get('/api/v1/auth/connect/spotify/status', headers=headers)
+            assert response.status_code == 200
+
+    def user_loads():
+        stats = identity_cache.stats()
+        return stats['hits'] + stats['misses']
+
+    statements = []
+    record = lambda *args: statements.append(args[2])  # noqa: E731
+    requests()  # warm up: first lookups fill the caches
+    loads = user_loads()
+    event.listen(db.engine, 'before_cursor_execute', record)
+    _, elapsed = timed(requests)
+    event.remove(db.engine, 'before_cursor_execute', record)
+    print(f'{label:<12} {count / elapsed:9.0f} requests/s {(user_loads() - loads) / count:5.2f} user loads '
+          f'{len(statements) / count:5.2f} statements per request')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = make_app()
+    headers = make_user()
+    # a registry of size 0 keeps nothing
+    measure('no registry', app, headers, args.requests, 0)
+    measure('registry', app, headers, args.requests, 10000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Benchmark: filtering resolved uris against the destination playlist,
+list membership (before) vs the set built by get_tracks_uri.
+
+    $ python benchmarks/bench_dedup.py [--existing 10000] [--incoming 10000]
+"""
+import argparse
+
+from common import timed
+from rythmize.clients.spotify import SpotifyClient, Track
+
+
+def filter_list(existing, incoming):
+    track_uris = [track.uri for track in existing]
+    return [uri for uri in incoming if uri and uri not in track_uris]
+
+
+def filter_set(existing, incoming):
+    track_uris = SpotifyClient.get_tracks_uri(existing)
+    uris = []
+    for uri in incoming:
+        if uri and uri not in track_uris:
+            uris.append(uri)
+            track_uris.add(uri)
+    return uris
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--existing', type=int, default=10000)
+    parser.add_argument('--incoming', type=int, default=10000)
+    args = parser.parse_args()
+
+    existing = [Track(f'id{n}', f'song{n}', 180000, 'album', 'artist', f'spotify:track:{n:022d}')
+                for n in range(args.existing)]
+    # half of the incoming tracks are already in the playlist
+    incoming = [f'spotify:track:{n:022d}' for n in range(args.existing // 2,
+                                                          args.existing // 2 + args.incoming)]
+    listed, list_elapsed = timed(filter_list, existing, incoming)
+    kept, set_elapsed = timed(filter_set, existing, incoming)
+    assert listed == kept
+    print(f'existing={args.existing} incoming={args.incoming} new={len(kept)}')
+    print(f'list {list_elapsed * 1000:10.1f} ms')
+    print(f'set  {set_elapsed * 1000:10.1f} ms  x{list_elapsed / set_elapsed:.0f}')
+
+
+if __name__ == '__main__':
+    main()
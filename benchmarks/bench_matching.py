@@ -0,0 +1,97 @@
+"""
+Benchmark: match rate of the first search result (before) vs the scored
+best candidate, && candidates scored per second, offline.
+
+The corpus is generated from a seed: every song comes with 20 candidates
+(its live, karaoke && remix versions, covers, other songs of the artist)
+in a shuffled order, && is asked for with typos, accents || a feat.
+
+    $ python benchmarks/bench_matching.py [--songs 2000] [--seed 7]
+"""
+import argparse
+import random
+
+from common import timed
+from rythmize.clients.matching import TrackMatcher
+from rythmize.clients.spotify import SpotifyClient
+
+WORDS = ('love', 'night', 'heart', 'fire', 'dance', 'summer', 'dream', 'light', 'rain', 'gold',
+         'river', 'city', 'wild', 'blue', 'home', 'run', 'forever', 'alone', 'stars', 'echo')
+ARTISTS = ('Beyoncé', 'The Midnight', 'Sigur Rós', 'Daft Punk', 'Röyksopp', 'Florence', 'Muse',
+           'Arcade Fire', 'Björk', 'The National', 'Phoenix', 'Justice', 'Air', 'Moderat')
+
+
+def track(rng, name, artists, duration_ms):
+    return {'name': name, 'artists': [{'name': artist} for artist in artists],
+            'duration_ms': duration_ms, 'uri': f'spotify:track:{rng.getrandbits(64):x}'}
+
+
+def typo(rng, text):
+    index = rng.randrange(len(text))
+    return text[:index] + text[index + 1:]
+
+
+def make_corpus(count, seed):
+    """Returns [(song, candidates, uri of the right candidate)]."""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        title = ' '.join(rng.sample(WORDS, rng.choice((1, 2, 3)))).title()
+        artist = rng.choice(ARTISTS)
+        duration = rng.randrange(150000, 300000)
+        right = track(rng, title, [artist], duration)
+        candidates = [right,
+                      track(rng, f'{title} - Live', [artist], duration + 20000),
+                      track(rng, f'{title} (Karaoke Version)', ['Karaoke Hits'], duration),
+                      track(rng, f'{title} - Remix', [artist, rng.choice(ARTISTS)], duration + 60000),
+                      track(rng, title, [rng.choice(ARTISTS)], rng.randrange(150000, 300000))]
+        while len(candidates) < 20:
+            other = ' '.join(rng.sample(WORDS, 2)).title()
+            candidates.append(track(rng, other, [rng.choice((artist,) + ARTISTS)],
+                                    rng.randrange(150000, 300000)))
+        # spotify ranks the right track first about half of the time
+        rng.shuffle(candidates)
+        if rng.random() < 0.5:
+            candidates.remove(right)
+            candidates.insert(0, right)
+        song = {'track': title, 'artist': artist, 'duration_ms': duration}
+        noise = rng.random()
+        if noise < 0.25:
+            song['track'] = typo(rng, title)
+        elif noise < 0.5:
+            song['track'] = f'{title} (feat. {rng.choice(ARTISTS)})'
+        elif noise < 0.75:
+            song['artist'] = artist.replace('é', 'e').replace('ö', 'o').replace('ó', 'o').lower()
+        if rng.random() < 0.3:
+            del song['duration_ms']     # youtube songs rarely carry one
+        corpus.append((song, candidates, right['uri']))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--songs', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.songs, args.seed)
+    first = sum(candidates[0]['uri'] == uri for _, candidates, uri in corpus)
+    matcher = TrackMatcher()
+    results, elapsed = timed(lambda: [(matcher.best(song, candidates), uri)
+                                      for song, candidates, uri in corpus])
+    scored = sum(len(candidates) for _, candidates, _ in corpus)
+    matched = sum(best['uri'] == uri for (best, _), uri in results)
+    confident = [(best['uri'] == uri) for (best, score), uri in results
+                 if score >= SpotifyClient.match_threshold]
+    relaxed = len(results) - len(confident)
+
+    print(f'songs={len(corpus)} candidates={scored}')
+    print(f'first result   {first / len(corpus):7.1%} matched')
+    print(f'best scored    {matched / len(corpus):7.1%} matched  '
+          f'{scored / elapsed:10.0f} candidates/s')
+    print(f'above {SpotifyClient.match_threshold:.2f}     {sum(confident) / max(1, len(confident)):7.1%} '
+          f'right, {relaxed / len(corpus):.1%} of the songs would send a relaxed search')
+
+
+if __name__ == '__main__':
+    main()
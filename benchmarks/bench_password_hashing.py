@@ -0,0 +1,57 @@
+"""
+Benchmark: password hashes per second per core for each hasher setting.
+
+    $ python benchmarks/bench_password_hashing.py [--seconds 2] [--workers 4]
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from common import timed
+from rythmize.passwords import PasswordHasher, hash_password
+
+SETTINGS = [
+    ('pbkdf2', {'iterations': 150000}),      # werkzeug default, hashes made before hashers
+    ('pbkdf2', {'iterations': 260000}),
+    ('scrypt', {'n': 2 ** 14, 'r': 8, 'p': 1}),
+    ('scrypt', {'n': 2 ** 15, 'r': 8, 'p': 1}),
+    ('argon2', {'time_cost': 2, 'memory_cost': 19456, 'parallelism': 1}),
+    ('argon2', {'time_cost': 3, 'memory_cost': 65536, 'parallelism': 4}),
+]
+
+
+def rate(func, seconds):
+    """Calls func repeatedly for about seconds, returns calls per second."""
+    count, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        func()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    print(f'{"setting":<64} {"1 core":>10} {f"{args.workers} procs":>10} {"per core":>10}')
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for scheme, params in SETTINGS:
+            label = f'{scheme} {params}'
+            try:
+                PasswordHasher(scheme, params).hash('warmup')
+            except RuntimeError as error:
+                print(f'{label:<64} skipped: {error}')
+                continue
+            single = rate(lambda: hash_password(scheme, params, 'password'), args.seconds)
+            batch = max(args.workers, int(single * args.seconds))
+            _, elapsed = timed(lambda: list(pool.map(hash_password, [scheme] * batch, [params] * batch,
+                                                     ['password'] * batch)))
+            parallel = batch / elapsed
+            print(f'{label:<64} {single:>8.1f}/s {parallel:>8.1f}/s {parallel / args.workers:>8.1f}/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark: repeating a transfer into the same playlist (before) vs an
+incremental sync, once the playlist holds --songs and --new songs were
+added to the source. The track cache is emptied before each run.
+
+    $ python benchmarks/bench_playlist_sync.py [--songs 2000] [--new 20] [--latency 0.02]
+"""
+import argparse
+
+from common import make_app, make_client, make_songs, timed
+from rythmize.clients.resolution import MemoryBackend, track_cache
+from rythmize.clients.spotify import SpotifyClient
+from rythmize.metrics import metrics
+from rythmize.models.sync import PlaylistSync
+from stub_spotify import StubSpotifyServer
+
+
+def spotify_calls():
+    return sum(value for name, value in metrics.snapshot().items()
+               if name.startswith('rythmize_spotify_requests_total'))
+
+
+def measure(label, func, *args):
+    track_cache.backend = MemoryBackend()
+    before = spotify_calls()
+    result, elapsed = timed(func, *args)
+    assert result is not None
+    print(f'{label:<9} {elapsed:7.2f}s {spotify_calls() - before:6d} spotify calls')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--songs', type=int, default=2000)
+    parser.add_argument('--new', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per stub request')
+    args = parser.parse_args()
+
+    make_app()
+    server = StubSpotifyServer(latency=args.latency).start()
+    songs = make_songs(args.songs)
+    source = songs + make_songs(args.new, prefix='new')
+    try:
+        client = make_client(server, user_rate_limit=1000)
+        sync = PlaylistSync.get_or_create(1, 'source', 'synced')
+        # both playlists hold the first songs
+        client.perform_transfer_tracks('repeated', songs)
+        client.perform_sync_tracks(sync, sync.new_songs(songs, SpotifyClient.song_key))
+        print(f'playlist={args.songs} new={args.new} latency={args.latency * 1000:.0f}ms')
+        measure('transfer', client.perform_transfer_tracks, 'repeated', source)
+        measure('sync', lambda: client.perform_sync_tracks(
+            sync, sync.new_songs(source, SpotifyClient.song_key)))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Benchmark: chunked playlist writes for large transfers.
+
+    $ python benchmarks/bench_playlist_writes.py [--tracks 1000 10000] [--latency 0.02]
+"""
+import argparse
+
+from common import make_app, make_client, make_songs, timed
+from stub_spotify import StubSpotifyServer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per stub request')
+    args = parser.parse_args()
+
+    make_app()
+    server = StubSpotifyServer(latency=args.latency).start()
+    try:
+        for count in args.tracks:
+            client = make_client(server, user_id=count, search_workers=16, user_rate_limit=10000)
+            uris = [f'spotify:track:{n:022d}' for n in range(count)]
+            playlist_id = server.create_playlist(f'writes-{count}')
+            result, elapsed = timed(client.add_tracks_to_playlist, playlist_id, uris)
+            assert len(server.playlists[playlist_id]['tracks']) == count
+            print(f'write    tracks={count:<6} chunks={len(result["chunks"]):<4} '
+                  f'{elapsed:7.2f}s {count / elapsed:9.1f} tracks/s')
+
+            songs = make_songs(count, prefix=f'transfer{count}x')
+            result, elapsed = timed(client.perform_transfer_tracks, f'transfer-{count}', songs)
+            added = sum(chunk['size'] for chunk in result['chunks'] if chunk['status'] == 'added')
+            print(f'transfer tracks={count:<6} added={added:<6} '
+                  f'{elapsed:7.2f}s {count / elapsed:9.1f} tracks/s')
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
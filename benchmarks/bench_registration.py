@@ -0,0 +1,77 @@
+"""
+Benchmark: registration latency as the user table grows.
+
+Users are seeded with a bulk insert and one precomputed hash, so seeding
+1M rows takes seconds rather than hours; the timed registrations hash with
+PASSWORD_PBKDF2_ITERATIONS=1000 so the database work is what gets measured.
+
+    $ python benchmarks/bench_registration.py [--users 1000000] [--requests 200]
+"""
+import argparse
+import statistics
+import time
+
+import common
+
+CHUNK = 50000
+
+
+def seed(start, stop, password_hash):
+    from rythmize import db
+    from rythmize.models.user import User
+
+    for low in range(start, stop, CHUNK):
+        rows = [{'username': f'seed{i}', 'email': f'seed{i}@example.com',
+                 'email_confirmed': True, '_password': password_hash}
+                for i in range(low, min(low + CHUNK, stop))]
+        db.session.execute(User.__table__.insert(), rows)
+    db.session.commit()
+
+
+def register(client, username, email):
+    data = {'username': username, 'email': email, 'password': 'password'}
+    start = time.perf_counter()
+    response = client.post('/api/v1/auth/user/register', json=data)
+    return response.status_code, (time.perf_counter() - start) * 1000
+
+
+def summary(samples):
+    samples = sorted(samples)
+    return (f'p50 {statistics.median(samples):>6.2f} ms  '
+            f'p95 {samples[int(len(samples) * 0.95) - 1]:>6.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    app = common.make_app(MAIL_WORKERS=0, MAIL_SUPPRESS_SEND=True,
+                          MAIL_DEFAULT_SENDER='bench@example.com',
+                          PASSWORD_PBKDF2_ITERATIONS=1000)
+    from rythmize.extensions import hasher
+    from rythmize.tasks import mail_outbox
+
+    client = app.test_client()
+    password_hash = hasher.hash('password')
+    checkpoints = [n for n in (1000, 10000, 100000, 1000000) if n < args.users] + [args.users]
+    seeded = 0
+    print(f'{"users":>9} {"seed":>8}   {"new user":<28} {"duplicate email":<28}')
+    for checkpoint in checkpoints:
+        _, elapsed = common.timed(seed, seeded, checkpoint, password_hash)
+        seeded = checkpoint
+        created, rejected = [], []
+        for i in range(args.requests):
+            status, ms = register(client, f'bench{seeded}_{i}', f'Bench{seeded}_{i}@example.com')
+            assert status == 200
+            created.append(ms)
+            status, ms = register(client, f'dup{seeded}_{i}', f'SEED{i}@example.com')
+            assert status == 401
+            rejected.append(ms)
+        mail_outbox.run_pending()     # MAIL_SUPPRESS_SEND, only drains the queue
+        print(f'{seeded:>9} {elapsed:>7.1f}s   {summary(created):<28} {summary(rejected):<28}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark: cold start of a worker, in fresh interpreters.
+Reports the import time of the package, create_app and the first request,
+with and without the admin panel.
+
+    $ python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+from config import Config
+from rythmize import create_app
+imported = time.perf_counter()
+
+class StartupConfig(Config):
+    SECRET_KEY = 'startup'
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    ADMIN_ENABLED = sys.argv[1] == '1'
+    TRANSFER_WORKERS = MAIL_WORKERS = TOKEN_REFRESHER_INTERVAL = 0
+
+app = create_app(StartupConfig)
+created = time.perf_counter()
+app.test_client().get('/api/v1/auth/validate/jwt')
+served = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported,
+                  'first request': served - created, 'modules': len(sys.modules)}))
+'''
+
+
+def run(admin):
+    output = subprocess.run([sys.executable, '-c', CHILD, '1' if admin else '0'], cwd=ROOT,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"":<12} {"import":>10} {"create_app":>11} {"first req":>10} {"modules":>8}')
+    for admin in (True, False):
+        runs = [run(admin) for _ in range(args.runs)]
+        median = {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+        print(f'{"admin" if admin else "api only":<12} {median["import"] * 1000:>8.0f}ms '
+              f'{median["create_app"] * 1000:>9.0f}ms {median["first request"] * 1000:>8.0f}ms '
+              f'{median["modules"]:>8.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark: memory && cpu of a 10k-track playlist, nested per-track
+dicts (before) vs Track records serialized at the response edge.
+
+    $ python benchmarks/bench_track_records.py [--tracks 10000]
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import timedelta
+
+from flask import jsonify
+
+from common import make_app
+from rythmize.api.v1.views.spotify_crud import json_response
+from rythmize.clients.spotify import SpotifyClient
+
+
+def spotify_items(count):
+    """Playlist items as the spotify api returns them."""
+    return [{'track': {'id': f'{n:022d}', 'name': f'song{n}', 'uri': f'spotify:track:{n:022d}',
+                       'duration_ms': 120000 + n * 37,
+                       'album': {'name': f'album{n % 500}', 'artists': [{'name': f'artist{n % 50}'}]}}}
+            for n in range(count)]
+
+
+def format_dict(track):
+    return {track['id']: {'title': track['name'],
+            'duration': str(timedelta(milliseconds=track['duration_ms']))[:4] + ' min',
+            'album': track['album']['name'],
+            'artist': track['album']['artists'][0]['name'],
+            'service': 'spotify',
+            'uri': track['uri']
+            }}
+
+
+def dicts(items):
+    tracks = [format_dict(data['track']) for data in items]
+    uris = {uri['uri'] for t in tracks for uri in t.values()}
+    return tracks, uris, lambda: jsonify(tracks).data
+
+
+def records(items):
+    tracks = [SpotifyClient.format_track(data['track']) for data in items]
+    uris = SpotifyClient.get_tracks_uri(tracks)
+    return tracks, uris, lambda: json_response([track.to_json() for track in tracks])[0].data
+
+
+def measure(build, items):
+    """Returns (retained bytes, build seconds, serialize seconds), timed without tracemalloc."""
+    tracemalloc.start()
+    kept = build(items)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    start = time.perf_counter()
+    tracks, uris, serialize = build(items)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    serialize()
+    return retained, built, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, default=10000)
+    args = parser.parse_args()
+
+    app = make_app()
+    items = spotify_items(args.tracks)
+    print(f'tracks={args.tracks} orjson={"on" if app.config["FAST_JSON"] else "off"}')
+    for label, build in (('dicts', dicts), ('records', records)):
+        with app.test_request_context():
+            runs = [measure(build, items) for _ in range(5)]
+        retained, built, serialized = (min(column) for column in zip(*runs))
+        print(f'{label:<8} {retained / 2 ** 20:7.2f} MiB retained  build {built * 1000:7.1f} ms'
+              f'  serialize {serialized * 1000:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
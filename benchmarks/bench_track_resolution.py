@@ -0,0 +1,37 @@
+"""
+Benchmark: sequential vs concurrent track resolution.
+
+    $ python benchmarks/bench_track_resolution.py [--songs 300] [--latency 0.05]
+"""
+import argparse
+
+from common import make_client, make_songs, timed
+from rythmize.clients.resolution import MemoryBackend, track_cache
+from stub_spotify import StubSpotifyServer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--songs', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per stub request')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    server = StubSpotifyServer(latency=args.latency).start()
+    songs = make_songs(args.songs)
+    try:
+        baseline = None
+        for workers in args.workers:
+            track_cache.backend = MemoryBackend()   # every run searches every song
+            client = make_client(server, user_id=workers, search_workers=workers, user_rate_limit=1000)
+            uris, elapsed = timed(client.resolve_track_uris, songs)
+            assert len(uris) == len(songs) and all(uris)
+            baseline = baseline or elapsed
+            print(f'workers={workers:<3} songs={len(songs)} {elapsed:7.2f}s '
+                  f'{len(songs) / elapsed:8.1f} songs/s  x{baseline / elapsed:.1f}')
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Helpers shared by the benchmarks."""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_app(**settings):
+    """Creates the app on an in-memory database and pushes its context."""
+    from cryptography.fernet import Fernet
+
+    from config import Config
+    from rythmize import create_app, db
+
+    class BenchmarkConfig(Config):
+        SECRET_KEY = Fernet.generate_key().decode()
+        SQLALCHEMY_DATABASE_URI = 'sqlite://'
+        TRANSFER_WORKERS = 0
+        TOKEN_REFRESHER_INTERVAL = 0
+        TRANSFER_REAPER_INTERVAL = 0
+        METRICS_ENABLED = True
+
+    for name, value in settings.items():
+        setattr(BenchmarkConfig, name, value)
+    app = create_app(BenchmarkConfig)
+    app.app_context().push()
+    db.create_all()
+    return app
+
+
+def make_client(server, user_id=1, client_class=None, **attrs):
+    """
+    Builds a SpotifyClient pointed at a stub server, without a database.
+    The app rate budget is lifted, the stub has no rate limit to respect.
+    """
+    from rythmize.clients.spotify import SpotifyClient
+    from rythmize.clients.throttle import scheduler
+
+    scheduler.app_rate = 1e6
+
+    keys = SimpleNamespace(jwt_token='stub-token', refresh_token='stub-refresh',
+                           expires_in=datetime.now() + timedelta(hours=1))
+    user = SimpleNamespace(id=user_id, spotify_keys=keys)
+    client = (client_class or SpotifyClient)(None, user)
+    client.api_endpoint = f'{server.url}/v1'
+    client.tokenapi_endpoint = f'{server.url}/api/token'
+    for attr, value in attrs.items():
+        setattr(client, attr, value)
+    return client
+
+
+def make_songs(count, prefix='song'):
+    return [{'track': f'{prefix}{i}', 'artist': f'artist{i % 50}'} for i in range(count)]
+
+
+def timed(func, *args, **kwargs):
+    """Returns (result, elapsed seconds)."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
@@ -0,0 +1,137 @@
+"""
+Local stub of the Spotify Web API used by the benchmarks.
+Serves just enough of accounts.spotify.com and api.spotify.com for the
+client, with an injectable per-request latency.
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubSpotifyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive, like the real api
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        parts = url.path.strip('/').split('/')
+        if url.path.startswith('/v1/search'):
+            return self.send_json(self.server.search(params.get('q', '')))
+        if parts[:2] == ['v1', 'me'] and len(parts) == 2:
+            return self.send_json({'id': 'stub-user'})
+        if parts[:3] == ['v1', 'me', 'playlists']:
+            return self.send_json(self.server.page('me/playlists', self.server.playlist_items(), params))
+        if parts[:2] == ['v1', 'playlists'] and len(parts) == 3 and parts[2] in self.server.playlists:
+            playlist = self.server.playlists[parts[2]]
+            return self.send_json({'id': parts[2], 'name': playlist['name'], 'snapshot_id': playlist['snapshot_id']})
+        if parts[:2] == ['v1', 'playlists'] and parts[3:] == ['tracks']:
+            items = [{'track': t} for t in self.server.playlists.get(parts[2], {}).get('tracks', [])]
+            return self.send_json(self.server.page(f'playlists/{parts[2]}/tracks', items, params))
+        self.send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        body = self.read_body()
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if parts == ['api', 'token']:
+            return self.send_json({'access_token': 'stub-token', 'expires_in': 3600})
+        if parts[:2] == ['v1', 'users'] and parts[3:] == ['playlists']:
+            data = json.loads(body or b'{}')
+            return self.send_json({'id': self.server.create_playlist(data.get('name'))}, 201)
+        if parts[:2] == ['v1', 'playlists'] and parts[3:] == ['tracks']:
+            data = json.loads(body or b'[]')
+            uris = data['uris'] if isinstance(data, dict) else data
+            if len(uris) > self.server.max_uris:
+                return self.send_json({'error': 'Too many ids requested'}, 400)
+            return self.send_json({'snapshot_id': self.server.add_tracks(parts[2], uris)}, 201)
+        self.send_json({'error': 'not found'}, 404)
+
+
+class StubSpotifyServer(ThreadingHTTPServer):
+    """In-memory Spotify, threaded so concurrent clients overlap."""
+    daemon_threads = True
+    page_limit = 100
+    max_uris = 100
+
+    def __init__(self, latency=0.0, port=0):
+        super().__init__(('127.0.0.1', port), StubSpotifyHandler)
+        self.latency = latency
+        self.playlists = {}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    @staticmethod
+    def make_track(name, artist):
+        track_id = hashlib.md5(f'{name}|{artist}'.lower().encode()).hexdigest()[:22]
+        return {
+            'id': track_id, 'name': name, 'uri': f'spotify:track:{track_id}',
+            'duration_ms': 200000,
+            'album': {'name': f'{artist} album', 'artists': [{'name': artist}]},
+            'artists': [{'name': artist}],
+        }
+
+    def search(self, query):
+        fields = dict(part.split(':', 1) for part in query.split(' ') if ':' in part)
+        track = self.make_track(fields.get('track', query), fields.get('artist', ''))
+        return {'tracks': {'items': [track]}}
+
+    def page(self, path, items, params):
+        offset = int(params.get('offset', 0))
+        limit = min(int(params.get('limit', 20)), self.page_limit)
+        following = offset + limit
+        return {
+            'items': items[offset:following],
+            'total': len(items),
+            'next': f'{self.url}/v1/{path}?offset={following}&limit={limit}' if following < len(items) else None,
+        }
+
+    def playlist_items(self):
+        return [{'id': pid, 'name': p['name'], 'snapshot_id': p['snapshot_id'],
+                 'tracks': {'total': len(p['tracks'])}} for pid, p in self.playlists.items()]
+
+    def create_playlist(self, name, tracks=()):
+        with self._lock:
+            playlist_id = f'playlist{len(self.playlists)}'
+            self.playlists[playlist_id] = {'name': name, 'tracks': list(tracks), 'snapshot_id': 'snapshot0'}
+        return playlist_id
+
+    def add_tracks(self, playlist_id, uris):
+        with self._lock:
+            playlist = self.playlists.setdefault(playlist_id, {'name': playlist_id, 'tracks': [], 'snapshot_id': ''})
+            playlist['tracks'].extend(
+                {'id': uri.rsplit(':', 1)[-1], 'name': uri, 'uri': uri, 'duration_ms': 200000,
+                 'album': {'name': '', 'artists': [{'name': ''}]}, 'artists': [{'name': ''}]}
+                for uri in uris)
+            playlist['snapshot_id'] = f'snapshot{len(playlist["tracks"])}'
+            return playlist['snapshot_id']
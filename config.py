@@ -3,17 +3,95 @@ import os
 from os import environ
 from dotenv import find_dotenv, load_dotenv
 
+# .env is loaded once, here, for run.py && manager.py
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
 if os.path.exists(dotenv_path):
     load_dotenv(dotenv_path)
 
 
+def engine_options(uri=None):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS from the DB_* environment, only the options
+    that are set, the engine defaults stand for the others.
+    """
+    options = {'pool_pre_ping': environ.get('DB_POOL_PRE_PING', '1') == '1'}
+    for name, option in (('DB_POOL_SIZE', 'pool_size'), ('DB_MAX_OVERFLOW', 'max_overflow'),
+                         ('DB_POOL_TIMEOUT', 'pool_timeout'), ('DB_POOL_RECYCLE', 'pool_recycle')):
+        if environ.get(name):
+            options[option] = int(environ[name])
+    if environ.get('DB_STATEMENT_TIMEOUT') and (uri or '').startswith('postgres'):
+        # milliseconds, set per connection by postgres
+        options['connect_args'] = {'options': f"-c statement_timeout={environ['DB_STATEMENT_TIMEOUT']}"}
+    return options
+
+
+def replica_binds():
+    """SQLALCHEMY_BINDS with the read replica, when REPLICA_DATABASE_URI is set."""
+    uri = environ.get('REPLICA_DATABASE_URI')
+    return {'replica': uri} if uri else {}
+
+
 class Config:
     """Base config."""
     DEBUG = False
     TESTING = False
     SECRET_KEY = os.getenv('SECRET_KEY')
+    # previous SECRET_KEYs, comma separated, still accepted while rotating refresh tokens
+    SECRET_KEY_FALLBACKS = [key for key in environ.get('SECRET_KEY_FALLBACKS', '').split(',') if key]
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Password hashing: pbkdf2 || scrypt || argon2 (requires argon2-cffi),
+    # PASSWORD_HASH_WORKERS > 0 hashes on a process pool of that size
+    PASSWORD_HASHER = environ.get('PASSWORD_HASHER', 'pbkdf2')
+    PASSWORD_PBKDF2_ITERATIONS = int(environ.get('PASSWORD_PBKDF2_ITERATIONS', 260000))
+    PASSWORD_SCRYPT_N = int(environ.get('PASSWORD_SCRYPT_N', 2 ** 15))
+    PASSWORD_SCRYPT_R = int(environ.get('PASSWORD_SCRYPT_R', 8))
+    PASSWORD_SCRYPT_P = int(environ.get('PASSWORD_SCRYPT_P', 1))
+    PASSWORD_ARGON2_TIME_COST = int(environ.get('PASSWORD_ARGON2_TIME_COST', 3))
+    PASSWORD_ARGON2_MEMORY_COST = int(environ.get('PASSWORD_ARGON2_MEMORY_COST', 65536))
+    PASSWORD_ARGON2_PARALLELISM = int(environ.get('PASSWORD_ARGON2_PARALLELISM', 4))
+    PASSWORD_HASH_WORKERS = int(environ.get('PASSWORD_HASH_WORKERS', 0))
+    # Spotify search resolution cache: memory || sql
+    TRACK_CACHE_BACKEND = environ.get('TRACK_CACHE_BACKEND', 'memory')
+    TRACK_CACHE_SIZE = int(environ.get('TRACK_CACHE_SIZE', 10000))
+    TRACK_CACHE_TTL = int(environ.get('TRACK_CACHE_TTL', 7 * 24 * 3600))
+    TRACK_CACHE_MISS_TTL = int(environ.get('TRACK_CACHE_MISS_TTL', 6 * 3600))
+    # Flask-Admin panel on /admin, API-only workers may turn it off
+    ADMIN_ENABLED = environ.get('ADMIN_ENABLED', '1') == '1'
+    # Prometheus metrics on /metrics, scraped with "Authorization: Bearer <METRICS_TOKEN>" when set
+    METRICS_ENABLED = environ.get('METRICS_ENABLED', '0') == '1'
+    METRICS_TOKEN = environ.get('METRICS_TOKEN')
+    # Server-Timing response headers
+    SERVER_TIMING = environ.get('SERVER_TIMING', '0') == '1'
+    # Spotify calls of the client views && transfer jobs on the asyncio client (httpx)
+    SPOTIFY_ASYNC_CLIENT = environ.get('SPOTIFY_ASYNC_CLIENT', '0') == '1'
+    # Client routes encode json with orjson, when installed
+    FAST_JSON = environ.get('FAST_JSON', '1') == '1'
+    # Authenticated users cached across requests (entries, seconds)
+    IDENTITY_CACHE_SIZE = int(environ.get('IDENTITY_CACHE_SIZE', 10000))
+    IDENTITY_CACHE_TTL = int(environ.get('IDENTITY_CACHE_TTL', 30))
+    # Validated spotify tokens && headers by user (entries, seconds a key change
+    # made by another worker can go unseen)
+    SPOTIFY_CLIENT_CACHE_SIZE = int(environ.get('SPOTIFY_CLIENT_CACHE_SIZE', 10000))
+    SPOTIFY_CLIENT_CACHE_TTL = int(environ.get('SPOTIFY_CLIENT_CACHE_TTL', 300))
+    # Spotify read responses kept for ETag revalidation (entries)
+    RESPONSE_CACHE_SIZE = int(environ.get('RESPONSE_CACHE_SIZE', 2048))
+    # Transfer jobs: memory (in-process workers) || database (manager.py transfer_worker)
+    TRANSFER_QUEUE = environ.get('TRANSFER_QUEUE', 'memory')
+    TRANSFER_WORKERS = int(environ.get('TRANSFER_WORKERS', 2))
+    # Jobs whose progress wasn't saved for TRANSFER_JOB_TIMEOUT seconds are requeued
+    # (failed after TRANSFER_JOB_ATTEMPTS runs), checked every TRANSFER_REAPER_INTERVAL seconds
+    TRANSFER_JOB_TIMEOUT = int(environ.get('TRANSFER_JOB_TIMEOUT', 900))
+    TRANSFER_JOB_ATTEMPTS = int(environ.get('TRANSFER_JOB_ATTEMPTS', 3))
+    TRANSFER_REAPER_INTERVAL = int(environ.get('TRANSFER_REAPER_INTERVAL', 60))
+    # Outbound mail queue: worker threads, messages per SMTP connection, retries
+    MAIL_WORKERS = int(environ.get('MAIL_WORKERS', 1))
+    MAIL_BATCH_SIZE = int(environ.get('MAIL_BATCH_SIZE', 20))
+    MAIL_RETRIES = int(environ.get('MAIL_RETRIES', 3))
+    MAIL_RETRY_BACKOFF = float(environ.get('MAIL_RETRY_BACKOFF', 2.0))
+    # Background spotify token refresh: seconds between runs (0 disables),
+    # users count as active for TOKEN_REFRESHER_ACTIVE seconds after a request
+    TOKEN_REFRESHER_INTERVAL = int(environ.get('TOKEN_REFRESHER_INTERVAL', 60))
+    TOKEN_REFRESHER_ACTIVE = int(environ.get('TOKEN_REFRESHER_ACTIVE', 3600))
 
 
 class DevelopmentConfig(Config):
@@ -22,6 +100,8 @@ class DevelopmentConfig(Config):
     DEBUG = True
     TESTING = True
     SQLALCHEMY_DATABASE_URI = environ.get('DEV_DATABASE_URI')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_BINDS = replica_binds()
     JWT_ACCESS_LIFESPAN = {'days': 1}
     JWT_REFRESH_LIFESPAN = {'days': 30}
     MAIL_SERVER = environ.get("MAIL_SERVER")
@@ -36,6 +116,8 @@ class ProductionConfig(Config):
     """Config for profuction."""
     ENV = 'production'
     SQLALCHEMY_DATABASE_URI = environ.get('PROD_DATABASE_URI')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_BINDS = replica_binds()
     JWT_ACCESS_LIFESPAN = {'hours': 24}
     JWT_REFRESH_LIFESPAN = {'days': 30}
     MAIL_SERVER = environ.get("MAIL_SERVER")
@@ -6,16 +6,14 @@ import os
 from config import config
 from rythmize import create_app, db
 from rythmize.models.user import User 
-from rythmize.models.keys import YoutubeJsonWebToken, SpotifyJsonWebToken
+from rythmize.models.keys import YoutubeJsonWebToken, SpotifyJsonWebToken, rotate_refresh_tokens
+from rythmize.models.jobs import TransferJob
+from rythmize.tasks import (claim_transfer_job, mail_outbox, recover_stale_transfer_jobs,
+                            run_transfer_job)
 from flask_script import Manager, Shell
 from flask_migrate import Migrate, MigrateCommand
-from dotenv import find_dotenv, load_dotenv
 
 
-dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
-if os.path.exists(dotenv_path):
-    load_dotenv(dotenv_path)
-
 env_object = os.getenv('CONFIG_ENV')
 if  env_object not in config.keys():
     raise Exception("CONFIG_ENV can be either Production or Development).")
@@ -26,12 +24,63 @@ migrate = Migrate(app, db)
 
 # to use in shell
 def make_shell_context():
-    return dict(app=app, db=db, User=User,
+    return dict(app=app, db=db, User=User, TransferJob=TransferJob,
                 youtube=YoutubeJsonWebToken, Spotify=SpotifyJsonWebToken)
 
 manager.add_command('shell', Shell(make_context=make_shell_context))
 manager.add_command('db', MigrateCommand)
 
 
+@manager.option('-i', '--interval', dest='interval', type=float, default=2.0,
+                help='seconds to wait when no job is queued')
+def transfer_worker(interval):
+    """Runs queued transfer jobs (use with TRANSFER_QUEUE=database)."""
+    import time
+    if app.config.get('TRANSFER_QUEUE') != 'database':
+        # the web processes run the jobs themselves, nothing to poll
+        print('TRANSFER_QUEUE is not database, transfer_worker has nothing to do.')
+        return
+    while True:
+        job_id = claim_transfer_job()
+        if job_id is None:
+            recover_stale_transfer_jobs()
+            db.session.remove()
+            time.sleep(interval)
+            continue
+        run_transfer_job(job_id, claimed=True)
+        db.session.remove()
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=500,
+                help='rows re-encrypted per commit')
+def rotate_keys(batch_size):
+    """Re-encrypts refresh tokens with SECRET_KEY (old keys in SECRET_KEY_FALLBACKS)."""
+    print(f'{rotate_refresh_tokens(batch_size)} refresh tokens rotated.')
+
+
+@manager.command
+def replay_mail():
+    """Sends the emails saved after failed deliveries again."""
+    mail_outbox.workers = 0     # send from this process, before it exits
+    count = mail_outbox.replay_failed()
+    mail_outbox.run_pending()
+    print(f'{count} emails replayed.')
+
+
+@manager.command
+def normalize_emails():
+    """Lowercases stored emails, run before migrating to the unique email index."""
+    from sqlalchemy import func
+    duplicates = db.session.query(func.lower(User.email)).group_by(func.lower(User.email))\
+        .having(func.count(User.id) > 1).all()
+    if duplicates:
+        print('Resolve duplicate emails first: ' + ', '.join(email for email, in duplicates))
+        return
+    updated = User.query.filter(User.email != func.lower(User.email))\
+        .update({User.email: func.lower(User.email)}, synchronize_session=False)
+    db.session.commit()
+    print(f'{updated} emails normalized.')
+
+
 if __name__ == '__main__':
     manager.run()
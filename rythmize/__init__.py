@@ -6,10 +6,14 @@ import os
 
 from flask import Flask
 
-from .admin import admin_settings
 from .api.v1.views import api_views
-from .extensions import cors, db, guard, ma, mail
-from .models.user import User
+from .clients.registry import client_registry
+from .clients.resolution import track_cache
+from .clients.response_cache import response_cache
+from .extensions import cors, db, guard, hasher, ma, mail
+from .metrics import metrics
+from .models.user import User, identity_cache
+from .tasks import mail_outbox, token_refresher, transfer_queue, transfer_reaper
 
 
 def create_app(config_env):
@@ -18,14 +22,26 @@ def create_app(config_env):
     app.config.from_object(config_env)
     # Initialize extentions
     db.init_app(app)            # Database
+    metrics.init_app(app)       # Latency, sql && spotify call metrics on /metrics
     ma.init_app(app)            # Serilizer && Deserializer extension
     guard.init_app(app, User)   # Flask-praetorian
+    identity_cache.init_app(app)  # Authenticated users, across requests
+    client_registry.init_app(app)  # Validated spotify tokens by user
     cors.init_app(app)          # Flask-cors
     mail.init_app(app)          # Flask-Mail
-    # setup admin panel
-    admin_settings.init_app(app)
-    admin_settings.name = 'rythmize-panel'
-    admin_settings.template_mode = 'bootstrap3'
+    mail_outbox.init_app(app)   # Outbound mail queue
+    hasher.init_app(app)        # Password hashing scheme && costs
+    track_cache.init_app(app)   # Spotify search resolution cache
+    response_cache.init_app(app)  # Spotify read responses, revalidated by ETag
+    transfer_queue.init_app(app)  # Background transfer jobs
+    token_refresher.init_app(app)  # Refreshes spotify tokens before they expire
+    transfer_reaper.init_app(app)  # Recovers transfer jobs of processes that died
+    if app.config.get('ADMIN_ENABLED', True):
+        # setup admin panel, flask-admin is only imported when enabled
+        from .admin import admin_settings
+        admin_settings.init_app(app)
+        admin_settings.name = 'rythmize-panel'
+        admin_settings.template_mode = 'bootstrap3'
     # register routes
     app.register_blueprint(api_views)
 
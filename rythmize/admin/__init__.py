@@ -7,7 +7,7 @@ from flask_admin.contrib.sqla import ModelView
 
 from ..extensions import db
 from ..models.keys import SpotifyJsonWebToken, YoutubeJsonWebToken
-from ..models.user import User
+from ..models.user import User, identity_cache
 
 
 class CustomAdmin(ModelView):
@@ -22,6 +22,12 @@ class CustomAdmin(ModelView):
             #user.create_link_tables()
         return user
 
+    def after_model_change(self, form, user, is_created):
+        identity_cache.invalidate(user.id)
+
+    def after_model_delete(self, user):
+        identity_cache.invalidate(user.id)
+
 admin_settings = Admin()
 
 # Add administrative views
@@ -5,16 +5,19 @@ import flask_praetorian
 from flask import jsonify, request, redirect
 from rythmize.api.v1.views import api_views
 
-from .....clients.spotify import SpotifyClient
-from .....extensions import db_manager
+from .....extensions import db_manager, use_replica
 from .....models.user import User
 
+# the spotify client (&& requests) is imported by the views on first use,
+# keeping it off the worker boot
+
 
 @api_views.route('auth/connect/spotify/callback/')
 def authenticate_callback():
+    from .....clients.spotify import SpotifyClient
     # get params
     user_id = request.args.get('state')
-    user = User.query.get(user_id)
+    user = User.identify(user_id)
     if 'error' not in request.args.keys():
         code = request.args.get('code')
         sclient = SpotifyClient(code, user)
@@ -26,10 +29,13 @@ def authenticate_callback():
 
 @api_views.route('auth/connect/spotify/status', methods=["GET"])
 @flask_praetorian.auth_required
+@use_replica
 def spotify_status():
-    user_id = flask_praetorian.current_user().id
-    user = User.query.get(user_id)
-    sclient = SpotifyClient(None, user)
+    from .....clients.spotify import SpotifyClient
+    # registry clients skip loading the user && its keys
+    sclient = SpotifyClient.for_user(flask_praetorian.current_user_id())
+    if sclient is None:
+        return jsonify("user not authorized"), 401
     if sclient.handle_auth():
         # if user is authenticated
         return jsonify('User connected'), 200
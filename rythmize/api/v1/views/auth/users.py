@@ -3,6 +3,7 @@ import flask_praetorian
 from flask import jsonify, make_response, request
 from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
 from marshmallow import ValidationError
+from sqlalchemy.exc import IntegrityError
 from rythmize.api.v1.views import api_views
 
 from .....extensions import (confirm_email_by_link, db_manager, guard, mail,
@@ -28,25 +29,26 @@ def user_register():
     except ValidationError as errors:
         return jsonify(errors.messages), 401
 
-    e = load_data["email"]
-    u = load_data["username"]
-    if not User.query.filter_by(email=e).one_or_none() and\
-            not User.query.filter_by(username=u).one_or_none():
-        # Initiate User object, Validate data
-        user = User(**load_data)
-        # and create tables then link them
-        youtube_table = YoutubeJsonWebToken()
-        spotify_table = SpotifyJsonWebToken()
-        user.spotify_keys = spotify_table
-        user.youtube_keys = youtube_table
-        db_manager.add(user)
-        db_manager.add(youtube_table)
-        db_manager.add(spotify_table)
+    # Initiate User object, Validate data
+    user = User(**load_data)
+    # and create tables then link them
+    youtube_table = YoutubeJsonWebToken()
+    spotify_table = SpotifyJsonWebToken()
+    user.spotify_keys = spotify_table
+    user.youtube_keys = youtube_table
+    db_manager.add(user)
+    db_manager.add(youtube_table)
+    db_manager.add(spotify_table)
+    email = user.email  # read before commit expires the instance
+    try:
+        # unique constraints on username && email reject duplicates
         db_manager.save()
-        # Send email confirmation
-        send_email_verification(user.email)
-        return jsonify("Your account has been created!"), 200
-    return jsonify("username or email already registred"), 401
+    except IntegrityError:
+        db_manager.rollback()
+        return jsonify("username or email already registred"), 401
+    # Send email confirmation
+    send_email_verification(email)
+    return jsonify("Your account has been created!"), 200
 
 
 @api_views.route("auth/user/confirm_email/<token>", methods=["GET"])
@@ -58,7 +60,7 @@ def email_confirmation(token):
     """
     email = confirm_email_by_link(token)
     if email:
-        user = User.query.filter_by(email=email).first_or_404()  # get user
+        user = User.query.filter_by(email=email.lower()).first_or_404()  # get user
         if not user.email_confirmed:
             # if email not confirmed then confirm it.
             user.email_confirmed = True
@@ -83,6 +85,10 @@ def user_login():
     user = User.query.filter_by(username=username).one_or_none()
     if user and user.check_password(password):
         # check if user exists and valid password
+        if user.password_outdated:
+            # rehash with the current scheme && costs while we know the password
+            user.password = password
+            db_manager.save()
         response = {
             'access_token': guard.encode_jwt_token(user),
             'verified': user.email_confirmed
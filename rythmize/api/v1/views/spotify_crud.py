@@ -1,51 +1,164 @@
 """clients auth routes."""
+import json
+
 import flask_praetorian
-from flask import jsonify, request
+from flask import Response, current_app, jsonify, request, stream_with_context
 from rythmize.api.v1.views import api_views
 
-from ....clients.spotify import SpotifyClient
-from ....extensions import db_manager
-from ....models.user import User
+from ....extensions import db_manager, use_replica
+from ....models.jobs import TransferJob
+from ....models.sync import PlaylistSync
+from ....tasks import enqueue_transfer
+
+try:
+    import orjson
+except ImportError:     # FAST_JSON falls back to jsonify
+    orjson = None
+
+# the spotify client (&& requests) is imported by the views on first use,
+# keeping it off the worker boot
 
 
 @api_views.route('clients/spotify/playlists/', methods=["GET"])
 @flask_praetorian.auth_required
 def get_user_playlists():
-    user_id = flask_praetorian.current_user().id  # extract user id from jwt token
-    user = User.query.get(user_id)
-    sclient = SpotifyClient(None, user)
-    if sclient.handle_auth():
+    from ....clients.spotify import call_spotify
+    # user && keys are only loaded when the registry has no valid token
+    authenticated, playlists = call_spotify(flask_praetorian.current_user_id(), 'get_user_playlists')
+    if authenticated:
         # if user authenticated
-        return jsonify(sclient.get_user_playlists()), 200
+        return json_response(playlists)
     return jsonify("user not authorized"), 401
 
 
 @api_views.route('clients/spotify/playlists/<playlist_id>/tracks', methods=["GET"])
 @flask_praetorian.auth_required
 def get_playlist_tracks(playlist_id):
-    """Get playlist tracks refrenced by playlist_id."""
-    user_id = flask_praetorian.current_user().id
-    user = User.query.get(user_id)
-    sclient = SpotifyClient(None, user)
-    if sclient.handle_auth():
-        # if user authenticated
-        return jsonify(sclient.get_playlist_tracks(playlist_id)), 200
+    """
+    Get playlist tracks refrenced by playlist_id.
+    With ?stream=1 || true (or Accept: application/x-ndjson) tracks are streamed
+    as newline delimited json, one track per line, page by page.
+    """
+    from ....clients.spotify import SpotifyClient, call_spotify
+    user_id = flask_praetorian.current_user_id()
+    if request.args.get('stream', '').lower() in ('1', 'true') or \
+            request.accept_mimetypes.best == 'application/x-ndjson':
+        sclient = SpotifyClient.for_user(user_id)
+        if sclient is None or not sclient.handle_auth():
+            return jsonify("user not authorized"), 401
+        tracks = sclient.iter_playlist_tracks(playlist_id)
+        if tracks is None:
+            return jsonify("playlist not found"), 404
+        return Response(stream_with_context(stream_ndjson(tracks)),
+                        mimetype='application/x-ndjson')
+    authenticated, tracks = call_spotify(user_id, 'get_playlist_tracks', playlist_id)
+    if authenticated:
+        # if user authenticated, tracks are serialized here only
+        return json_response(tracks and [track.to_json() for track in tracks])
     return jsonify("user not authorized"), 401
 
 
+def json_response(data, status=200):
+    """
+    jsonify, encoded with orjson when FAST_JSON is set && orjson installed.
+    Returns:
+        (Response, status)
+    """
+    if orjson is None or not current_app.config.get('FAST_JSON'):
+        return jsonify(data), status
+    option = orjson.OPT_APPEND_NEWLINE
+    if current_app.config.get('JSON_SORT_KEYS'):
+        option |= orjson.OPT_SORT_KEYS
+    return Response(orjson.dumps(data, option=option), mimetype='application/json'), status
+
+
+def stream_ndjson(items):
+    """Serializes tracks as newline delimited json."""
+    from ....clients.spotify import SpotifyClientError
+    try:
+        for item in items:
+            yield json.dumps(item.to_json()) + '\n'
+    except SpotifyClientError as error:
+        # headers are already sent, report the failure in-band
+        yield json.dumps({'error': str(error)}) + '\n'
+
+
 @api_views.route('clients/spotify/playlist/transfer', methods=["POST"])
 @flask_praetorian.auth_required
 def spotify_transfer():
-    """adds songs to a playlist."""
-    user_id = flask_praetorian.current_user().id
-    user = User.query.get(user_id)
+    """
+    Queues a transfer job that adds songs to a playlist.
+    Returns:
+        (202, job) or (401, error) or (400)
+    """
+    from ....clients.spotify import SpotifyClient
+    user_id = flask_praetorian.current_user_id()
     # Extract from body
     req = request.get_json(force=True)
     playlist_name = req.get('playlist', None)
     songs = req.get('tracks', None)
     if playlist_name and songs and type(songs) == list:
-        sclient = SpotifyClient(None, user)
-        if sclient.handle_auth():
-            return jsonify(sclient.perform_transfer_tracks(playlist_name, songs)), 200
+        sclient = SpotifyClient.for_user(user_id)
+        if sclient is not None and sclient.handle_auth():
+            job = TransferJob(user_id=user_id, playlist=playlist_name)
+            job.tracks = songs
+            db_manager.add(job)
+            db_manager.save()
+            enqueue_transfer(job)
+            return jsonify(job.to_dict()), 202
         return jsonify("user not authorized"), 401
     return {}, 400
+
+
+@api_views.route('clients/spotify/playlist/sync', methods=["POST"])
+@flask_praetorian.auth_required
+def spotify_sync():
+    """
+    Syncs a source playlist into a spotify playlist: only songs not synced
+    by an earlier call are transferred, by a queued job.
+    Body: {source, playlist, tracks}
+    Returns:
+        (202, job) or (200, sync) when there's nothing new
+        or (409, job) while the previous sync runs or (401, error) or (400)
+    """
+    from ....clients.spotify import SpotifyClient
+    user_id = flask_praetorian.current_user_id()
+    req = request.get_json(force=True)
+    source, playlist_name = req.get('source', None), req.get('playlist', None)
+    songs = req.get('tracks', None)
+    if not (source and playlist_name and type(songs) == list):
+        return {}, 400
+    sclient = SpotifyClient.for_user(user_id)
+    if sclient is None or not sclient.handle_auth():
+        return jsonify("user not authorized"), 401
+    sync = PlaylistSync.get_or_create(user_id, source, playlist_name)
+    running = TransferJob.query.filter(TransferJob.sync_id == sync.id,
+                                       TransferJob.status.in_(('queued', 'running'))).first()
+    if running:
+        return jsonify(running.to_dict()), 409
+    songs = sync.new_songs(songs, SpotifyClient.song_key)
+    if not songs:
+        # nothing new, the destination isn't touched
+        return jsonify(dict(sync.to_dict(), status='unchanged')), 200
+    job = TransferJob(user_id=user_id, playlist=playlist_name, sync_id=sync.id)
+    job.tracks = songs
+    db_manager.add(job)
+    db_manager.save()
+    enqueue_transfer(job)
+    return jsonify(job.to_dict()), 202
+
+
+@api_views.route('clients/spotify/playlist/transfer/<job_id>', methods=["GET"])
+@flask_praetorian.auth_required
+@use_replica
+def spotify_transfer_status(job_id):
+    """
+    Reports the progress of a transfer job.
+    Returns:
+        (200, job) or (404, error)
+    """
+    user_id = flask_praetorian.current_user_id()
+    job = TransferJob.query.filter_by(id=job_id, user_id=user_id).one_or_none()
+    if job:
+        return jsonify(job.to_dict()), 200
+    return jsonify("job not found"), 404
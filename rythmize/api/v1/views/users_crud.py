@@ -5,19 +5,20 @@ User  CRUD views
 import flask_praetorian
 from flask import jsonify, request
 from rythmize.api.v1.views import api_views
-from ....models.user import User
+
+from ....extensions import use_replica
 
 
 @api_views.route('auth/user/current', methods=['GET'])
 @flask_praetorian.auth_required
+@use_replica
 def user_details():
     """
     Gets user details like username email
     Returns:
         200, details or 401
     """
-    user_id = flask_praetorian.current_user().id
-    if user := User.query.get(user_id):
+    if user := flask_praetorian.current_user():
         details = {
             "username": user.username,
             "email": user.email
@@ -0,0 +1,134 @@
+"""
+Track matching module
+scores spotify search candidates against a requested song on title,
+artist && duration, the best candidate comes with a confidence in [0, 1].
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from .resolution import normalize
+
+# (feat. x), [live], " - remastered 2011"
+TITLE_NOISE = re.compile(r'\s*[\(\[][^\)\]]*[\)\]]|\s+-\s+.*$')
+# versions nobody asks for without saying so
+VERSION_WORDS = frozenset(('live', 'remix', 'karaoke', 'instrumental', 'acoustic', 'cover',
+                           'demo', 'tribute', 'slowed', 'sped', 'reverb'))
+
+Features = namedtuple('Features', 'grams tokens')
+Query = namedtuple('Query', 'title artist versions duration_ms')
+Candidate = namedtuple('Candidate', 'title artists versions duration_ms')
+
+
+def clean_title(title):
+    """Title without bracketed || dash separated suffixes, normalized."""
+    return normalize(TITLE_NOISE.sub('', title or '')) or normalize(title)
+
+
+def features(text):
+    """Trigrams && tokens of a normalized text."""
+    padded = f'  {text} '
+    return Features(frozenset(padded[i:i + 3] for i in range(len(padded) - 2)),
+                    frozenset(text.split()))
+
+
+def dice(first, second):
+    return 2 * len(first & second) / (len(first) + len(second)) if first and second else 0.0
+
+
+def similarity(first, second):
+    """Trigram similarity, token similarity when words only moved around."""
+    return max(dice(first.grams, second.grams), dice(first.tokens, second.tokens))
+
+
+def milliseconds(value):
+    """A duration as an int, || None when missing || not a number (songs come from clients)."""
+    if value is None:
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def versions(title):
+    return VERSION_WORDS.intersection(normalize(title).split())
+
+
+@lru_cache(maxsize=65536)
+def title_features(title):
+    """(features of the cleaned title, version words), per distinct title."""
+    return features(clean_title(title)), versions(title)
+
+
+@lru_cache(maxsize=65536)
+def name_features(name):
+    """Features of an artist name, names come back in many searches."""
+    return features(normalize(name))
+
+
+class TrackMatcher(object):
+    """
+    Scores candidates with weights for title, artist && duration, the
+    duration weight is left out when the song has no duration.
+    """
+
+    def __init__(self, title_weight=0.55, artist_weight=0.35, duration_weight=0.1,
+                 duration_tolerance=30000, version_penalty=0.8):
+        self.title_weight = title_weight
+        self.artist_weight = artist_weight
+        self.duration_weight = duration_weight
+        self.duration_tolerance = duration_tolerance    # ms off at which duration scores 0
+        self.version_penalty = version_penalty
+
+    @staticmethod
+    def query(song):
+        """Features of a requested {track, artist[, duration_ms]} song."""
+        title, song_versions = title_features(song.get('track') or '')
+        return Query(title, name_features(song.get('artist') or ''), song_versions,
+                     milliseconds(song.get('duration_ms')))
+
+    @staticmethod
+    def candidate(track):
+        """Features of a spotify track object."""
+        names = [artist['name'] for artist in track.get('artists')
+                 or track.get('album', {}).get('artists', [])]
+        artists = [name_features(name) for name in names]
+        if len(names) > 1:
+            # "a & b" asked for a track by a and b
+            artists.append(name_features(' '.join(names)))
+        title, track_versions = title_features(track.get('name') or '')
+        return Candidate(title, artists, track_versions, milliseconds(track.get('duration_ms')))
+
+    def score(self, query, candidate):
+        """Returns the confidence that candidate is the song of query, in [0, 1]."""
+        title = similarity(query.title, candidate.title)
+        artist = max((similarity(query.artist, artist) for artist in candidate.artists), default=0.0)
+        score, weight = self.title_weight * title + self.artist_weight * artist, \
+            self.title_weight + self.artist_weight
+        if query.duration_ms and candidate.duration_ms:
+            off = abs(query.duration_ms - candidate.duration_ms)
+            score += self.duration_weight * max(0.0, 1 - off / self.duration_tolerance)
+            weight += self.duration_weight
+        score /= weight
+        if candidate.versions - query.versions:
+            score *= self.version_penalty
+        return score
+
+    def best(self, song, tracks):
+        """
+        Scores every track of a search against song.
+        Returns:
+            (best track || None, its score)
+        """
+        query = self.query(song)
+        best, best_score = None, 0.0
+        for track in tracks:
+            score = self.score(query, self.candidate(track))
+            if score > best_score:
+                best, best_score = track, score
+        return best, best_score
+
+
+# class instance
+track_matcher = TrackMatcher()
@@ -0,0 +1,60 @@
+"""
+Client registry module
+validated spotify tokens by user, so requests with a valid token build
+their client without reading, decrypting || refreshing keys.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from ..cache import LRUCache
+from ..metrics import metrics
+
+ClientAuth = namedtuple('ClientAuth', 'token expires headers')
+
+
+class ClientRegistry(object):
+    """
+    Bounded LRU of ClientAuth by user id, entries are dropped when the
+    keys of the user are written && after SPOTIFY_CLIENT_CACHE_TTL, which
+    bounds how long another worker's key change goes unseen.
+    """
+
+    def __init__(self):
+        self._cache = LRUCache()
+
+    def init_app(self, app):
+        self._cache = LRUCache(app.config.get('SPOTIFY_CLIENT_CACHE_SIZE', 10000),
+                               app.config.get('SPOTIFY_CLIENT_CACHE_TTL', 300))
+        metrics.register('spotify_clients', self.stats)
+
+    def get(self, user_id, refresh_window=0):
+        """
+        Returns:
+            ClientAuth of user_id || None, entries whose token expires
+            within refresh_window seconds are left to handle_auth
+        """
+        auth = self._cache.get(user_id)
+        if auth is None or auth.expires - timedelta(seconds=refresh_window) < datetime.now():
+            return None
+        return auth
+
+    def set(self, user_id, token, expires, headers):
+        """Stores && returns the ClientAuth of user_id."""
+        auth = ClientAuth(token, expires, headers)
+        self._cache.set(user_id, auth)
+        return auth
+
+    def invalidate(self, user_id):
+        self._cache.pop(user_id)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        lookups = self._cache.hits + self._cache.misses
+        return {'hits': self._cache.hits, 'misses': self._cache.misses, 'size': len(self._cache),
+                'hit_rate': self._cache.hits / lookups if lookups else 0.0}
+
+
+# class instance
+client_registry = ClientRegistry()
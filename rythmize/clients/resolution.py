@@ -0,0 +1,187 @@
+"""
+Track resolution cache module
+remembers which spotify uri a (track, artist) search resolved to.
+"""
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from ..cache import LRUCache
+from ..extensions import db
+from ..metrics import metrics
+from ..models.tracks import TrackResolution
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def normalize(text):
+    """Casefolds, strips accents and punctuation, collapses whitespace."""
+    text = text or ''
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = re.sub(r'[^\w\s]', ' ', text.casefold())
+    return ' '.join(text.split())
+
+
+class MemoryBackend(object):
+    """In-process LRU backend, entries expire after their ttl."""
+
+    def __init__(self, maxsize=10000):
+        self._cache = LRUCache(maxsize)
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            value = self._cache.get(key, _MISSING)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def set_many(self, values, ttl):
+        for key, uri in values.items():
+            self._cache.set(key, uri, ttl=ttl)
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class SQLBackend(object):
+    """Shared backend, stores resolutions in the track_resolution table."""
+
+    @staticmethod
+    def row_key(key):
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def get_many(self, keys):
+        row_keys = {self.row_key(key): key for key in keys}
+        if not row_keys:
+            return {}
+        rows = TrackResolution.query.filter(
+            TrackResolution.key.in_(list(row_keys)),
+            TrackResolution.expires_on > datetime.utcnow()).all()
+        return {row_keys[row.key]: row.uri for row in rows}
+
+    def set_many(self, values, ttl):
+        """
+        Upserts values on a connection of its own, the caller's session is
+        neither flushed nor committed. A failed write is logged && ignored,
+        the cache never fails a transfer.
+        """
+        if not values:
+            return
+        expires_on = datetime.utcnow() + timedelta(seconds=ttl)
+        rows = [{'row_key': self.row_key(key), 'uri': uri, 'expires_on': expires_on}
+                for key, uri in values.items()]
+        try:
+            if db.engine.dialect.name == 'postgresql':
+                self._upsert(rows)
+                return
+            for attempt in range(2):
+                try:
+                    self._write(rows)
+                    return
+                except IntegrityError:
+                    # inserted by another worker meanwhile, written as updates on the retry
+                    if attempt:
+                        raise
+        except SQLAlchemyError:
+            logger.warning('track resolution cache write failed', exc_info=True)
+
+    @staticmethod
+    def _upsert(rows):
+        from sqlalchemy.dialects.postgresql import insert
+
+        table = TrackResolution.__table__
+        statement = insert(table).values(key=bindparam('row_key'))
+        db.engine.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={'uri': statement.excluded.uri, 'expires_on': statement.excluded.expires_on}), rows)
+
+    def _write(self, rows):
+        table = TrackResolution.__table__
+        with db.engine.begin() as connection:
+            existing = self._existing(connection, [row['row_key'] for row in rows])
+            updates = [row for row in rows if row['row_key'] in existing]
+            inserts = [row for row in rows if row['row_key'] not in existing]
+            if updates:
+                connection.execute(table.update().where(table.c.key == bindparam('row_key')), updates)
+            if inserts:
+                connection.execute(table.insert().values(key=bindparam('row_key')), inserts)
+
+    @staticmethod
+    def _existing(connection, row_keys):
+        table = TrackResolution.__table__
+        return {row.key for row in connection.execute(select([table.c.key]).where(table.c.key.in_(row_keys)))}
+
+    def __len__(self):
+        return TrackResolution.query.count()
+
+
+class TrackResolutionCache(object):
+    """
+    Resolution cache in front of the spotify search, keyed by the
+    normalized (track, artist). Failed lookups (no result) are cached
+    with the shorter miss_ttl, errors are never cached.
+    """
+    backends = {'memory': MemoryBackend, 'sql': SQLBackend}
+
+    def __init__(self, backend=None, ttl=7 * 24 * 3600, miss_ttl=6 * 3600):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configures the backend from TRACK_CACHE_* settings."""
+        name = app.config.get('TRACK_CACHE_BACKEND', 'memory')
+        if name == 'memory':
+            self.backend = MemoryBackend(app.config.get('TRACK_CACHE_SIZE', 10000))
+        else:
+            self.backend = self.backends[name]()
+        self.ttl = app.config.get('TRACK_CACHE_TTL', self.ttl)
+        self.miss_ttl = app.config.get('TRACK_CACHE_MISS_TTL', self.miss_ttl)
+        metrics.register('track_cache', self.stats)
+
+    @staticmethod
+    def key(track, artist):
+        return f'{normalize(track)}|{normalize(artist)}'
+
+    def get_many(self, keys):
+        """
+        Looks up keys.
+        Returns:
+            {key: uri || None} for cached keys only.
+        """
+        found = self.backend.get_many(keys)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, values):
+        """Stores {key: uri || None}, None marks a search without result."""
+        found = {key: uri for key, uri in values.items() if uri}
+        self.backend.set_many(found, self.ttl)
+        self.backend.set_many({key: None for key in values if key not in found}, self.miss_ttl)
+
+    def stats(self):
+        """Returns hit/miss counters, used to size the cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / total if total else 0.0}
+
+
+# class instance
+track_cache = TrackResolutionCache()
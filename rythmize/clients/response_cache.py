@@ -0,0 +1,44 @@
+"""
+Response cache module
+per-user cache of spotify read responses, revalidated with their ETag.
+"""
+from ..cache import LRUCache
+from ..metrics import metrics
+
+
+class ResponseCache(object):
+    """
+    Caches parsed GET responses by (user, url, params) with their ETag,
+    the next request sends If-None-Match and a 304 reuses the parsed data.
+    Bounded to maxsize entries, least recently used evicted first.
+    """
+
+    def __init__(self, maxsize=2048):
+        self._cache = LRUCache(maxsize)
+
+    def init_app(self, app):
+        self._cache = LRUCache(app.config.get('RESPONSE_CACHE_SIZE', 2048))
+        metrics.register('response_cache', self.stats)
+
+    @staticmethod
+    def key(user_id, url, params=None):
+        return (user_id, url, tuple(sorted((params or {}).items())))
+
+    def get(self, key):
+        """Returns (etag, data) || None."""
+        return self._cache.get(key)
+
+    def set(self, key, etag, data):
+        self._cache.set(key, (etag, data))
+
+    def invalidate(self, user_id, *paths):
+        """Drops the user's entries whose url contains any of paths (every entry without paths)."""
+        self._cache.discard_where(
+            lambda key: key[0] == user_id and (not paths or any(path in key[1] for path in paths)))
+
+    def stats(self):
+        return {'hits': self._cache.hits, 'misses': self._cache.misses, 'size': len(self._cache)}
+
+
+# class instance
+response_cache = ResponseCache()
@@ -3,11 +3,85 @@ API clients module
 """
 import base64
 import json
+import re
+import threading
+import weakref
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, time, timedelta
+from functools import lru_cache
 from os import environ
+from time import sleep
 from urllib.parse import urlencode
 
-import requests
+from flask import current_app
+from requests import RequestException
+
+from ..models.playlists import PlaylistIndex
+from .matching import clean_title, track_matcher
+from .registry import client_registry
+from .resolution import track_cache
+from .response_cache import response_cache
+from .throttle import scheduler
+from .transport import transport
+
+
+_NOT_LOADED = object()
+_refresh_locks = weakref.WeakValueDictionary()    # dropped once no thread holds || waits on it
+_refresh_locks_lock = threading.Lock()
+active_users = {}   # user_id -> last authenticated request, read by the token refresher
+
+
+def refresh_lock(user_id):
+    """Returns the process-wide refresh lock of user_id."""
+    with _refresh_locks_lock:
+        lock = _refresh_locks.get(user_id)
+        if lock is None:
+            lock = _refresh_locks[user_id] = threading.Lock()
+        return lock
+
+
+@lru_cache(maxsize=8)
+def basic_credentials(client_id, client_secret):
+    """base64 of client_id:client_secret, encoded once per pair."""
+    return base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+
+
+class SpotifyClientError(Exception):
+    """Raised when a spotify response can't be used."""
+
+
+def format_duration(milliseconds):
+    """Formats a duration as H:MM min, as str(timedelta(...))[:4] + ' min' did."""
+    return _minutes_label(milliseconds // 60000)
+
+
+@lru_cache(maxsize=None)
+def _minutes_label(minutes):
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02d}'[:4] + ' min'
+
+
+class Track(namedtuple('Track', 'id title duration_ms album artist uri service',
+                       defaults=('spotify',))):
+    """
+    Playlist track as used inside the clients, a tuple without per-track
+    dicts. Serialized to the json shape of the api only by to_json().
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_spotify(cls, track):
+        """Builds a Track from a spotify track object."""
+        album = track['album']
+        return cls(track['id'], track['name'], track['duration_ms'], album['name'],
+                   album['artists'][0]['name'], track['uri'])
+
+    def to_json(self):
+        """Returns {id: {title, duration, album, artist, service, uri}}."""
+        return {self.id: {'title': self.title, 'duration': format_duration(self.duration_ms),
+                          'album': self.album, 'artist': self.artist,
+                          'service': self.service, 'uri': self.uri}}
 
 
 class SpotifyClientAuth(object):
@@ -16,6 +90,11 @@ class SpotifyClientAuth(object):
     redirect_uri = environ.get('CLIENT_REDIRECT_URI')
     tokenapi_endpoint = 'https://accounts.spotify.com/api/token'
     authorize_endpoint = 'https://accounts.spotify.com/authorize'
+    api_endpoint = 'https://api.spotify.com/v1'
+    http = transport    # shared pooled session
+    scheduler = scheduler   # rate budgets && 429 handling shared by every client
+    user_rate_limit = float(environ.get('SPOTIFY_USER_RATE', 20))    # calls per second per user
+    refresh_window = int(environ.get('SPOTIFY_REFRESH_WINDOW', 300))   # seconds before expiry
 
     def __init__(self, code, user_object):
         """
@@ -23,11 +102,54 @@ class SpotifyClientAuth(object):
         """
         self.__user = user_object
         self.user_id = self.__user.id
-        keys_object = self.__user.spotify_keys
-        self.token = keys_object.jwt_token
-        self.refresh_token = keys_object.refresh_token
-        self.expires = keys_object.expires_in
+        self.__keys = self.__user.spotify_keys
+        self.token = self.__keys.jwt_token
+        self.expires = self.__keys.expires_in
         self.code = code
+        self._refresh_token = _NOT_LOADED
+        self._auth = None   # ClientAuth of the current token, once validated
+
+    @classmethod
+    def for_user(cls, user_id):
+        """
+        Client of user_id, built from the client registry while the token
+        validated by an earlier request is fresh, the user && its keys are
+        then only loaded if needed.
+        Returns:
+            client || None when there's no such user
+        """
+        auth = client_registry.get(user_id, cls.refresh_window)
+        if auth is None:
+            from ..models.user import User
+            user = User.identify(user_id)
+            return cls(None, user) if user is not None else None
+        client = cls.__new__(cls)
+        client.__user = client.__keys = None
+        client.user_id, client.code = user_id, None
+        client.token, client.expires = auth.token, auth.expires
+        client._refresh_token = _NOT_LOADED
+        client._auth = auth
+        return client
+
+    @property
+    def keys(self):
+        """Spotify keys of the user, loaded on first use by registry clients."""
+        if self.__keys is None:
+            from ..models.user import User
+            self.__user = User.identify(self.user_id)
+            self.__keys = self.__user.spotify_keys
+        return self.__keys
+
+    @property
+    def refresh_token(self):
+        """Refresh token, decrypted on first use only."""
+        if self._refresh_token is _NOT_LOADED:
+            self._refresh_token = self.keys.refresh_token
+        return self._refresh_token
+
+    @refresh_token.setter
+    def refresh_token(self, value):
+        self._refresh_token = value
 
     def update_database(self):
         """updates user in database with new values."""
@@ -35,18 +157,29 @@ class SpotifyClientAuth(object):
         
         prepare_values = {
                 'jwt_token': self.token,
-                'refresh_token': self.refresh_token,
                 'expires_in': self.expires}
-        db_manager.update_key_table(self.user_id, **prepare_values)
+        if self._refresh_token is not _NOT_LOADED:
+            # never decrypt only to store the same value again
+            prepare_values['refresh_token'] = self._refresh_token
+        db_manager.update_key_table(self.__user or self.user_id, **prepare_values)
+
+    def register(self):
+        """Keeps the validated token && its headers for the next requests of the user."""
+        self._auth = client_registry.set(self.user_id, self.token, self.expires,
+                                         self.get_resource_header())
+
+    def send(self, method, url, operation, **kwargs):
+        """Sends a spotify call through the scheduler, re-sent while throttled."""
+        return self.scheduler.call(
+            lambda: self.http.request(method, url, operation=operation, **kwargs),
+            self.client_id, self.user_id, self.user_rate_limit, operation)
 
     def client_credentials(self):
         """Returns a base64 encoded string."""
         client_id = self.client_id
         client_secret = self.client_secret
         if client_secret is not None or client_id is not None:
-            client_creds = f"{client_id}:{client_secret}"
-            client_creds_b64 = base64.b64encode(client_creds.encode())
-            return client_creds_b64.decode()
+            return basic_credentials(client_id, client_secret)
         raise Exception("Missing client_id and client_secret")
 
     def get_token_headers(self):
@@ -77,7 +210,8 @@ class SpotifyClientAuth(object):
             'code': code,
             'redirect_uri': self.redirect_uri
         }
-        return requests.post(self.tokenapi_endpoint, data=data, headers=headers)
+        return self.send('POST', self.tokenapi_endpoint, data=data, headers=headers,
+                         operation='token_exchange')
     
     def refresh_access_token(self):
         """refresh an access token"""
@@ -86,47 +220,90 @@ class SpotifyClientAuth(object):
             'refresh_token': self.refresh_token
             }
         headers = {'Authorization': f'Basic {self.client_credentials()}'}
-        return requests.post(self.tokenapi_endpoint, data=data, headers=headers)
+        return self.send('POST', self.tokenapi_endpoint, data=data, headers=headers,
+                         operation='token_refresh')
+
+    def token_expiring(self, expires=None):
+        """True when the token expires within refresh_window seconds."""
+        expires = expires or self.expires
+        return expires - timedelta(seconds=self.refresh_window) < datetime.now()
+
+    def assign_token_values(self, response):
+        """
+        Assigns the values of a token response, works for getting an
+        access_token and refreshing a token.
+        Returns:
+            Boolean: True if response is valid
+        """
+        if response.status_code in range(200, 299):
+            data = response.json()
+            self.token = data['access_token']
+            self.expires = datetime.now() + timedelta(seconds=data['expires_in'])
+            if 'refresh_token' in data.keys():
+                # if refresh token provided in resonse then assigned to it's attr
+                self.refresh_token = data['refresh_token']
+            return True
+        return False
+
+    def refresh_token_once(self):
+        """
+        Single-flight refresh: one refresh per user at a time, in this
+        process (lock) and across workers (row lock on the keys table).
+        Whoever waited reuses the token refreshed meanwhile.
+        Returns:
+            Boolean: True if a fresh token is available
+        """
+        from ..extensions import db_manager
+
+        with refresh_lock(self.user_id):
+            keys = db_manager.lock_key_table(self.user_id)
+            if keys is not None and keys.jwt_token and keys.jwt_token != self.token \
+                    and keys.expires_in and not self.token_expiring(keys.expires_in):
+                # refreshed by another request or worker
+                self.token, self.expires = keys.jwt_token, keys.expires_in
+                db_manager.save()
+                return True
+            if self.refresh_token and self.assign_token_values(self.refresh_access_token()):
+                self.update_database()
+                return True
+            db_manager.rollback()
+            return False
 
     def handle_auth(self):
         """
         Handles authentication with spotify, checks for:
         - user token is valid, else reuest new token
         - user dont have token, then redirect user to authenticate.
+        Tokens are refreshed refresh_window seconds before they expire.
         Returns:
             Boolean: True if user is authenticated, else False
         """
-        def validate_and_assign_values(response):
-            """assigns values to variables."""
-            if response.status_code in range(200, 299):
-                data = response.json()
-                self.token = data['access_token']
-                self.expires = data['expires_in']
-                if 'refresh_token' in data.keys():
-                    # if refresh token provided in resonse then assigned to it's attr,
-                    # this function works for getting an access_token and refreshing token.
-                    self.refresh_token = data['refresh_token']
-                return True
-            return False
         # when code is not None then will get an access token
-        if self.code and validate_and_assign_values(self.get_access_token(self.code)):
+        if self.code and self.assign_token_values(self.get_access_token(self.code)):
             self.update_database()
+            self.register()
             return True
         if not self.code:
             # When code is None then will check: 
-            if self.token and self.refresh_token and self.expires:
+            if self.token and self.expires:
                 # if no token is present then return false. 
-                if self.expires < datetime.now():
-                    # if token is expired then request new one.
-                    response = self.refresh_access_token()
-                    if validate_and_assign_values(response):
-                        self.update_database()
-                        return True
-                return True
+                active_users[self.user_id] = datetime.now()
+                if not self.token_expiring():
+                    if self._auth is None:
+                        self.register()
+                    return True
+                # if token is about to expire then request new one,
+                if self.refresh_token_once():
+                    self.register()
+                    return True
+                # a failed early refresh still leaves a valid token.
+                return self.expires > datetime.now()
         return False
 
     def get_resource_header(self):
-        """Generates header."""
+        """Generates header, the registered one while the token is the same."""
+        if self._auth is not None and self._auth.token == self.token:
+            return dict(self._auth.headers)
         return {
             'Content-Type': 'application/json',
             "Authorization": f"Bearer {self.token}"
@@ -134,7 +311,8 @@ class SpotifyClientAuth(object):
 
     def get_user_id(self):
         headers = self.get_resource_header()
-        response = requests.get('https://api.spotify.com/v1/me/', headers=headers)
+        response = self.send('GET', f'{self.api_endpoint}/me/', headers=headers,
+                             operation='profile')
         if response.status_code in range(200, 299):
             # if valid response, return id
             return response.json()['id']
@@ -143,23 +321,92 @@ class SpotifyClientAuth(object):
 
 class SpotifyClientPlaylist(SpotifyClientAuth):
     """SpotifyClientPlaylist, Handles CRUD operations for playlist."""
-    default_params = {"offset": 0} # nedeed for requests with spotify api
+    playlists_page_limit = 50   # maximum page size allowed by spotify api
+    tracks_page_limit = 100
+    add_tracks_limit = 100      # maximum uris per add-tracks request
+    add_tracks_retries = int(environ.get('SPOTIFY_WRITE_RETRIES', 2))
+    add_tracks_backoff = float(environ.get('SPOTIFY_WRITE_BACKOFF', 0.5))
 
-    def get_user_playlists(self):
-        """Get current user playlists."""
-        endpoint = 'https://api.spotify.com/v1/me/playlists'
+    def get_page(self, endpoint, params=None):
+        """
+        Fetches one page of a spotify paging object, revalidating the
+        cached copy with If-None-Match when there is one.
+        Returns:
+            page json || None
+        """
+        key = response_cache.key(self.user_id, endpoint, params)
+        cached = response_cache.get(key)
         headers = self.get_resource_header()
-        response = requests.get(endpoint, headers=headers, params=self.default_params)
+        if cached:
+            headers['If-None-Match'] = cached[0]
+        response = self.send('GET', endpoint, headers=headers, params=params,
+                             operation='playlist_read')
+        if response.status_code == 304 and cached:
+            # not modified, reuse the parsed page
+            return cached[1]
         if response.status_code in range(200, 299):
-            # if valid request and valid json then go here.
-            response_data = []
-            for data in response.json()['items']:
-                # iterate over json response and add playlist
-                # id, name, nnumber of tracks, and service to a list.
-                response_data.append({data['id']:{'title': data['name'], 'tracks': data['tracks']['total'], 'service':'spotify'}})
-            return response_data
+            data = response.json()
+            if response.headers.get('ETag'):
+                response_cache.set(key, response.headers['ETag'], data)
+            return data
         return None
 
+    def paginate(self, endpoint, limit):
+        """
+        Follows the `next` links of a paging object.
+        Returns:
+            iterator over the items of every page || None if the first page failed.
+        """
+        first_page = self.get_page(endpoint, {'offset': 0, 'limit': limit})
+        if first_page is None:
+            return None
+        return self._iter_pages(first_page)
+
+    def _iter_pages(self, page):
+        """Yields items, the next page is prefetched while the current one is consumed."""
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            while page is not None:
+                following = None
+                if page.get('next'):
+                    following = executor.submit(self.get_page, page['next'])
+                yield from page['items']
+                if following is None:
+                    return
+                page = following.result()
+                if page is None:
+                    raise SpotifyClientError('Failed to fetch the next page.')
+
+    @staticmethod
+    def format_playlist(data):
+        """Formats a playlist object as {id: {title, tracks, service}}."""
+        return {data['id']: {'title': data['name'], 'tracks': data['tracks']['total'], 'service': 'spotify'}}
+
+    @staticmethod
+    def format_track(track):
+        """Formats a track object as a Track."""
+        return Track.from_spotify(track)
+
+    def iter_user_playlists(self):
+        """
+        Iterates over every playlist of the current user.
+        Returns:
+            iterator of {id: {title, tracks, service}} || None
+        """
+        items = self.paginate(f'{self.api_endpoint}/me/playlists', self.playlists_page_limit)
+        if items is None:
+            return None
+        return (self.format_playlist(data) for data in items)
+
+    def get_user_playlists(self):
+        """Get current user playlists."""
+        playlists = self.iter_user_playlists()
+        if playlists is None:
+            return None
+        try:
+            return list(playlists)
+        except SpotifyClientError:
+            return None
+
     def get_playlist_info(self):
         """Extracts playlist {title: id} from playlist data."""
         data = self.get_user_playlists() # gets data of playlist, from methode above.
@@ -169,132 +416,498 @@ class SpotifyClientPlaylist(SpotifyClientAuth):
             for playlist_id, playlist_data in elements.items():
                 result.append({playlist_data['title']:playlist_id})
         return result
-    
+
+    def refresh_playlist_index(self):
+        """
+        Syncs the local playlist index with spotify, rows are only written
+        for playlists whose snapshot_id changed.
+        Returns:
+            Boolean: True if the index is up to date
+        """
+        items = self.paginate(f'{self.api_endpoint}/me/playlists', self.playlists_page_limit)
+        if items is None:
+            return False
+        try:
+            PlaylistIndex.sync(self.user_id, list(items))
+        except SpotifyClientError:
+            return False
+        return True
+
+    def find_playlist(self, name, refresh=False):
+        """
+        Looks name up in the local playlist index, the index is refreshed
+        first when name isn't indexed (or refresh is set). Hits are checked
+        against spotify, an entry whose playlist was deleted || renamed
+        since it was indexed is dropped.
+        Returns:
+            playlist_id || None
+        """
+        playlist_id = None if refresh else PlaylistIndex.lookup(self.user_id, name)
+        if playlist_id is not None and \
+                self.index_entry_gone(name, *self.get_playlist_fields(playlist_id, 'name')):
+            PlaylistIndex.remove(self.user_id, playlist_id)
+            playlist_id = None
+        if playlist_id is None and self.refresh_playlist_index():
+            playlist_id = PlaylistIndex.lookup(self.user_id, name)
+        return playlist_id
+
+    @staticmethod
+    def index_entry_gone(name, status, data):
+        """
+        True when the indexed playlist is gone (404) || isn't called name
+        anymore, other failures keep the entry.
+        """
+        return status == 404 or (data is not None and data.get('name') != name)
+
+    def get_playlist_fields(self, playlist_id, fields):
+        """
+        Returns:
+            (status code, {fields} of the playlist || None on failure)
+        """
+        response = self.send('GET', f'{self.api_endpoint}/playlists/{playlist_id}',
+                             headers=self.get_resource_header(), params={'fields': fields},
+                             operation='playlist_read')
+        if response.status_code in range(200, 299):
+            return response.status_code, response.json()
+        return response.status_code, None
+
+    def get_playlist_snapshot(self, playlist_id):
+        """
+        Returns:
+            the current snapshot_id of the playlist || None when gone || on failure
+        """
+        _, data = self.get_playlist_fields(playlist_id, 'snapshot_id')
+        return data.get('snapshot_id') if data is not None else None
+
+    def iter_playlist_tracks(self, playlist_id=None):
+        """
+        Iterates over every track of the playlist, page by page.
+        Returns:
+            iterator of Track || None
+        """
+        endpoint = f'{self.api_endpoint}/playlists/{playlist_id}/tracks'
+        items = self.paginate(endpoint, self.tracks_page_limit)
+        if items is None:
+            return None
+        # removed or unavailable tracks come back as null
+        return (self.format_track(data['track']) for data in items if data.get('track'))
+
     def get_playlist_tracks(self, playlist_id=None):
         """
         Retrieves tracks of  playlist based on  playlist_id.
         Returns:
-                id:       Track id 
-                title:    Track name,   
-                duration: Track duration in minutes
-                album:    Associated album of track
-                artist:   The artist of track
-                service:  Spotify or Youtube
-                uri:      Track uri 
-        """
-        endpoint = f'https://api.spotify.com/v1/playlists/{playlist_id}/tracks'
-        headers = self.get_resource_header()
-        response = requests.get(endpoint, headers=headers, params=self.default_params)
-        if response.status_code in range(200, 299):
-            r = response.json()
-            response_data = []
-            for data in r['items']:
-                response_data.append(
-                    {data['track']['id']: {'title': data['track']['name'], 
-                    'duration': str(timedelta(milliseconds=data['track']['duration_ms']))[:4] + ' min',
-                    'album': data['track']['album']['name'],
-                    'artist': data['track']['album']['artists'][0]['name'],
-                    'service': 'spotify',
-                    'uri': data['track']['uri']
-                    }})
-            return response_data
-        return None
+            List of Track (id, title, duration_ms, album, artist, uri, service) || None
+        """
+        tracks = self.iter_playlist_tracks(playlist_id)
+        if tracks is None:
+            return None
+        try:
+            return list(tracks)
+        except SpotifyClientError:
+            return None
 
     def create_playlist(self, name, description=None, public=False):
         """Create A New Playlist"""
         spotify_id = self.get_user_id()
         # header and params.
-        endpoint = "https://api.spotify.com/v1/users/{}/playlists".format(spotify_id)
+        endpoint = "{}/users/{}/playlists".format(self.api_endpoint, spotify_id)
         headers = self.get_resource_header()
         request_body = json.dumps({"name": name, "description": description, "public": public})
         # acctual request to create playlist.
-        response = requests.post(endpoint, data=request_body, headers=headers)
+        response = self.send('POST', endpoint, data=request_body, headers=headers,
+                             operation='playlist_create')
+        response_cache.invalidate(self.user_id, '/me/playlists')
         if response.status_code in range(200, 299):
-            # if valid response, return playlist id.
-            return response.json()["id"]
+            # if valid response, index and return playlist id.
+            data = response.json()
+            PlaylistIndex.insert(self.user_id, data["id"], name, data.get("snapshot_id"))
+            return data["id"]
         return None
 
+    def add_tracks_to_playlist(self, playlist_id, uris, progress=None):
+        """
+        Adds uris to the playlist in chunks of add_tracks_limit, in order.
+        A failed chunk is retried before the next one is sent, so only
+        failed chunks are repeated and the playlist order is kept.
+        progress, if given, receives the added= count after every chunk.
+        Returns:
+            {snapshot_id: last snapshot_id || None,
+             chunks: [{index, size, status, attempts, snapshot_id}]}
+        """
+        endpoint = f"{self.api_endpoint}/playlists/{playlist_id}/tracks"
+        headers = self.get_resource_header()
+        snapshot_id, chunks = None, []
+        for index, start in enumerate(range(0, len(uris), self.add_tracks_limit)):
+            chunk = uris[start:start + self.add_tracks_limit]
+            request_data = json.dumps({'uris': chunk})
+            report = {'index': index, 'size': len(chunk), 'status': 'failed',
+                      'attempts': 0, 'snapshot_id': None}
+            while report['attempts'] <= self.add_tracks_retries:
+                if report['attempts']:
+                    sleep(self.add_tracks_backoff * 2 ** (report['attempts'] - 1))
+                report['attempts'] += 1
+                try:
+                    response = self.send('POST', endpoint, headers=headers, data=request_data,
+                                         operation='playlist_write')
+                except RequestException:
+                    continue
+                if response.status_code in range(200, 299):
+                    snapshot_id = report['snapshot_id'] = response.json().get('snapshot_id')
+                    report['status'] = 'added'
+                    break
+                if response.status_code < 500 and response.status_code != 429:
+                    # client errors won't succeed on retry
+                    break
+            chunks.append(report)
+            response_cache.invalidate(self.user_id, '/me/playlists', f'/playlists/{playlist_id}/')
+            if progress:
+                progress(added=sum(c['size'] for c in chunks if c['status'] == 'added'))
+        return {'snapshot_id': snapshot_id, 'chunks': chunks}
+
 
 class SpotifyClientTrack(SpotifyClientAuth):
     """CRUD operation for track."""
+    search_workers = int(environ.get('SPOTIFY_SEARCH_WORKERS', 8))   # concurrent searches per transfer
+    tracks_ids_limit = 50       # maximum ids per get-several-tracks request
+    search_limit = 20           # candidates scored per search
+    matcher = track_matcher
+    match_threshold = float(environ.get('SPOTIFY_MATCH_THRESHOLD', 0.8))    # below, a relaxed search is tried
+    min_confidence = float(environ.get('SPOTIFY_MIN_CONFIDENCE', 0.5))      # below, the song isn't matched
 
-    def get_track_uri(self, song_name, artist):
+    @staticmethod
+    def search_query(song_name, artist, relaxed=False):
+        """track:/artist: filtered query, || plain words when relaxed."""
+        if relaxed:
+            return f'{clean_title(song_name)} {artist}'
+        return f'track:{song_name} artist:{artist}'
+
+    def search_track(self, song_name, artist, relaxed=False):
         """
         Search For the Song
-        Returns: Track uri
+        Returns: List of matching track objects, empty if nothing matched || None on failure
         """
-        query = "https://api.spotify.com/v1/search?query=track%3A{}+artist%3A{}&type=track&offset=0&limit=20".format(
-            song_name,
-            artist
-        )
-        response = requests.get(query, headers= self.get_resource_header())
+        params = {'q': self.search_query(song_name, artist, relaxed), 'type': 'track',
+                  'offset': 0, 'limit': self.search_limit}
+        response = self.send('GET', f'{self.api_endpoint}/search', params=params,
+                             headers=self.get_resource_header(), operation='search')
         if response.status_code in range(200, 299):
             # if valid response
-            songs = response.json()["tracks"]["items"] # extract tracks
-            uri = songs[0]["uri"]        # get only first track
-            return uri
+            return response.json()["tracks"]["items"] # extract tracks
         return None
-    
-    def get_tracks_uri(self, tracks):
+
+    def match_track(self, song):
+        """
+        Searches song && scores the candidates, a relaxed search is only
+        sent when the best one scores below match_threshold.
+        Returns:
+            (uri || None below min_confidence, confidence) || None when a search
+            failed without a match, not cached
+        """
+        items = self.search_track(song['track'], song['artist'])
+        if items is None:
+            return None
+        best, score = self.matcher.best(song, items)
+        if score < self.match_threshold:
+            relaxed = self.search_track(song['track'], song['artist'], relaxed=True)
+            if relaxed is None and score < self.min_confidence:
+                # not a miss yet, left for a later search
+                return None
+            if relaxed:
+                candidate, relaxed_score = self.matcher.best(song, relaxed)
+                if relaxed_score > score:
+                    best, score = candidate, relaxed_score
+        return (best['uri'] if score >= self.min_confidence else None), score
+
+    def get_track_uri(self, song_name, artist):
+        """
+        Search For the Song
+        Returns: Track uri of the best match
+        """
+        match = self.match_track({'track': song_name, 'artist': artist})
+        return match[0] if match else None
+
+    @staticmethod
+    def track_id(song):
+        """
+        Spotify track id carried by a song, as its id, a spotify:track:<id>
+        uri or an open.spotify.com/track/<id> link.
+        Returns: id || None
+        """
+        value = str(song.get('uri') or song.get('id') or '')
+        if value.startswith('spotify:track:'):
+            value = value[len('spotify:track:'):]
+        elif 'open.spotify.com/track/' in value:
+            value = value.split('/track/', 1)[1].split('?', 1)[0]
+        return value if re.fullmatch(r'[0-9A-Za-z]{22}', value) else None
+
+    @staticmethod
+    def song_key(song):
+        """Identifies a song across syncs, by spotify id || normalized (track, artist)."""
+        track_id = SpotifyClientTrack.track_id(song)
+        if track_id:
+            return f'spotify:track:{track_id}'
+        return track_cache.key(song.get('track'), song.get('artist'))
+
+    def get_tracks_by_id(self, ids):
+        """
+        Looks track ids up with the batch tracks endpoint, tracks_ids_limit per call.
+        Returns:
+            {id: uri || None when spotify doesn't know it}, ids of failed calls left out
+        """
+        ids = list(dict.fromkeys(track_id for track_id in ids if track_id))
+        found = {}
+        for start in range(0, len(ids), self.tracks_ids_limit):
+            chunk = ids[start:start + self.tracks_ids_limit]
+            response = self.send('GET', f'{self.api_endpoint}/tracks', headers=self.get_resource_header(),
+                                 params={'ids': ','.join(chunk)}, operation='track_lookup')
+            if response.status_code in range(200, 299):
+                # tracks come back in the order of the ids, null for unknown ids
+                for track_id, track in zip(chunk, response.json()['tracks']):
+                    found[track_id] = track['uri'] if track else None
+        return found
+
+    def resolve_track_matches(self, songs, progress=None):
+        """
+        Resolves songs carrying a spotify id through the batch tracks endpoint,
+        the others through the track cache, the remaining searches run
+        concurrently, bounded by search_workers and the user's rate budget.
+        Parameters: songs: List of dictionary's with {track: song_name, artist: artist_name}
+                           and optionally a spotify {id} || {uri}, a {duration_ms}
+                    progress: optional callable, receives resolved= and failed= song counts
+        Returns:
+            List of (uri || None, confidence) in the same order as songs, confidence
+            is 1 for ids, the match score for searches, see collect_matches for the rest.
+        """
+        ids = [self.track_id(song) for song in songs]
+        by_id = self.get_tracks_by_id(ids) if any(ids) else {}
+        uris = [by_id.get(track_id) for track_id in ids]
+        # songs not found by id fall back to a search
+        keys = [track_cache.key(song.get('track'), song.get('artist'))
+                if not uri and song.get('track') and song.get('artist') else None
+                for song, uri in zip(songs, uris)]
+        pending = {}    # key -> first song with that key
+        for key, song in zip(keys, songs):
+            if key:
+                pending.setdefault(key, song)
+        resolved = track_cache.get_many(list(pending))
+        pending = [(key, song) for key, song in pending.items() if key not in resolved]
+        confidences = {}
+
+        def search(item):
+            key, song = item
+            return key, self.match_track(song)
+
+        if pending:
+            songs_per_key = Counter(keys)
+            found = sum(1 for uri in uris if uri)
+            found += sum(songs_per_key[key] for key, uri in resolved.items() if uri)
+            failed = len(songs) - found - sum(songs_per_key[key] for key, _ in pending)
+            searched = {}
+            workers = max(1, min(self.search_workers, len(pending)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for key, match in executor.map(search, pending):
+                    if match is not None:
+                        # failed searches aren't cached
+                        searched[key], confidences[key] = match
+                    if searched.get(key):
+                        found += songs_per_key[key]
+                    else:
+                        failed += songs_per_key[key]
+                    if progress:
+                        progress(resolved=found, failed=failed)
+            track_cache.set_many(searched)
+            resolved.update(searched)
+        return self.collect_matches(uris, keys, resolved, confidences)
+
+    @staticmethod
+    def collect_matches(uris, keys, resolved, confidences):
+        """
+        (uri || None, confidence) of each song from the uris found by id,
+        the cached && the searched resolutions of its key.
+        Confidence is None for cached hits && failed searches, these are
+        the only songs without a match && a confidence: a later run tries
+        them again. Cached misses && songs without a key count as 0.
+        """
+        matches = []
+        for uri, key in zip(uris, keys):
+            if uri:
+                matches.append((uri, 1.0))
+            elif not key:
+                # nothing to search for
+                matches.append((None, 0.0))
+            elif key in confidences:
+                matches.append((resolved[key], confidences[key]))
+            elif key in resolved:
+                matches.append((resolved[key], None if resolved[key] else 0.0))
+            else:
+                matches.append((None, None))
+        return matches
+
+    @staticmethod
+    def format_matches(songs, matches):
+        """Formats (uri, confidence) matches as [{track, artist, uri, confidence}]."""
+        return [{'track': song.get('track'), 'artist': song.get('artist'), 'uri': uri,
+                 'confidence': None if confidence is None else round(confidence, 3)}
+                for song, (uri, confidence) in zip(songs, matches)]
+
+    def resolve_track_uris(self, songs, progress=None):
+        """
+        resolve_track_matches, without the confidences.
+        Returns:
+            List of uri's || None, in the same order as songs.
+        """
+        return [uri for uri, _ in self.resolve_track_matches(songs, progress=progress)]
+
+    @staticmethod
+    def get_tracks_uri(tracks):
         """
         Gets tracks uri from json data, this method is used to check if
         a specific playlist does not have that track before adds it.
         
-        Parameters: tracks: list of dic's.
+        Parameters: tracks: list of Track.
         Returns:
-            List contains uri's || None
+            Set of uri's, for constant time membership checks
         """
-        return [uri['uri'] for t in tracks for uri in t.values()]
+        return {track.uri for track in tracks}
 
 class SpotifyClient(SpotifyClientPlaylist, SpotifyClientTrack):
-    
-    def perform_transfer_tracks(self, playlist_name, songs=[]):
+
+    def find_destination(self, playlist_name):
         """
-        Search if playlist exists || create, then add songs to the supplied playlist.
-        Params:
-            playlist_name: str-> name of the playlist to be searched or created.
-            songs: List of dictionary's with {track: song_name, artist: artist_name}
+        Looks the playlist up in the local playlist index, || creates it.
         Returns:
-            the snapshot_id of created playlist or None
-        """
-        def check_for_playlist(playlist):
-            """
-            This function checks if playlist is already created.
-            Parameters:
-                playlist: List of strings.
-            Returns:
-                playlist_id or None
-            """
-            found_p_id = None
-            current_user_playlists = self.get_playlist_info()
-            for data_dic in current_user_playlists:
-                for p_name, playlist_id in data_dic.items():
-                    if p_name == playlist_name:
-                        found_p_id = playlist_id
-            return found_p_id
-        uris = []
-        # Check for playlist
-        playlist_id = check_for_playlist(playlist_name)
+            (playlist_id || None if it couldn't be created, its tracks, [] when new)
+        Raises:
+            SpotifyClientError when the playlist exists but its tracks can't be read
+        """
+        playlist_id = self.find_playlist(playlist_name)
+        existing_tracks = self.get_playlist_tracks(playlist_id) if playlist_id else None
+        if playlist_id and existing_tracks is None:
+            # the indexed playlist is gone, look again in a refreshed index
+            playlist_id = self.find_playlist(playlist_name, refresh=True)
+            existing_tracks = self.get_playlist_tracks(playlist_id) if playlist_id else None
+        if playlist_id and existing_tracks is None:
+            # without its tracks every song would be added again
+            raise SpotifyClientError('Failed to read the destination playlist.')
         if not playlist_id:
             # If no id found, then create a new playlist.
             playlist_id = self.create_playlist(
                 playlist_name,
                 description='playlist created by rythmize.'
             )
-        # Move uris into playlist. 
-        track_uris = self.get_tracks_uri(self.get_playlist_tracks(playlist_id))
-        for song in songs:
-            track_name, artist = song['track'], song['artist']
-            if track_name and artist:
-                uri = self.get_track_uri(track_name, artist)
-                if uri and uri not in track_uris:
-                    # Add uri to uri's
-                    uris.append(uri)
-        endpoint = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
-        headers = self.get_resource_header()
-        request_data = json.dumps(uris)
-        response = requests.post(endpoint, headers=headers, data=request_data)
-        if response.status_code in range(200, 299):
-            # Valid response, return response
-            return response.json()
-        return None
+            existing_tracks = []
+        return playlist_id, existing_tracks
+
+    @staticmethod
+    def new_uris(matches, track_uris):
+        """
+        Uris of matches missing from track_uris (a set, updated as it goes),
+        each once, in order.
+        """
+        uris = []
+        for uri, _ in matches:
+            if uri and uri not in track_uris:
+                # Add uri to uri's, once
+                uris.append(uri)
+                track_uris.add(uri)
+        return uris
+
+    def perform_transfer_tracks(self, playlist_name, songs=[], progress=None):
+        """
+        Search if playlist exists || create, then add songs to the supplied playlist.
+        Params:
+            playlist_name: str-> name of the playlist to be searched or created.
+            songs: List of dictionary's with {track: song_name, artist: artist_name}
+                   and optionally a spotify {id} || {uri}
+            progress: optional callable, receives resolved=, failed= and added= counts
+        Returns:
+            {snapshot_id, chunks} as returned by add_tracks_to_playlist with
+            the matches of the songs, or None if no chunk could be added.
+        """
+        playlist_id, existing_tracks = self.find_destination(playlist_name)
+        if not playlist_id:
+            return None
+        # Move uris into playlist, membership checked against every track of it.
+        matches = self.resolve_track_matches(songs, progress=progress)
+        uris = self.new_uris(matches, self.get_tracks_uri(existing_tracks))
+        if progress:
+            found = len([uri for uri, _ in matches if uri])
+            progress(resolved=found, failed=len(songs) - found)
+        result = self.add_tracks_to_playlist(playlist_id, uris, progress=progress)
+        if result['chunks'] and result['snapshot_id'] is None:
+            # every chunk failed
+            return None
+        result['matches'] = self.format_matches(songs, matches)
+        return result
+
+    def perform_sync_tracks(self, sync, songs, progress=None):
+        """
+        perform_transfer_tracks for a PlaylistSync, songs are the ones not
+        synced yet. The destination is neither looked up nor read while its
+        snapshot_id is the one left by the last run.
+        Returns:
+            as perform_transfer_tracks
+        """
+        snapshot_id = self.get_playlist_snapshot(sync.playlist_id) if sync.playlist_id else None
+        destination = None
+        if snapshot_id is not None and snapshot_id == sync.snapshot_id:
+            playlist_id, track_uris = sync.playlist_id, sync.uris()
+        else:
+            if snapshot_id is not None:
+                # changed since the last run
+                playlist_id, existing_tracks = sync.playlist_id, self.get_playlist_tracks(sync.playlist_id)
+            else:
+                playlist_id, existing_tracks = self.find_destination(sync.playlist)
+            if not playlist_id or existing_tracks is None:
+                return None
+            destination = self.get_tracks_uri(existing_tracks)
+            track_uris = set(destination)
+        matches = self.resolve_track_matches(songs, progress=progress)
+        uris = self.new_uris(matches, track_uris)
+        if progress:
+            found = len([uri for uri, _ in matches if uri])
+            progress(resolved=found, failed=len(songs) - found)
+        result = self.add_tracks_to_playlist(playlist_id, uris, progress=progress)
+        if result['chunks'] and result['snapshot_id'] is None:
+            return None
+        result['matches'] = self.format_matches(songs, matches)
+        sync.record(playlist_id, result['snapshot_id'] or snapshot_id,
+                    self.synced_songs(songs, matches, uris, result['chunks']), destination)
+        return result
+
+    def synced_songs(self, songs, matches, uris, chunks):
+        """
+        {song key: uri} of the songs a run is done with: added || already in
+        the playlist, || scored without a match. Songs of failed chunks
+        && failed searches are left for the next run.
+        """
+        failed = set()
+        for chunk in chunks:
+            if chunk['status'] != 'added':
+                start = chunk['index'] * self.add_tracks_limit
+                failed.update(uris[start:start + chunk['size']])
+        return {self.song_key(song): uri for song, (uri, confidence) in zip(songs, matches)
+                if (uri and uri not in failed) or (not uri and confidence is not None)}
+
+
+def call_spotify(user_id, method, *args, **kwargs):
+    """
+    Authenticates the user then calls method on its SpotifyClient, || on an
+    AsyncSpotifyClient run by this thread's event loop when
+    SPOTIFY_ASYNC_CLIENT is set. Clients come from SpotifyClient.for_user.
+    Returns:
+        (authenticated, result of method || None)
+    """
+    if current_app.config.get('SPOTIFY_ASYNC_CLIENT'):
+        from .spotify_async import AsyncSpotifyClient, async_transport
+
+        async def call():
+            client = AsyncSpotifyClient.for_user(user_id)
+            if client is None or not await client.handle_auth():
+                return False, None
+            return True, await getattr(client, method)(*args, **kwargs)
+        return async_transport.run(call())
+    client = SpotifyClient.for_user(user_id)
+    if client is None or not client.handle_auth():
+        return False, None
+    return True, getattr(client, method)(*args, **kwargs)
@@ -0,0 +1,545 @@
+"""
+Async API clients module
+asyncio variant of SpotifyClient on a shared httpx.AsyncClient, one
+thread waits on many spotify calls at once.
+httpx is in requirements.txt, the module still imports without it.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from ..metrics import metrics
+from ..models.playlists import PlaylistIndex
+from .resolution import track_cache
+from .response_cache import response_cache
+from .spotify import SpotifyClient, SpotifyClientAuth, SpotifyClientError, active_users, refresh_lock
+from .transport import HttpTransport
+
+try:
+    import httpx
+except ImportError:     # checked when the first client is built
+    httpx = None
+
+
+class AsyncHttpTransport(object):
+    """
+    One event loop && httpx.AsyncClient per thread (an AsyncClient is bound
+    to its loop), with the pool size, timeouts && retries of HttpTransport.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._mounts = {}
+        self._generation = 0
+
+    def build_client(self):
+        if httpx is None:
+            raise RuntimeError("SPOTIFY_ASYNC_CLIENT requires the httpx package")
+        limits = httpx.Limits(max_connections=HttpTransport.pool_size,
+                              max_keepalive_connections=HttpTransport.pool_size)
+        return httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(limits=limits, retries=HttpTransport.max_retries),
+            mounts=dict(self._mounts),
+            timeout=httpx.Timeout(HttpTransport.read_timeout, connect=HttpTransport.connect_timeout))
+
+    @property
+    def loop(self):
+        """Returns the event loop of this thread, a new one after a fork."""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.loop, local.client, local.pid = asyncio.new_event_loop(), None, os.getpid()
+            local.slots = None
+        return local.loop
+
+    @property
+    def client(self):
+        """Returns the AsyncClient of this thread, rebuilt after mount/unmount."""
+        loop, local = self.loop, self._local
+        if local.client is None or local.generation != self._generation:
+            if local.client is not None and not loop.is_running():
+                loop.run_until_complete(local.client.aclose())
+            local.client, local.generation = self.build_client(), self._generation
+            # requests beyond the pool wait here, httpcore's own queue is costly to scan
+            local.slots = asyncio.Semaphore(HttpTransport.pool_size)
+        return local.client
+
+    def mount(self, prefix, transport):
+        """Routes urls matching prefix to an httpx transport (used by tests to stub spotify)."""
+        self._mounts[prefix] = transport
+        self._generation += 1
+
+    def unmount(self, prefix):
+        self._mounts.pop(prefix, None)
+        self._generation += 1
+
+    def run(self, coroutine):
+        """Runs coroutine to completion on this thread's loop, from synchronous code."""
+        return self.loop.run_until_complete(coroutine)
+
+    async def request(self, method, url, operation='other', **kwargs):
+        """Sends a request, operation labels the call in the metrics."""
+        client = self.client
+        async with self._local.slots:
+            status, start = 'error', time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                status = response.status_code
+                return response
+            finally:
+                metrics.record_spotify_call(operation, status, time.perf_counter() - start)
+
+
+# class instance
+async_transport = AsyncHttpTransport()
+
+
+class AsyncSpotifyClient(SpotifyClientAuth):
+    """
+    SpotifyClient for asyncio: handle_auth, get_user_playlists,
+    get_playlist_tracks, create_playlist && perform_transfer_tracks are
+    coroutines taking the same arguments && returning the same results.
+    Database work (token storage, playlist index) stays synchronous.
+    """
+    http = async_transport
+    playlists_page_limit = SpotifyClient.playlists_page_limit
+    tracks_page_limit = SpotifyClient.tracks_page_limit
+    add_tracks_limit = SpotifyClient.add_tracks_limit
+    add_tracks_retries = SpotifyClient.add_tracks_retries
+    add_tracks_backoff = SpotifyClient.add_tracks_backoff
+    search_workers = SpotifyClient.search_workers
+    tracks_ids_limit = SpotifyClient.tracks_ids_limit
+    search_limit = SpotifyClient.search_limit
+    matcher = SpotifyClient.matcher
+    match_threshold = SpotifyClient.match_threshold
+    min_confidence = SpotifyClient.min_confidence
+    format_playlist = staticmethod(SpotifyClient.format_playlist)
+    format_track = staticmethod(SpotifyClient.format_track)
+    track_id = staticmethod(SpotifyClient.track_id)
+    get_tracks_uri = staticmethod(SpotifyClient.get_tracks_uri)
+    search_query = staticmethod(SpotifyClient.search_query)
+    format_matches = staticmethod(SpotifyClient.format_matches)
+    collect_matches = staticmethod(SpotifyClient.collect_matches)
+    index_entry_gone = staticmethod(SpotifyClient.index_entry_gone)
+    song_key = staticmethod(SpotifyClient.song_key)
+    new_uris = staticmethod(SpotifyClient.new_uris)
+    synced_songs = SpotifyClient.synced_songs
+
+    async def send(self, method, url, operation, **kwargs):
+        """Sends a spotify call through the scheduler, re-sent while throttled."""
+        return await self.scheduler.call_async(
+            lambda: self.http.request(method, url, operation=operation, **kwargs),
+            self.client_id, self.user_id, self.user_rate_limit, operation)
+
+    async def get_access_token(self, code):
+        """Requests a access token."""
+        data = {'grant_type': 'authorization_code', 'code': code, 'redirect_uri': self.redirect_uri}
+        return await self.send('POST', self.tokenapi_endpoint, data=data,
+                               headers=self.get_token_headers(), operation='token_exchange')
+
+    async def refresh_access_token(self):
+        """refresh an access token"""
+        data = {'grant_type': 'refresh_token', 'refresh_token': self.refresh_token}
+        headers = {'Authorization': f'Basic {self.client_credentials()}'}
+        return await self.send('POST', self.tokenapi_endpoint, data=data, headers=headers,
+                               operation='token_refresh')
+
+    async def refresh_token_once(self):
+        """
+        SpotifyClientAuth.refresh_token_once, the refresh lock is polled
+        so coroutines of the same loop never block each other.
+        Returns:
+            Boolean: True if a fresh token is available
+        """
+        from ..extensions import db_manager
+
+        lock = refresh_lock(self.user_id)
+        while not lock.acquire(blocking=False):
+            await asyncio.sleep(0.01)
+        try:
+            keys = db_manager.lock_key_table(self.user_id)
+            if keys is not None and keys.jwt_token and keys.jwt_token != self.token \
+                    and keys.expires_in and not self.token_expiring(keys.expires_in):
+                # refreshed by another request or worker
+                self.token, self.expires = keys.jwt_token, keys.expires_in
+                db_manager.save()
+                return True
+            if self.refresh_token and self.assign_token_values(await self.refresh_access_token()):
+                self.update_database()
+                return True
+            db_manager.rollback()
+            return False
+        finally:
+            lock.release()
+
+    async def handle_auth(self):
+        """
+        SpotifyClientAuth.handle_auth.
+        Returns:
+            Boolean: True if user is authenticated, else False
+        """
+        if self.code and self.assign_token_values(await self.get_access_token(self.code)):
+            self.update_database()
+            self.register()
+            return True
+        if not self.code and self.token and self.expires:
+            active_users[self.user_id] = datetime.now()
+            if not self.token_expiring():
+                if self._auth is None:
+                    self.register()
+                return True
+            if await self.refresh_token_once():
+                self.register()
+                return True
+            return self.expires > datetime.now()
+        return False
+
+    async def get_user_id(self):
+        response = await self.send('GET', f'{self.api_endpoint}/me/',
+                                   headers=self.get_resource_header(), operation='profile')
+        if response.status_code in range(200, 299):
+            return response.json()['id']
+        return None
+
+    async def get_page(self, endpoint, params=None):
+        """
+        Fetches one page of a spotify paging object, revalidated by ETag.
+        Returns:
+            page json || None
+        """
+        key = response_cache.key(self.user_id, endpoint, params)
+        cached = response_cache.get(key)
+        headers = self.get_resource_header()
+        if cached:
+            headers['If-None-Match'] = cached[0]
+        response = await self.send('GET', endpoint, headers=headers, params=params,
+                                   operation='playlist_read')
+        if response.status_code == 304 and cached:
+            return cached[1]
+        if response.status_code in range(200, 299):
+            data = response.json()
+            if response.headers.get('ETag'):
+                response_cache.set(key, response.headers['ETag'], data)
+            return data
+        return None
+
+    async def paginate(self, endpoint, limit):
+        """
+        Fetches every page of a paging object, the pages after the first
+        are requested together, by offset.
+        Returns:
+            list of the items of every page || None if a page failed.
+        """
+        page = await self.get_page(endpoint, {'offset': 0, 'limit': limit})
+        if page is None:
+            return None
+        items = list(page['items'])
+        if page.get('next') and page.get('total') is not None:
+            pages = await asyncio.gather(*(self.get_page(endpoint, {'offset': offset, 'limit': limit})
+                                           for offset in range(limit, page['total'], limit)))
+            if any(following is None for following in pages):
+                return None
+            for following in pages:
+                items.extend(following['items'])
+            return items
+        while page.get('next'):
+            # no total, follow the links
+            page = await self.get_page(page['next'])
+            if page is None:
+                return None
+            items.extend(page['items'])
+        return items
+
+    async def get_user_playlists(self):
+        """Get current user playlists."""
+        items = await self.paginate(f'{self.api_endpoint}/me/playlists', self.playlists_page_limit)
+        if items is None:
+            return None
+        return [self.format_playlist(data) for data in items]
+
+    async def refresh_playlist_index(self):
+        """SpotifyClientPlaylist.refresh_playlist_index."""
+        items = await self.paginate(f'{self.api_endpoint}/me/playlists', self.playlists_page_limit)
+        if items is None:
+            return False
+        PlaylistIndex.sync(self.user_id, items)
+        return True
+
+    async def find_playlist(self, name, refresh=False):
+        """SpotifyClientPlaylist.find_playlist."""
+        playlist_id = None if refresh else PlaylistIndex.lookup(self.user_id, name)
+        if playlist_id is not None and \
+                self.index_entry_gone(name, *await self.get_playlist_fields(playlist_id, 'name')):
+            PlaylistIndex.remove(self.user_id, playlist_id)
+            playlist_id = None
+        if playlist_id is None and await self.refresh_playlist_index():
+            playlist_id = PlaylistIndex.lookup(self.user_id, name)
+        return playlist_id
+
+    async def get_playlist_fields(self, playlist_id, fields):
+        """SpotifyClientPlaylist.get_playlist_fields."""
+        response = await self.send('GET', f'{self.api_endpoint}/playlists/{playlist_id}',
+                                   headers=self.get_resource_header(), params={'fields': fields},
+                                   operation='playlist_read')
+        if response.status_code in range(200, 299):
+            return response.status_code, response.json()
+        return response.status_code, None
+
+    async def get_playlist_snapshot(self, playlist_id):
+        """SpotifyClientPlaylist.get_playlist_snapshot."""
+        _, data = await self.get_playlist_fields(playlist_id, 'snapshot_id')
+        return data.get('snapshot_id') if data is not None else None
+
+    async def get_playlist_tracks(self, playlist_id=None):
+        """
+        Retrieves tracks of playlist based on playlist_id.
+        Returns:
+            List of Track || None
+        """
+        endpoint = f'{self.api_endpoint}/playlists/{playlist_id}/tracks'
+        items = await self.paginate(endpoint, self.tracks_page_limit)
+        if items is None:
+            return None
+        # removed or unavailable tracks come back as null
+        return [self.format_track(data['track']) for data in items if data.get('track')]
+
+    async def create_playlist(self, name, description=None, public=False):
+        """Create A New Playlist"""
+        spotify_id = await self.get_user_id()
+        endpoint = f'{self.api_endpoint}/users/{spotify_id}/playlists'
+        body = json.dumps({'name': name, 'description': description, 'public': public})
+        response = await self.send('POST', endpoint, content=body, headers=self.get_resource_header(),
+                                   operation='playlist_create')
+        response_cache.invalidate(self.user_id, '/me/playlists')
+        if response.status_code in range(200, 299):
+            data = response.json()
+            PlaylistIndex.insert(self.user_id, data['id'], name, data.get('snapshot_id'))
+            return data['id']
+        return None
+
+    async def add_tracks_to_playlist(self, playlist_id, uris, progress=None):
+        """
+        SpotifyClientPlaylist.add_tracks_to_playlist, chunks are sent in
+        order, one at a time, to keep the playlist order.
+        Returns:
+            {snapshot_id: last snapshot_id || None,
+             chunks: [{index, size, status, attempts, snapshot_id}]}
+        """
+        endpoint = f'{self.api_endpoint}/playlists/{playlist_id}/tracks'
+        headers = self.get_resource_header()
+        snapshot_id, chunks = None, []
+        for index, start in enumerate(range(0, len(uris), self.add_tracks_limit)):
+            chunk = uris[start:start + self.add_tracks_limit]
+            body = json.dumps({'uris': chunk})
+            report = {'index': index, 'size': len(chunk), 'status': 'failed',
+                      'attempts': 0, 'snapshot_id': None}
+            while report['attempts'] <= self.add_tracks_retries:
+                if report['attempts']:
+                    await asyncio.sleep(self.add_tracks_backoff * 2 ** (report['attempts'] - 1))
+                report['attempts'] += 1
+                try:
+                    response = await self.send('POST', endpoint, headers=headers, content=body,
+                                               operation='playlist_write')
+                except httpx.TransportError:
+                    continue
+                if response.status_code in range(200, 299):
+                    snapshot_id = report['snapshot_id'] = response.json().get('snapshot_id')
+                    report['status'] = 'added'
+                    break
+                if response.status_code < 500 and response.status_code != 429:
+                    # client errors won't succeed on retry
+                    break
+            chunks.append(report)
+            response_cache.invalidate(self.user_id, '/me/playlists', f'/playlists/{playlist_id}/')
+            if progress:
+                progress(added=sum(c['size'] for c in chunks if c['status'] == 'added'))
+        return {'snapshot_id': snapshot_id, 'chunks': chunks}
+
+    async def search_track(self, song_name, artist, relaxed=False):
+        """
+        Search For the Song
+        Returns: List of matching track objects, empty if nothing matched || None on failure
+        """
+        params = {'q': self.search_query(song_name, artist, relaxed), 'type': 'track',
+                  'offset': 0, 'limit': self.search_limit}
+        response = await self.send('GET', f'{self.api_endpoint}/search', params=params,
+                                   headers=self.get_resource_header(), operation='search')
+        if response.status_code in range(200, 299):
+            return response.json()['tracks']['items']
+        return None
+
+    async def match_track(self, song):
+        """
+        SpotifyClientTrack.match_track.
+        Returns:
+            (uri || None below min_confidence, confidence) || None on failure
+        """
+        items = await self.search_track(song['track'], song['artist'])
+        if items is None:
+            return None
+        best, score = self.matcher.best(song, items)
+        if score < self.match_threshold:
+            relaxed = await self.search_track(song['track'], song['artist'], relaxed=True)
+            if relaxed is None and score < self.min_confidence:
+                # not a miss yet, left for a later search
+                return None
+            if relaxed:
+                candidate, relaxed_score = self.matcher.best(song, relaxed)
+                if relaxed_score > score:
+                    best, score = candidate, relaxed_score
+        return (best['uri'] if score >= self.min_confidence else None), score
+
+    async def get_tracks_by_id(self, ids):
+        """
+        SpotifyClientTrack.get_tracks_by_id, the batches are requested together.
+        Returns:
+            {id: uri || None when spotify doesn't know it}, ids of failed calls left out
+        """
+        ids = list(dict.fromkeys(track_id for track_id in ids if track_id))
+        chunks = [ids[start:start + self.tracks_ids_limit]
+                  for start in range(0, len(ids), self.tracks_ids_limit)]
+        responses = await asyncio.gather(*(
+            self.send('GET', f'{self.api_endpoint}/tracks', headers=self.get_resource_header(),
+                      params={'ids': ','.join(chunk)}, operation='track_lookup')
+            for chunk in chunks))
+        found = {}
+        for chunk, response in zip(chunks, responses):
+            if response.status_code in range(200, 299):
+                for track_id, track in zip(chunk, response.json()['tracks']):
+                    found[track_id] = track['uri'] if track else None
+        return found
+
+    async def resolve_track_matches(self, songs, progress=None):
+        """
+        SpotifyClientTrack.resolve_track_matches, at most search_workers
+        searches are awaited at once.
+        Returns:
+            List of (uri || None, confidence) in the same order as songs.
+        """
+        ids = [self.track_id(song) for song in songs]
+        by_id = await self.get_tracks_by_id(ids) if any(ids) else {}
+        uris = [by_id.get(track_id) for track_id in ids]
+        keys = [track_cache.key(song.get('track'), song.get('artist'))
+                if not uri and song.get('track') and song.get('artist') else None
+                for song, uri in zip(songs, uris)]
+        pending = {}
+        for key, song in zip(keys, songs):
+            if key:
+                pending.setdefault(key, song)
+        resolved = track_cache.get_many(list(pending))
+        pending = [(key, song) for key, song in pending.items() if key not in resolved]
+        confidences = {}
+        if pending:
+            songs_per_key = Counter(keys)
+            counts = {'resolved': sum(1 for uri in uris if uri), 'failed': 0}
+            counts['resolved'] += sum(songs_per_key[key] for key, uri in resolved.items() if uri)
+            counts['failed'] = len(songs) - counts['resolved'] - sum(songs_per_key[key] for key, _ in pending)
+            searched = {}
+            slots = asyncio.Semaphore(max(1, self.search_workers))
+
+            async def search(key, song):
+                async with slots:
+                    match = await self.match_track(song)
+                if match is not None:
+                    # failed searches aren't cached
+                    searched[key], confidences[key] = match
+                counts['resolved' if searched.get(key) else 'failed'] += songs_per_key[key]
+                if progress:
+                    progress(**counts)
+
+            await asyncio.gather(*(search(key, song) for key, song in pending))
+            track_cache.set_many(searched)
+            resolved.update(searched)
+        return self.collect_matches(uris, keys, resolved, confidences)
+
+    async def resolve_track_uris(self, songs, progress=None):
+        """
+        resolve_track_matches, without the confidences.
+        Returns:
+            List of uri's || None, in the same order as songs.
+        """
+        return [uri for uri, _ in await self.resolve_track_matches(songs, progress=progress)]
+
+    async def perform_transfer_tracks(self, playlist_name, songs=[], progress=None):
+        """
+        SpotifyClient.perform_transfer_tracks, the destination is found
+        while the songs are resolved.
+        Returns:
+            {snapshot_id, chunks} as returned by add_tracks_to_playlist with
+            the matches of the songs, or None if no chunk could be added.
+        """
+        (playlist_id, existing_tracks), matches = await asyncio.gather(
+            self.find_destination(playlist_name),
+            self.resolve_track_matches(songs, progress=progress))
+        if not playlist_id:
+            return None
+        uris = self.new_uris(matches, self.get_tracks_uri(existing_tracks))
+        if progress:
+            found = len([uri for uri, _ in matches if uri])
+            progress(resolved=found, failed=len(songs) - found)
+        result = await self.add_tracks_to_playlist(playlist_id, uris, progress=progress)
+        if result['chunks'] and result['snapshot_id'] is None:
+            # every chunk failed
+            return None
+        result['matches'] = self.format_matches(songs, matches)
+        return result
+
+    async def find_destination(self, playlist_name):
+        """SpotifyClient.find_destination, used by both transfers && syncs."""
+        playlist_id = await self.find_playlist(playlist_name)
+        existing_tracks = await self.get_playlist_tracks(playlist_id) if playlist_id else None
+        if playlist_id and existing_tracks is None:
+            # the indexed playlist is gone, look again in a refreshed index
+            playlist_id = await self.find_playlist(playlist_name, refresh=True)
+            existing_tracks = await self.get_playlist_tracks(playlist_id) if playlist_id else None
+        if playlist_id and existing_tracks is None:
+            # without its tracks every song would be added again
+            raise SpotifyClientError('Failed to read the destination playlist.')
+        if not playlist_id:
+            playlist_id = await self.create_playlist(playlist_name,
+                                                     description='playlist created by rythmize.')
+            existing_tracks = []
+        return playlist_id, existing_tracks
+
+    async def perform_sync_tracks(self, sync, songs, progress=None):
+        """
+        SpotifyClient.perform_sync_tracks, a changed destination is read
+        while the songs are resolved.
+        Returns:
+            as perform_transfer_tracks
+        """
+        snapshot_id = await self.get_playlist_snapshot(sync.playlist_id) if sync.playlist_id else None
+        destination = None
+        if snapshot_id is not None and snapshot_id == sync.snapshot_id:
+            playlist_id, track_uris = sync.playlist_id, sync.uris()
+            matches = await self.resolve_track_matches(songs, progress=progress)
+        else:
+            if snapshot_id is not None:
+                playlist_id = sync.playlist_id
+                existing_tracks, matches = await asyncio.gather(
+                    self.get_playlist_tracks(playlist_id),
+                    self.resolve_track_matches(songs, progress=progress))
+                if existing_tracks is None:
+                    return None
+            else:
+                (playlist_id, existing_tracks), matches = await asyncio.gather(
+                    self.find_destination(sync.playlist),
+                    self.resolve_track_matches(songs, progress=progress))
+                if not playlist_id:
+                    return None
+            destination = self.get_tracks_uri(existing_tracks)
+            track_uris = set(destination)
+        uris = self.new_uris(matches, track_uris)
+        if progress:
+            found = len([uri for uri, _ in matches if uri])
+            progress(resolved=found, failed=len(songs) - found)
+        result = await self.add_tracks_to_playlist(playlist_id, uris, progress=progress)
+        if result['chunks'] and result['snapshot_id'] is None:
+            return None
+        result['matches'] = self.format_matches(songs, matches)
+        sync.record(playlist_id, result['snapshot_id'] or snapshot_id,
+                    self.synced_songs(songs, matches, uris, result['chunks']), destination)
+        return result
@@ -0,0 +1,212 @@
+"""
+Client throttling module
+keeps outbound calls within a rate budget.
+"""
+import asyncio
+import threading
+import time
+from os import environ
+
+from ..cache import LRUCache
+from ..metrics import metrics
+
+
+class RateBudget(object):
+    """Token bucket, allows `rate` calls per second with bursts up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1, rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """Adds tokens earned since the last refill."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        """
+        Takes a token when one is available.
+        Returns:
+            0 || seconds until the next token
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """
+        Blocks until a call fits into the budget.
+        Returns:
+            seconds waited
+        """
+        waited = 0.0
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self):
+        """acquire() for coroutines, waits without blocking the event loop."""
+        waited = 0.0
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+
+_budgets = LRUCache(maxsize=10000)   # the least recently used budgets are idle, their buckets full
+_budgets_lock = threading.Lock()
+
+
+def budget(key, rate):
+    """Returns the process-wide budget of key, rebuilt when its rate changes."""
+    with _budgets_lock:
+        found = _budgets.get(key)
+        if found is None or found.rate != rate:
+            found = RateBudget(rate)
+            _budgets.set(key, found)
+        return found
+
+
+def user_budget(user_id, rate):
+    """Returns the process-wide budget shared by every call made for user_id."""
+    return budget(('user', user_id), rate)
+
+
+def app_budget(credential, rate):
+    """Returns the process-wide budget shared by every call made with an app credential."""
+    return budget(('app', credential), rate)
+
+
+class Scheduler(object):
+    """
+    Central gate of the spotify calls. A call waits for the app credential
+    and user budgets, and for any pause set by a 429: its Retry-After
+    pauses every caller of the credential. Throttled calls are sent again
+    (up to max_retries) instead of failing.
+    """
+    app_rate = float(environ.get('SPOTIFY_APP_RATE', 50))               # calls per second per app
+    max_retries = int(environ.get('SPOTIFY_THROTTLE_RETRIES', 5))       # resends after a 429
+    max_wait = float(environ.get('SPOTIFY_THROTTLE_MAX_WAIT', 30))      # longest pause waited, seconds
+    default_retry_after = 1.0
+
+    def __init__(self):
+        self._paused_until = {}     # credential -> monotonic time
+        self._lock = threading.Lock()
+        self.queued = 0
+        metrics.register('spotify_scheduler', self.stats)
+
+    @staticmethod
+    def retry_after(response):
+        """Seconds asked by a 429, Retry-After given as a delay."""
+        try:
+            return max(0.0, float(response.headers.get('Retry-After')))
+        except (TypeError, ValueError):
+            return Scheduler.default_retry_after
+
+    def pause(self, credential, seconds):
+        """Holds every call of credential for seconds."""
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._paused_until[credential] = max(until, self._paused_until.get(credential, 0))
+
+    def paused_for(self, credential):
+        """Seconds left before calls of credential may be sent."""
+        with self._lock:
+            return max(0.0, self._paused_until.get(credential, 0) - time.monotonic())
+
+    def _enter(self):
+        with self._lock:
+            self.queued += 1
+
+    def _leave(self, paused, waited):
+        with self._lock:
+            self.queued -= 1
+        if paused:
+            metrics.inc('rythmize_spotify_throttle_seconds_total', paused, reason='retry_after')
+        if waited:
+            metrics.inc('rythmize_spotify_throttle_seconds_total', waited, reason='budget')
+
+    def admit(self, credential, user_id, user_rate):
+        """Blocks until the call may be sent, counted in the queue meanwhile."""
+        self._enter()
+        paused = waited = 0.0
+        try:
+            paused = min(self.paused_for(credential), self.max_wait)
+            if paused:
+                time.sleep(paused)
+            waited = app_budget(credential, self.app_rate).acquire()
+            if user_id is not None:
+                waited += user_budget(user_id, user_rate).acquire()
+        finally:
+            self._leave(paused, waited)
+
+    async def admit_async(self, credential, user_id, user_rate):
+        """admit() for coroutines."""
+        self._enter()
+        paused = waited = 0.0
+        try:
+            paused = min(self.paused_for(credential), self.max_wait)
+            if paused:
+                await asyncio.sleep(paused)
+            waited = await app_budget(credential, self.app_rate).acquire_async()
+            if user_id is not None:
+                waited += await user_budget(user_id, user_rate).acquire_async()
+        finally:
+            self._leave(paused, waited)
+
+    def throttled(self, response, credential, operation):
+        """Pauses credential when response is a 429, returns True if so."""
+        if response.status_code != 429:
+            return False
+        metrics.inc('rythmize_spotify_throttled_total', operation=operation)
+        self.pause(credential, self.retry_after(response))
+        return True
+
+    def call(self, send, credential, user_id=None, user_rate=20, operation='other'):
+        """
+        Sends send() once admitted, again after each 429.
+        Returns:
+            the first non 429 response, || the last 429 once retries are
+            exhausted || when the pause is longer than max_wait
+        """
+        response = None
+        for _ in range(self.max_retries + 1):
+            if response is not None and self.paused_for(credential) > self.max_wait:
+                break
+            self.admit(credential, user_id, user_rate)
+            response = send()
+            if not self.throttled(response, credential, operation):
+                break
+        return response
+
+    async def call_async(self, send, credential, user_id=None, user_rate=20, operation='other'):
+        """call() for coroutines, send is a coroutine function."""
+        response = None
+        for _ in range(self.max_retries + 1):
+            if response is not None and self.paused_for(credential) > self.max_wait:
+                break
+            await self.admit_async(credential, user_id, user_rate)
+            response = await send()
+            if not self.throttled(response, credential, operation):
+                break
+        return response
+
+    def stats(self):
+        return {'queue_depth': self.queued,
+                'paused': int(any(self.paused_for(c) for c in list(self._paused_until)))}
+
+
+# class instance
+scheduler = Scheduler()
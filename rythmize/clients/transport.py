@@ -0,0 +1,105 @@
+"""
+Clients transport module
+one pooled, keep-alive http session shared by every api client call.
+"""
+import os
+import threading
+import time
+from os import environ
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ..metrics import metrics
+
+
+class HttpTransport(object):
+    """
+    Process-wide requests.Session with a bounded connection pool,
+    default connect/read timeouts and retries with backoff.
+    """
+    pool_size = int(environ.get('SPOTIFY_POOL_SIZE', 16))
+    connect_timeout = float(environ.get('SPOTIFY_CONNECT_TIMEOUT', 3.05))
+    read_timeout = float(environ.get('SPOTIFY_READ_TIMEOUT', 10))
+    max_retries = int(environ.get('SPOTIFY_MAX_RETRIES', 3))
+    backoff_factor = float(environ.get('SPOTIFY_BACKOFF', 0.3))
+    retry_statuses = (500, 502, 503, 504)
+
+    def __init__(self):
+        self._session = None
+        self._pid = None
+        self._adapters = {}
+        self._lock = threading.Lock()
+
+    def build_adapter(self):
+        """Pooled adapter, retries idempotent requests on connection errors and 5xx."""
+        retries = Retry(
+            total=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.retry_statuses,
+            raise_on_status=False)
+        return HTTPAdapter(pool_connections=self.pool_size,
+                           pool_maxsize=self.pool_size,
+                           max_retries=retries)
+
+    def build_session(self):
+        """Creates the session and mounts the default and injected adapters."""
+        session = requests.Session()
+        adapter = self.build_adapter()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        for prefix, injected in self._adapters.items():
+            session.mount(prefix, injected)
+        return session
+
+    @property
+    def session(self):
+        """Returns the session, rebuilt after a fork so workers never share sockets."""
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self.build_session()
+                    self._pid = os.getpid()
+        return self._session
+
+    def mount(self, prefix, adapter):
+        """Routes urls starting with prefix to adapter (used by tests to stub spotify)."""
+        self._adapters[prefix] = adapter
+        self.session.mount(prefix, adapter)
+
+    def unmount(self, prefix):
+        """Removes an injected adapter."""
+        self._adapters.pop(prefix, None)
+        self.reset()
+
+    def reset(self):
+        """Drops the session, the next call builds a new one."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+
+    def request(self, method, url, operation='other', **kwargs):
+        """
+        Sends a request, with the default timeouts unless given.
+        operation labels the call in the metrics (search, playlist_read, ...).
+        """
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+        status, start = 'error', time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            metrics.record_spotify_call(operation, status, time.perf_counter() - start)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+# class instance
+transport = HttpTransport()
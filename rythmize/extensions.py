@@ -1,13 +1,62 @@
+import functools
+from contextlib import contextmanager
+
 from flask import current_app
 from flask_cors import CORS
 from flask_mail import Mail, Message
 from flask_marshmallow import Marshmallow
 from flask_praetorian import Praetorian
-from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
 from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from sqlalchemy import orm
+
+from .passwords import PasswordHasher
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session sending reads to the 'replica' bind while use_replica is set,
+    flushes (every write) always go to the primary.
+    Without a replica bind every statement goes to the primary.
+    """
+    use_replica = False
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.use_replica and not self._flushing and \
+                'replica' in (self.app.config.get('SQLALCHEMY_BINDS') or {}):
+            return self.app.extensions['sqlalchemy'].db.get_engine(self.app, bind='replica')
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy extension whose sessions are RoutingSessions."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+@contextmanager
+def replica(enabled=True):
+    """Routes the reads of the current session to the replica (or back to the primary)."""
+    session = db.session()
+    previous, session.use_replica = session.use_replica, enabled
+    try:
+        yield session
+    finally:
+        session.use_replica = previous
+
+
+def use_replica(view):
+    """Decorates a read-only view, its queries are served by the replica."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with replica():
+            return view(*args, **kwargs)
+    return wrapper
+
 
 # Setup sqlalchemy
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 # Setup marshmallow
 ma = Marshmallow()
 # Setup flask-praetorian
@@ -17,19 +66,23 @@ cors = CORS()
 # Setup mail && msg
 mail = Mail()
 message = Message
+# Setup password hashing
+hasher = PasswordHasher()
 
 # Setup email confirmation token
 
 
 def send_email_verification(email):
-    """Send an email verification link to user email."""
+    """Queue an email verification link to user email, sent by the mail outbox."""
     from flask import url_for
+
+    from .tasks import mail_outbox
     serializer = URLSafeTimedSerializer(current_app.config["SECRET_KEY"])
     token = serializer.dumps(email, salt='rythmize-email-confirmation')
     link = url_for('api_views.email_confirmation', token=token, _external=True)
     msg = message('Confirm email', recipients=[email])
     msg.body = f'Your confirmation link is {link}'
-    mail.send(msg)
+    mail_outbox.send(msg)
 
 
 def confirm_email_by_link(token):
@@ -60,10 +113,14 @@ class DatabaseManager(object):
         """Commits changes to database."""
         self._session.commit()
 
+    def rollback(self):
+        """Discards uncommitted changes."""
+        self._session.rollback()
+
     def remove(self, obj):
         """Removes an object from database."""
         if obj:
-            self._session.remove(obj)
+            self._session.delete(obj)
 
     def close(self):
         """Closes database connection."""
@@ -75,20 +132,40 @@ class DatabaseManager(object):
             return cls.query.filter_by(id=id).one_or_none()
         return cls.query.filter_by(username=username).one_or_none()
     
-    def update_key_table(self, user_id, service='spotify', **kwargs):
-        """Updates user keys table with new values."""
-        from .models.user import User
-        user = User.query.get(user_id)
+    def lock_key_table(self, user_id, service='spotify'):
+        """
+        Reloads the user keys table with SELECT ... FOR UPDATE, the row
+        stays locked for other workers until the next save or rollback.
+        """
+        from .models.keys import SpotifyJsonWebToken, YoutubeJsonWebToken
+        cls = YoutubeJsonWebToken if service == 'youtube' else SpotifyJsonWebToken
+        with replica(False):
+            # locks are taken on the primary
+            return cls.query.filter_by(user_id=user_id)\
+                .populate_existing().with_for_update().one_or_none()
+
+    def update_key_table(self, user, service='spotify', **kwargs):
+        """
+        Updates user keys table with new values.
+        user: a loaded User, or a user id.
+        """
+        from .clients.registry import client_registry
+        from .models.user import User, identity_cache
+        if not isinstance(user, User):
+            user = User.identify(user)
         key_table = user.spotify_keys
         if service == 'youtube':
             # if service is youtube then get the youtube table
             key_table = user.youtube_keys
         for attr, val in kwargs.items():
-            # set attr of youtube table with new values
+            # set attr of the keys table with new values
             if attr in ['jwt_token', 'refresh_token', 'expires_in']:
-                setattr(user.spotify_keys, attr, val)
+                setattr(key_table, attr, val)
         self.add(key_table)
         self.save()
+        identity_cache.invalidate(user.id)
+        if service == 'spotify':
+            client_registry.invalidate(user.id)
 
 
 # class instance
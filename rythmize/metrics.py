@@ -0,0 +1,229 @@
+"""
+Metrics module
+process-wide counters, histograms && stats providers, exported in the
+prometheus text format on /metrics.
+"""
+import hmac
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, _request_ctx_stack, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+def series(name, labels):
+    """Formats name{label="value",...}, labels is a sorted tuple of pairs."""
+    if not labels:
+        return name
+    values = ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\')
+                                       .replace('"', '\\"').replace('\n', '\\n'))
+                      for key, value in labels)
+    return f'{name}{{{values}}}'
+
+
+class Histogram(object):
+    """Bucketed observations, counts are cumulated when rendered."""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestTimings(object):
+    """Time spent by the current request, in sql statements && spotify calls."""
+    __slots__ = ('start', 'sql_count', 'sql_seconds', 'spotify_count', 'spotify_seconds')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = self.spotify_count = 0
+        self.sql_seconds = self.spotify_seconds = 0.0
+
+
+def current_timings():
+    """Returns the RequestTimings of the request handled by this thread, if any."""
+    return getattr(_request_ctx_stack.top, 'timings', None)
+
+
+class Metrics(object):
+    """
+    Registry of counters, histograms, and of providers polled on export.
+    Values are kept per process, each worker is scraped on its own.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.token = None
+        self.server_timing = False
+        self.counters = {}
+        self.histograms = {}
+        self.providers = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Resets the values, instruments requests && sql, serves /metrics."""
+        self.reset()
+        self.enabled = app.config.get('METRICS_ENABLED', False)
+        self.token = app.config.get('METRICS_TOKEN')
+        self.server_timing = app.config.get('SERVER_TIMING', False)
+        if not self.enabled:
+            return
+        listen_to_statements()
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.add_url_rule('/metrics', 'metrics', self.export)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def inc(self, name, value=1, **labels):
+        """Increments counter name{labels} by value."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """Records value in histogram name{labels}."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def register(self, name, provider):
+        """provider() returns a dict of numbers, exported as rythmize_<name>_<key> gauges."""
+        self.providers[name] = provider
+
+    def snapshot(self):
+        """
+        Returns:
+            {series: value} for counters, {provider name: {key: value}} for providers
+        """
+        with self._lock:
+            snapshot = {series(*key): value for key, value in self.counters.items()}
+        for name, provider in self.providers.items():
+            snapshot[name] = provider()
+        return snapshot
+
+    def render(self):
+        """Returns every value in the prometheus text exposition format."""
+        lines, typed = [], set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (histogram.buckets, list(histogram.counts),
+                                       histogram.sum, histogram.count))
+                                for key, histogram in self.histograms.items())
+        for (name, labels), value in counters:
+            declare(name, 'counter')
+            lines.append(f'{series(name, labels)} {value}')
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{series(name + "_bucket", labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{series(name + "_bucket", labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{series(name + "_sum", labels)} {total}')
+            lines.append(f'{series(name + "_count", labels)} {count}')
+        for name, provider in sorted(self.providers.items()):
+            for key, value in sorted(provider().items()):
+                if isinstance(value, (int, float)):
+                    declare(f'rythmize_{name}_{key}', 'gauge')
+                    lines.append(f'rythmize_{name}_{key} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        """Serves /metrics, to callers sending the bearer token when one is set."""
+        if self.token and not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                                  f'Bearer {self.token}'):
+            return Response('unauthorized', status=401, headers={'WWW-Authenticate': 'Bearer'})
+        return Response(self.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    def before_request(self):
+        _request_ctx_stack.top.timings = RequestTimings()
+
+    def after_request(self, response):
+        """
+        Records the handler latency && sql statements by endpoint,
+        streamed responses are timed until their first byte.
+        """
+        timings = current_timings()
+        if timings is None:
+            return response
+        elapsed = time.perf_counter() - timings.start
+        endpoint = request.endpoint or 'unmatched'
+        self.observe('rythmize_request_seconds', elapsed, endpoint=endpoint,
+                     method=request.method, status=response.status_code)
+        self.observe('rythmize_request_sql_statements', timings.sql_count,
+                     buckets=STATEMENT_BUCKETS, endpoint=endpoint)
+        if self.server_timing:
+            response.headers['Server-Timing'] = ', '.join([
+                f'app;dur={elapsed * 1000:.1f}',
+                f'db;desc="{timings.sql_count} statements";dur={timings.sql_seconds * 1000:.1f}',
+                f'spotify;desc="{timings.spotify_count} calls";dur={timings.spotify_seconds * 1000:.1f}'])
+        return response
+
+    def record_spotify_call(self, operation, status, seconds):
+        """Counts && times one outbound spotify call, by logical operation."""
+        if not self.enabled:
+            return
+        self.inc('rythmize_spotify_requests_total', operation=operation, status=status)
+        self.observe('rythmize_spotify_request_seconds', seconds, operation=operation)
+        timings = current_timings()
+        if timings is not None:
+            timings.spotify_count += 1
+            timings.spotify_seconds += seconds
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    timings = current_timings()
+    if timings is not None:
+        timings.sql_count += 1
+        timings.sql_seconds += elapsed
+
+
+def handle_error(exception_context):
+    if exception_context.connection is not None:
+        starts = exception_context.connection.info.get('query_start')
+        if starts:
+            starts.pop()
+
+
+def listen_to_statements():
+    """Times the statements of every engine, once per process."""
+    if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(Engine, 'handle_error', handle_error)
+
+
+# class instance
+metrics = Metrics()
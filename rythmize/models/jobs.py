@@ -0,0 +1,77 @@
+"""
+TransferJob Model
+tracks a playlist transfer running in the background
+
+"""
+import json
+import uuid
+from datetime import datetime
+
+from ..extensions import db
+from .sync import PlaylistSync  # noqa: F401, target of sync_id
+
+
+class TransferJob(db.Model):
+    """TransferJob class."""
+
+    __tablename__ = 'transfer_job'
+    id = db.Column(db.String(32),
+                   primary_key=True, default=lambda: uuid.uuid4().hex)
+    user_id = db.Column(db.Integer,
+                        db.ForeignKey('user.id'), index=True)
+    playlist = db.Column(db.String(255),
+                         nullable=False)
+    _tracks = db.Column(db.Text(),
+                        nullable=False)
+    status = db.Column(db.String(16),
+                       default='queued', index=True)   # queued, running, done, failed
+    total = db.Column(db.Integer, default=0)
+    resolved = db.Column(db.Integer, default=0)
+    added = db.Column(db.Integer, default=0)
+    failed = db.Column(db.Integer, default=0)
+    snapshot_id = db.Column(db.String(255), nullable=True)
+    sync_id = db.Column(db.Integer,
+                        db.ForeignKey('playlist_sync.id'), nullable=True, index=True)
+    _matches = db.Column(db.Text(), nullable=True)
+    error = db.Column(db.Text(), nullable=True)
+    attempts = db.Column(db.Integer, default=0)     # runs claimed so far
+    created_on = db.Column(db.DateTime(), default=datetime.utcnow)
+    updated_on = db.Column(db.DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def tracks(self):
+        """Songs to transfer, list of {track, artist}."""
+        return json.loads(self._tracks)
+
+    @tracks.setter
+    def tracks(self, value):
+        self._tracks = json.dumps(value)
+        self.total = len(value)
+
+    @property
+    def matches(self):
+        """Matched songs of a finished job, list of {track, artist, uri, confidence}."""
+        return json.loads(self._matches) if self._matches else None
+
+    @matches.setter
+    def matches(self, value):
+        self._matches = json.dumps(value)
+
+    def to_dict(self):
+        """Job status as returned by the api."""
+        return {
+            'id': self.id,
+            'playlist': self.playlist,
+            'status': self.status,
+            'total': self.total,
+            'resolved': self.resolved,
+            'added': self.added,
+            'failed': self.failed,
+            'snapshot_id': self.snapshot_id,
+            'error': self.error,
+            'matches': self.matches,
+            'sync_id': self.sync_id,
+        }
+
+    def __repr__(self):
+        return f'{self.id} {self.status}'
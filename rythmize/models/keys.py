@@ -3,8 +3,8 @@ JwtKeys Model
 stores information about youtube/spotify web tokens
 
 """
-from cryptography.fernet import Fernet
 from flask import current_app
+from sqlalchemy import event
 from sqlalchemy.orm import relationship
 
 from ..extensions import db
@@ -13,11 +13,21 @@ from ..extensions import db
 class Security(object):
     """Handles encryption && decryption."""
 
-    def load_configs(self):
-        """Class constructor."""
-        secret_key = current_app.secret_key
-        # key = Fernet.generate_key()
-        return Fernet(bytes(secret_key, 'utf-8'))
+    @staticmethod
+    def load_configs():
+        """
+        Returns the app keyring, built once per app. SECRET_KEY encrypts,
+        SECRET_KEY_FALLBACKS (older keys) can still decrypt during a rotation.
+        """
+        keyring = current_app.extensions.get('rythmize_keyring')
+        if keyring is None:
+            # cryptography is imported on first use, not on worker boot
+            from cryptography.fernet import Fernet, MultiFernet
+            secret_keys = [current_app.secret_key]
+            secret_keys += current_app.config.get('SECRET_KEY_FALLBACKS') or []
+            keyring = MultiFernet([Fernet(bytes(key, 'utf-8')) for key in secret_keys])
+            current_app.extensions['rythmize_keyring'] = keyring
+        return keyring
 
     def encrypt_data(self, value):
         """Handles Encryption."""
@@ -41,15 +51,20 @@ class BaseClass(Security):
 
     @property
     def refresh_token(self):
-        """Return a decrypted refresh_token."""
-        # decrypt from database
-        return self.decrypt_data(self._refresh_token)
+        """Return a decrypted refresh_token, decrypted once per loaded value."""
+        cached = getattr(self, '_refresh_token_plain', None)
+        if cached is None or cached[0] != self._refresh_token:
+            # decrypt from database
+            cached = (self._refresh_token, self.decrypt_data(self._refresh_token))
+            self._refresh_token_plain = cached
+        return cached[1]
 
     @refresh_token.setter
     def refresh_token(self, value):
         """Encrypt refresh token before store into database."""
         # encrypt refresh_token
         self._refresh_token = self.encrypt_data(value)
+        self._refresh_token_plain = (self._refresh_token, value)
 
     @property
     def expires_in(self):
@@ -58,10 +73,12 @@ class BaseClass(Security):
 
     @expires_in.setter
     def expires_in(self, value):
-        """Property setter, convert to datetime."""
+        """Property setter, value is a datetime or a lifetime in seconds."""
         from datetime import datetime, timedelta
-        # convert from milliseconds to minutes
-        self.token_expires_on = datetime.now() + timedelta(seconds=value),
+        if not isinstance(value, datetime):
+            # convert from seconds to an expiry date
+            value = datetime.now() + timedelta(seconds=value)
+        self.token_expires_on = value
 
     def __repr__(self):
         return self.jwt_token[0:10]
@@ -85,3 +102,48 @@ class SpotifyJsonWebToken(db.Model, BaseClass):
                    primary_key=True)
     user_id = db.Column(db.Integer,
                         db.ForeignKey('user.id'))
+
+
+@event.listens_for(YoutubeJsonWebToken, 'after_update')
+@event.listens_for(YoutubeJsonWebToken, 'after_delete')
+@event.listens_for(SpotifyJsonWebToken, 'after_update')
+@event.listens_for(SpotifyJsonWebToken, 'after_delete')
+def invalidate_identity(mapper, connection, keys):
+    from .user import identity_cache
+    identity_cache.invalidate(keys.user_id)
+
+
+@event.listens_for(SpotifyJsonWebToken, 'after_update')
+@event.listens_for(SpotifyJsonWebToken, 'after_delete')
+def invalidate_client(mapper, connection, keys):
+    from ..clients.registry import client_registry
+    client_registry.invalidate(keys.user_id)
+
+
+def rotate_refresh_tokens(batch_size=500):
+    """
+    Re-encrypts every stored refresh token with the current SECRET_KEY,
+    batch_size rows per commit.
+    Returns:
+        number of rotated rows
+    """
+    keyring = Security.load_configs()
+    rotated = 0
+    for cls in (SpotifyJsonWebToken, YoutubeJsonWebToken):
+        last_id = 0
+        while True:
+            rows = db.session.query(cls.id, cls._refresh_token)\
+                .filter(cls.id > last_id, cls._refresh_token.isnot(None))\
+                .order_by(cls.id).limit(batch_size).all()
+            if not rows:
+                break
+            db.session.bulk_update_mappings(cls, [
+                {'id': row_id, '_refresh_token': keyring.rotate(bytes(token, 'utf-8')).decode()}
+                for row_id, token in rows])
+            db.session.commit()
+            rotated += len(rows)
+            last_id = rows[-1][0]
+    # bulk updates skip the mapper events
+    from .user import identity_cache
+    identity_cache.clear()
+    return rotated
@@ -0,0 +1,42 @@
+"""
+FailedEmail Model
+outbound emails that could not be delivered, kept for replay
+
+"""
+from datetime import datetime
+
+from ..extensions import db, message
+
+
+class FailedEmail(db.Model):
+    """FailedEmail class."""
+
+    __tablename__ = 'failed_email'
+    id = db.Column(db.Integer,
+                   primary_key=True)
+    subject = db.Column(db.String(255),
+                        nullable=False)
+    sender = db.Column(db.String(255),
+                       nullable=True)
+    recipients = db.Column(db.Text(),
+                           nullable=False)    # comma separated
+    body = db.Column(db.Text(),
+                     nullable=True)
+    html = db.Column(db.Text(),
+                     nullable=True)
+    error = db.Column(db.Text(),
+                      nullable=True)
+    created_on = db.Column(db.DateTime(),
+                           default=datetime.utcnow)
+
+    @classmethod
+    def from_message(cls, msg, error=None):
+        return cls(subject=msg.subject, sender=msg.sender, recipients=','.join(msg.recipients),
+                   body=msg.body, html=msg.html, error=error)
+
+    def to_message(self):
+        return message(self.subject, recipients=self.recipients.split(','),
+                       body=self.body, html=self.html, sender=self.sender)
+
+    def __repr__(self):
+        return f'{self.subject} -> {self.recipients}'
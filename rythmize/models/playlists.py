@@ -0,0 +1,105 @@
+"""
+PlaylistIndex Model
+local index of a user's spotify playlists, name -> id and id -> metadata
+
+"""
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+
+from ..extensions import db
+
+
+class PlaylistIndex(db.Model):
+    """PlaylistIndex class, one row per spotify playlist of a user."""
+
+    __tablename__ = 'playlist_index'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'playlist_id'),
+        db.Index('ix_playlist_index_user_name', 'user_id', 'name'),
+    )
+    id = db.Column(db.Integer,
+                   primary_key=True)
+    user_id = db.Column(db.Integer,
+                        db.ForeignKey('user.id'), nullable=False)
+    playlist_id = db.Column(db.String(64),
+                            nullable=False)
+    name = db.Column(db.String(255),
+                     nullable=False)
+    snapshot_id = db.Column(db.String(255),
+                            nullable=True)
+    tracks = db.Column(db.Integer,
+                       default=0)
+    updated_on = db.Column(db.DateTime(),
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @classmethod
+    def lookup(cls, user_id, name):
+        """Returns the id of the user's first playlist called name || None."""
+        row = cls.query.with_entities(cls.playlist_id)\
+            .filter_by(user_id=user_id, name=name).order_by(cls.id).first()
+        return row[0] if row else None
+
+    @classmethod
+    def get(cls, user_id, playlist_id):
+        """Returns the indexed metadata of a playlist || None."""
+        return cls.query.filter_by(user_id=user_id, playlist_id=playlist_id).one_or_none()
+
+    @classmethod
+    def sync(cls, user_id, playlists):
+        """
+        Brings the user's index in line with playlists (spotify playlist
+        objects). Only rows whose snapshot_id or name changed are written.
+        Retried once when a concurrent transfer of the user wrote the same rows.
+        Returns:
+            number of added, updated or removed rows
+        """
+        for attempt in range(2):
+            try:
+                return cls._sync(user_id, playlists)
+            except (IntegrityError, StaleDataError):
+                db.session.rollback()
+                if attempt:
+                    raise
+
+    @classmethod
+    def _sync(cls, user_id, playlists):
+        rows = {row.playlist_id: row for row in cls.query.filter_by(user_id=user_id)}
+        changes = 0
+        for data in playlists:
+            row = rows.pop(data['id'], None)
+            if row is None:
+                db.session.add(cls(user_id=user_id, playlist_id=data['id'], name=data['name'],
+                                   snapshot_id=data.get('snapshot_id'), tracks=data['tracks']['total']))
+                changes += 1
+            elif row.snapshot_id != data.get('snapshot_id') or row.name != data['name']:
+                row.name, row.snapshot_id = data['name'], data.get('snapshot_id')
+                row.tracks = data['tracks']['total']
+                changes += 1
+        for row in rows.values():
+            # deleted or unfollowed on spotify
+            db.session.delete(row)
+            changes += 1
+        db.session.commit()
+        return changes
+
+    @classmethod
+    def insert(cls, user_id, playlist_id, name, snapshot_id=None):
+        """Indexes a playlist created by the client right away."""
+        db.session.add(cls(user_id=user_id, playlist_id=playlist_id, name=name,
+                           snapshot_id=snapshot_id, tracks=0))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # indexed meanwhile by a concurrent refresh
+            db.session.rollback()
+
+    @classmethod
+    def remove(cls, user_id, playlist_id):
+        """Drops the entry of a playlist found deleted || renamed on spotify."""
+        cls.query.filter_by(user_id=user_id, playlist_id=playlist_id).delete(synchronize_session=False)
+        db.session.commit()
+
+    def __repr__(self):
+        return self.name
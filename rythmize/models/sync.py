@@ -0,0 +1,149 @@
+"""
+PlaylistSync Model
+remembers a source -> spotify playlist sync: the songs already synced
+and the destination as it was after the last run, songs synced without
+a match are searched again once TRACK_CACHE_MISS_TTL passed
+
+"""
+import hashlib
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from ..extensions import db
+
+
+class PlaylistSync(db.Model):
+    """PlaylistSync class, one row per (user, source, destination playlist)."""
+
+    __tablename__ = 'playlist_sync'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'source', 'playlist'),
+    )
+    id = db.Column(db.Integer,
+                   primary_key=True)
+    user_id = db.Column(db.Integer,
+                        db.ForeignKey('user.id'), nullable=False)
+    source = db.Column(db.String(255),
+                       nullable=False)     # source playlist, as named by the caller
+    playlist = db.Column(db.String(255),
+                         nullable=False)   # destination playlist name
+    playlist_id = db.Column(db.String(64),
+                            nullable=True)
+    snapshot_id = db.Column(db.String(255),
+                            nullable=True)  # destination snapshot after the last run
+    created_on = db.Column(db.DateTime(),
+                           default=datetime.utcnow)
+    synced_on = db.Column(db.DateTime(),
+                          nullable=True)
+    tracks = db.relationship('PlaylistSyncTrack', lazy='dynamic',
+                             cascade='all, delete, delete-orphan')
+
+    @classmethod
+    def get_or_create(cls, user_id, source, playlist):
+        sync = cls.query.filter_by(user_id=user_id, source=source, playlist=playlist).one_or_none()
+        if sync is None:
+            sync = cls(user_id=user_id, source=source, playlist=playlist)
+            db.session.add(sync)
+            db.session.commit()
+        return sync
+
+    @staticmethod
+    def miss_cutoff():
+        """Songs recorded without a match before this are synced again."""
+        return datetime.utcnow() - timedelta(seconds=current_app.config.get('TRACK_CACHE_MISS_TTL', 6 * 3600))
+
+    def synced_keys(self):
+        """Row keys of the songs synced so far, expired misses left out."""
+        rows = db.session.query(PlaylistSyncTrack.key)\
+            .filter(PlaylistSyncTrack.sync_id == self.id, PlaylistSyncTrack.key.isnot(None),
+                    db.or_(PlaylistSyncTrack.uri.isnot(None),
+                           PlaylistSyncTrack.synced_on >= self.miss_cutoff()))
+        return {row.key for row in rows}
+
+    def new_songs(self, songs, song_key):
+        """
+        Songs not synced yet, the first of each key.
+        song_key(song) identifies a song across runs.
+        """
+        seen = self.synced_keys()
+        pending = []
+        for song in songs:
+            key = PlaylistSyncTrack.row_key(song_key(song))
+            if key not in seen:
+                seen.add(key)
+                pending.append(song)
+        return pending
+
+    def uris(self):
+        """Uris of the destination as it was after the last run."""
+        rows = db.session.query(PlaylistSyncTrack.uri)\
+            .filter(PlaylistSyncTrack.sync_id == self.id, PlaylistSyncTrack.uri.isnot(None))
+        return {row.uri for row in rows}
+
+    def record(self, playlist_id, snapshot_id, synced, destination=None):
+        """
+        Saves a run.
+        Params:
+            synced: {song key: uri || None when nothing matched}
+            destination: uris fetched from the destination playlist, replacing
+                         the ones recorded before, || None when it wasn't fetched
+        """
+        if destination is not None:
+            self.tracks.filter(PlaylistSyncTrack.key.is_(None)).delete(synchronize_session=False)
+            db.session.add_all(PlaylistSyncTrack(sync_id=self.id, uri=uri) for uri in destination)
+        # expired misses are recorded again
+        self.tracks.filter(PlaylistSyncTrack.key.isnot(None), PlaylistSyncTrack.uri.is_(None),
+                           db.or_(PlaylistSyncTrack.synced_on.is_(None),
+                                  PlaylistSyncTrack.synced_on < self.miss_cutoff()))\
+            .delete(synchronize_session=False)
+        seen, now = self.synced_keys(), datetime.utcnow()
+        for key, uri in synced.items():
+            key = PlaylistSyncTrack.row_key(key)
+            if key not in seen:
+                seen.add(key)
+                db.session.add(PlaylistSyncTrack(sync_id=self.id, key=key, uri=uri, synced_on=now))
+        self.playlist_id, self.snapshot_id = playlist_id, snapshot_id
+        self.synced_on = datetime.utcnow()
+        db.session.commit()
+
+    def to_dict(self):
+        """Sync state as returned by the api."""
+        return {
+            'id': self.id,
+            'source': self.source,
+            'playlist': self.playlist,
+            'playlist_id': self.playlist_id,
+            'snapshot_id': self.snapshot_id,
+            'synced': len(self.synced_keys()),
+            'synced_on': self.synced_on.isoformat() if self.synced_on else None,
+        }
+
+    def __repr__(self):
+        return f'{self.source} -> {self.playlist}'
+
+
+class PlaylistSyncTrack(db.Model):
+    """
+    PlaylistSyncTrack class, a synced song (key) and the uri it was
+    matched to, || a destination track found when the playlist was read (no key).
+    """
+
+    __tablename__ = 'playlist_sync_track'
+    __table_args__ = (
+        db.UniqueConstraint('sync_id', 'key'),
+    )
+    id = db.Column(db.Integer,
+                   primary_key=True)
+    sync_id = db.Column(db.Integer,
+                        db.ForeignKey('playlist_sync.id'), nullable=False, index=True)
+    key = db.Column(db.String(64),
+                    nullable=True)      # sha1 of the song key
+    uri = db.Column(db.String(255),
+                    nullable=True)
+    synced_on = db.Column(db.DateTime(),
+                          nullable=True)    # set for synced songs
+
+    @staticmethod
+    def row_key(key):
+        return hashlib.sha1(key.encode()).hexdigest()
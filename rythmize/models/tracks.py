@@ -0,0 +1,18 @@
+"""
+TrackResolution Model
+caches the spotify uri found for a normalized (track, artist) search
+
+"""
+from ..extensions import db
+
+
+class TrackResolution(db.Model):
+    """TrackResolution class, uri is null when the search found nothing."""
+
+    __tablename__ = 'track_resolution'
+    key = db.Column(db.String(64),
+                    primary_key=True)     # sha1 of the normalized (track, artist)
+    uri = db.Column(db.String(255),
+                    nullable=True)
+    expires_on = db.Column(db.DateTime(),
+                           nullable=False, index=True)
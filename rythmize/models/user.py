@@ -2,11 +2,69 @@
 User Model
 
 """
+from flask import _request_ctx_stack
 from marshmallow import fields
-from sqlalchemy.orm import relationship, validates
-from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import (joinedload, make_transient_to_detached,
+                            relationship, validates)
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 
-from ..extensions import db, ma
+from ..cache import LRUCache
+from ..extensions import db, hasher, ma
+from ..metrics import metrics
+
+
+def detached_copy(obj):
+    """Copies the loaded columns of obj into a new detached instance."""
+    mapper = inspect(obj).mapper
+    copy = mapper.class_manager.new_instance()
+    for column in mapper.column_attrs:
+        set_committed_value(copy, column.key, getattr(obj, column.key))
+    make_transient_to_detached(copy)
+    return copy
+
+
+class IdentityCache(object):
+    """
+    Caches authenticated users with their keys across requests, so
+    auth_required routes skip the user lookup while an entry is fresh.
+    Entries are detached copies, merged into the request session on a hit.
+    """
+
+    def __init__(self):
+        self._cache = LRUCache()
+
+    def init_app(self, app):
+        self._cache = LRUCache(app.config.get('IDENTITY_CACHE_SIZE', 10000),
+                               app.config.get('IDENTITY_CACHE_TTL', 30))
+        metrics.register('identity_cache', self.stats)
+
+    def get(self, user_id):
+        return self._cache.get(user_id)
+
+    def set(self, user):
+        """Stores a detached copy of user, spotify_keys && youtube_keys."""
+        copy = detached_copy(user)
+        for relation in ('spotify_keys', 'youtube_keys'):
+            keys = getattr(user, relation)
+            set_committed_value(copy, relation, keys and detached_copy(keys))
+        self._cache.set(user.id, copy)
+
+    def invalidate(self, user_id):
+        self._cache.pop(user_id)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        lookups = self._cache.hits + self._cache.misses
+        return {'hits': self._cache.hits, 'misses': self._cache.misses, 'size': len(self._cache),
+                'hit_rate': self._cache.hits / lookups if lookups else 0.0}
+
+
+# class instance
+identity_cache = IdentityCache()
 
 
 class FlaskApiSecurity(object):
@@ -25,7 +83,28 @@ class FlaskApiSecurity(object):
 
     @classmethod
     def identify(cls, id):
-        return cls.query.get(id)
+        """
+        Loads the user with its spotify/youtube keys in one query,
+        reused for the rest of the request and cached for IDENTITY_CACHE_TTL.
+        Read from the replica in views decorated with use_replica.
+        """
+        ctx = _request_ctx_stack.top
+        user = getattr(ctx, 'identity', None)
+        if user is None or user.id != id:
+            # an instance already in the session may hold pending changes
+            user = db.session.identity_map.get(identity_key(cls, id))
+            if user is None:
+                cached = identity_cache.get(id)
+                if cached is not None:
+                    user = db.session.merge(cached, load=False)
+                else:
+                    user = cls.query.options(joinedload('spotify_keys'),
+                                             joinedload('youtube_keys')).get(id)
+                    if user is not None:
+                        identity_cache.set(user)
+            if ctx is not None:
+                ctx.identity = user
+        return user
 
     @property
     def identity(self):
@@ -44,7 +123,7 @@ class User(db.Model, FlaskApiSecurity):
         nullable=False, unique=True)
     email = db.Column(
         db.String(255),
-        nullable=False)
+        nullable=False, unique=True, index=True)    # stored lowercased
     email_confirmed = db.Column(
         db.Boolean,
         default=False)
@@ -56,6 +135,11 @@ class User(db.Model, FlaskApiSecurity):
     youtube_keys = db.relationship("YoutubeJsonWebToken",
                                    uselist=False, cascade="all, delete, delete-orphan")
 
+    @validates('email')
+    def normalize_email(self, key, email):
+        """Emails are unique case-insensitively, store them lowercased."""
+        return email.strip().lower() if email else email
+
     @property
     def password(self):
         """Getter for password."""
@@ -64,17 +148,28 @@ class User(db.Model, FlaskApiSecurity):
     @password.setter
     def password(self, user_password):
         """Password protection."""
-        self._password = generate_password_hash(user_password)
+        self._password = hasher.hash(user_password)
 
     def check_password(self, plaintext_pass):
         """Checks if plaintext_pass equals password."""
-        return check_password_hash(self.password, plaintext_pass)
+        return hasher.verify(self.password, plaintext_pass)
+
+    @property
+    def password_outdated(self):
+        """True when the stored hash doesn't use the configured scheme && costs."""
+        return hasher.needs_rehash(self.password)
 
     def __repr__(self):
         """Represents a user class."""
         return self.username
 
 
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_identity(mapper, connection, user):
+    identity_cache.invalidate(user.id)
+
+
 class UserSchema(ma.Schema):
     """Marshmallow serializer/deserializer schema."""
     class Meta:
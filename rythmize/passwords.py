@@ -0,0 +1,124 @@
+"""
+Password hashing module
+pluggable hashers (pbkdf2, scrypt, argon2) with configurable costs.
+"""
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+def _argon2_hasher(params):
+    """argon2 is optional: pip install argon2-cffi."""
+    try:
+        from argon2 import PasswordHasher as Argon2Hasher
+    except ImportError:
+        raise RuntimeError("PASSWORD_HASHER=argon2 requires the argon2-cffi package")
+    return Argon2Hasher(time_cost=params['time_cost'], memory_cost=params['memory_cost'],
+                        parallelism=params['parallelism'])
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+                          maxmem=256 * r * (n + p + 2), dklen=64).hex()
+
+
+def hash_password(scheme, params, password):
+    """Hashes password with scheme, module level so it can run in a worker process."""
+    if scheme == 'pbkdf2':
+        return generate_password_hash(password, method=f"pbkdf2:sha256:{params['iterations']}",
+                                      salt_length=16)
+    if scheme == 'scrypt':
+        salt = os.urandom(16).hex()
+        digest = _scrypt(password, salt, params['n'], params['r'], params['p'])
+        return f"scrypt:{params['n']}:{params['r']}:{params['p']}${salt}${digest}"
+    if scheme == 'argon2':
+        return _argon2_hasher(params).hash(password)
+    raise ValueError(f"Unknown password hasher {scheme}")
+
+
+def verify_password(stored, password):
+    """Checks password against a hash of any supported scheme."""
+    if not stored or password is None:
+        return False
+    if stored.startswith('scrypt:'):
+        method, salt, digest = stored.split('$', 2)
+        _, n, r, p = method.split(':')
+        return hmac.compare_digest(_scrypt(password, salt, int(n), int(r), int(p)), digest)
+    if stored.startswith('$argon2'):
+        from argon2.exceptions import VerificationError
+        try:
+            # the costs are read from the hash itself
+            return _argon2_hasher(PasswordHasher.defaults['argon2']).verify(stored, password)
+        except VerificationError:
+            return False
+    # werkzeug formats, including hashes made before hashers were configurable
+    return check_password_hash(stored, password)
+
+
+class PasswordHasher(object):
+    """
+    Hashes and verifies passwords with PASSWORD_HASHER and its PASSWORD_*
+    cost settings. With PASSWORD_HASH_WORKERS > 0 the work runs on a
+    bounded process pool, so hashing doesn't hold the GIL of the
+    request threads.
+    """
+    defaults = {
+        'pbkdf2': {'iterations': 260000},
+        'scrypt': {'n': 2 ** 15, 'r': 8, 'p': 1},
+        'argon2': {'time_cost': 3, 'memory_cost': 65536, 'parallelism': 4},
+    }
+
+    def __init__(self, scheme='pbkdf2', params=None, workers=0):
+        self.scheme = scheme
+        self.params = dict(self.defaults[scheme], **(params or {}))
+        self.workers = workers
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.scheme = app.config.get('PASSWORD_HASHER', 'pbkdf2')
+        prefix = f'PASSWORD_{self.scheme.upper()}_'
+        self.params = {name: app.config.get(prefix + name.upper(), default)
+                       for name, default in self.defaults[self.scheme].items()}
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 0)
+
+    @property
+    def pool(self):
+        """Process pool, created once per process (gunicorn forks after import)."""
+        if not self.workers:
+            return None
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _call(self, func, *args):
+        pool = self.pool
+        if pool is None:
+            return func(*args)
+        return pool.submit(func, *args).result()
+
+    def hash(self, password):
+        """Returns a hash of password with the current scheme and costs."""
+        return self._call(hash_password, self.scheme, self.params, password)
+
+    def verify(self, stored, password):
+        """True if password matches stored."""
+        return self._call(verify_password, stored, password)
+
+    def needs_rehash(self, stored):
+        """True if stored uses another scheme or other costs than the current ones."""
+        if self.scheme == 'pbkdf2':
+            return not stored.startswith(f"pbkdf2:sha256:{self.params['iterations']}$")
+        if self.scheme == 'scrypt':
+            return not stored.startswith('scrypt:{n}:{r}:{p}$'.format(**self.params))
+        if not stored.startswith('$argon2'):
+            return True
+        return _argon2_hasher(self.params).check_needs_rehash(stored)
@@ -0,0 +1,385 @@
+"""
+Background tasks module
+in-process queue drained by worker threads, and the transfer job.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from .extensions import db_manager
+from .models.jobs import TransferJob
+from .models.sync import PlaylistSync
+
+logger = logging.getLogger(__name__)
+
+
+class TaskQueue(object):
+    """
+    In-process task queue, every task runs on a worker thread inside
+    an app context. Workers are read from <NAME>_WORKERS, with 0 tasks
+    wait until run_pending() drains them (used by tests).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.app = None
+        self.workers = 0
+        self._queue = queue.Queue()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get(f'{self.name.upper()}_WORKERS', 0)
+
+    def put(self, func, *args):
+        """Queues func(*args)."""
+        self._queue.put((func, args))
+        self._start_workers()
+
+    def _start_workers(self):
+        """Starts the worker threads once per process (gunicorn forks after import)."""
+        if not self.workers or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            for number in range(self.workers):
+                threading.Thread(target=self._work, daemon=True,
+                                 name=f'{self.name}-worker-{number}').start()
+            self._pid = os.getpid()
+
+    def _work(self):
+        while True:
+            func, args = self._queue.get()
+            self._run(func, args)
+
+    def _run(self, func, args):
+        with self.app.app_context():
+            try:
+                func(*args)
+            except Exception:
+                logger.exception('%s task %s failed', self.name, func.__name__)
+
+    def run_pending(self):
+        """Runs every queued task in the current thread."""
+        while True:
+            try:
+                func, args = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._run(func, args)
+
+    def __len__(self):
+        return self._queue.qsize()
+
+
+class PeriodicTask(object):
+    """Runs func every <NAME>_INTERVAL seconds on a daemon thread, 0 disables it."""
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.app = None
+        self.interval = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get(f'{self.name.upper()}_INTERVAL', 0)
+        # started by the first request, so every gunicorn worker gets its own thread
+        app.before_first_request(self.start)
+
+    def start(self):
+        if not self.interval or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._loop, daemon=True, name=self.name).start()
+            self._pid = os.getpid()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.run()
+
+    def run(self):
+        with self.app.app_context():
+            try:
+                self.func()
+            except Exception:
+                logger.exception('periodic task %s failed', self.name)
+
+
+def refresh_expiring_tokens():
+    """
+    Refreshes the spotify tokens of recently active users before they
+    expire, so their requests never wait on a refresh.
+    Returns:
+        number of refreshed tokens
+    """
+    from datetime import datetime, timedelta
+
+    from flask import current_app
+
+    from .clients.spotify import SpotifyClient, active_users
+    from .models.user import User
+
+    now = datetime.now()
+    active_since = now - timedelta(seconds=current_app.config.get('TOKEN_REFRESHER_ACTIVE', 3600))
+    refreshed = 0
+    for user_id, last_seen in list(active_users.items()):
+        if last_seen < active_since:
+            active_users.pop(user_id, None)
+            continue
+        user = User.identify(user_id)
+        if user is None or user.spotify_keys is None:
+            continue
+        sclient = SpotifyClient(None, user)
+        if not (sclient.token and sclient.expires):
+            continue
+        # one interval ahead of the request-time window, so the next run isn't too late
+        ahead = sclient.expires - timedelta(seconds=token_refresher.interval)
+        if sclient.token_expiring(ahead) and sclient.refresh_token_once():
+            refreshed += 1
+    return refreshed
+
+
+class MailOutbox(TaskQueue):
+    """
+    Outbound mail queue. Workers (MAIL_WORKERS) take up to MAIL_BATCH_SIZE
+    messages at once and send them over a single SMTP connection, retrying
+    with backoff. Messages still failing are saved as FailedEmail for replay.
+    """
+
+    def __init__(self):
+        super().__init__('mail')
+        self.batch_size = 20
+        self.retries = 3
+        self.backoff = 2.0
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.batch_size = app.config.get('MAIL_BATCH_SIZE', self.batch_size)
+        self.retries = app.config.get('MAIL_RETRIES', self.retries)
+        self.backoff = app.config.get('MAIL_RETRY_BACKOFF', self.backoff)
+
+    def send(self, msg):
+        """Queues msg, returns right away."""
+        self._queue.put(msg)
+        self._start_workers()
+
+    def _next_batch(self, first):
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        while True:
+            self._run_batch(self._next_batch(self._queue.get()))
+
+    def run_pending(self):
+        """Sends every queued message in the current thread."""
+        while True:
+            try:
+                first = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._run_batch(self._next_batch(first))
+
+    def _run_batch(self, batch):
+        with self.app.app_context():
+            try:
+                self.send_batch(batch)
+            except Exception:
+                logger.exception('mail batch failed')
+
+    def send_batch(self, batch):
+        """
+        Sends batch over one connection, resuming after the last sent
+        message on failure. A message the server rejects for good (5xx ||
+        refused recipients) is saved right away, the rest keep going.
+        Returns:
+            number of messages saved as FailedEmail
+        """
+        from smtplib import SMTPException, SMTPRecipientsRefused, SMTPResponseException
+
+        from .extensions import mail
+        from .models.mail import FailedEmail
+
+        pending, rejected, error = list(batch), [], None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                with mail.connect() as connection:
+                    while pending:
+                        try:
+                            connection.send(pending[0])
+                        except (SMTPRecipientsRefused, SMTPResponseException) as smtp_error:
+                            if not self.permanent(smtp_error):
+                                raise
+                            logger.warning('mail to %s rejected: %s', pending[0].recipients, smtp_error)
+                            rejected.append((pending[0], smtp_error))
+                        pending.pop(0)
+                break
+            except (SMTPException, OSError) as smtp_error:
+                error = smtp_error
+                logger.warning('mail batch attempt %s failed: %s', attempt + 1, smtp_error)
+        rejected.extend((msg, error) for msg in pending)
+        for msg, smtp_error in rejected:
+            db_manager.add(FailedEmail.from_message(msg, error=str(smtp_error)))
+        if rejected:
+            db_manager.save()
+        return len(rejected)
+
+    @staticmethod
+    def permanent(smtp_error):
+        """True for 5xx replies, sending the message again won't help."""
+        from smtplib import SMTPRecipientsRefused
+
+        if isinstance(smtp_error, SMTPRecipientsRefused):
+            return min(code for code, _ in smtp_error.recipients.values()) >= 500
+        return smtp_error.smtp_code >= 500
+
+    def replay_failed(self):
+        """
+        Queues every saved FailedEmail again.
+        Returns:
+            number of queued messages
+        """
+        from .models.mail import FailedEmail
+
+        failed = FailedEmail.query.order_by(FailedEmail.id).all()
+        for row in failed:
+            self.send(row.to_message())
+            db_manager.remove(row)
+        db_manager.save()
+        return len(failed)
+
+
+def claim_transfer_job(job_id=None):
+    """
+    Marks a queued job as running: job_id, || the oldest one. The claim is
+    a conditional update, when processes race for a job only one wins it.
+    Returns:
+        job id || None
+    """
+    if job_id is not None:
+        candidates = [job_id]
+    else:
+        candidates = [row.id for row in TransferJob.query.with_entities(TransferJob.id)
+                      .filter_by(status='queued').order_by(TransferJob.created_on).limit(10)]
+    for candidate in candidates:
+        claimed = TransferJob.query.filter_by(id=candidate, status='queued').update(
+            {TransferJob.status: 'running', TransferJob.attempts: TransferJob.attempts + 1},
+            synchronize_session=False)
+        db_manager.save()
+        if claimed:
+            return candidate
+    return None
+
+
+def recover_stale_transfer_jobs():
+    """
+    Jobs whose progress wasn't saved for TRANSFER_JOB_TIMEOUT seconds were
+    left by a process that died: running ones are requeued while they
+    have attempts left (TRANSFER_JOB_ATTEMPTS) && failed after. With the
+    memory queue, stale queued jobs are handed to the workers again.
+    Returns:
+        number of recovered jobs
+    """
+    config = current_app.config
+    cutoff = datetime.utcnow() - timedelta(seconds=config.get('TRANSFER_JOB_TIMEOUT', 900))
+    memory = config.get('TRANSFER_QUEUE', 'memory') == 'memory'
+    statuses = ('queued', 'running') if memory else ('running',)
+    stale = TransferJob.query.filter(TransferJob.status.in_(statuses),
+                                     TransferJob.updated_on < cutoff).all()
+    recovered, requeued = 0, []
+    for job in stale:
+        if job.status == 'running' and job.attempts >= config.get('TRANSFER_JOB_ATTEMPTS', 3):
+            values = {TransferJob.status: 'failed', TransferJob.error: 'worker lost'}
+        else:
+            values = {TransferJob.status: 'queued'}
+        # a job saved meanwhile isn't stale anymore
+        if TransferJob.query.filter_by(id=job.id, status=job.status, updated_on=job.updated_on)\
+                .update(values, synchronize_session=False):
+            recovered += 1
+            if values[TransferJob.status] == 'queued':
+                requeued.append(job.id)
+    db_manager.save()
+    if memory:
+        for job_id in requeued:
+            transfer_queue.put(run_transfer_job, job_id)
+    return recovered
+
+
+# class instance
+transfer_queue = TaskQueue('transfer')
+mail_outbox = MailOutbox()
+token_refresher = PeriodicTask('token_refresher', refresh_expiring_tokens)
+transfer_reaper = PeriodicTask('transfer_reaper', recover_stale_transfer_jobs)
+
+
+def enqueue_transfer(job):
+    """Hands a saved job to the in-process workers, unless a worker process polls the table."""
+    if transfer_queue.app.config.get('TRANSFER_QUEUE', 'memory') == 'memory':
+        transfer_queue.put(run_transfer_job, job.id)
+
+
+def run_transfer_job(job_id, claimed=False):
+    """
+    Runs a transfer job, saving its progress as it goes. The job is
+    claimed first unless the caller already did.
+    """
+    from .clients.spotify import call_spotify
+
+    if not claimed and claim_transfer_job(job_id) is None:
+        # done, failed || run by another worker
+        return
+    job = TransferJob.query.get(job_id)
+    if job is None:
+        return
+    last_saved = [time.monotonic()]
+
+    def progress(**counters):
+        """Updates the job counters, committed at most once per second."""
+        for attr, value in counters.items():
+            setattr(job, attr, value)
+        if time.monotonic() - last_saved[0] >= 1:
+            job.updated_on = datetime.utcnow()   # heartbeat, see recover_stale_transfer_jobs
+            db_manager.save()
+            last_saved[0] = time.monotonic()
+
+    if job.sync_id:
+        # incremental sync, job.tracks holds the new songs only
+        method, args = 'perform_sync_tracks', (PlaylistSync.query.get(job.sync_id), job.tracks)
+    else:
+        method, args = 'perform_transfer_tracks', (job.playlist, job.tracks)
+    try:
+        authenticated, result = call_spotify(job.user_id, method, *args,
+                                             progress=progress)
+        if not authenticated:
+            job.status, job.error = 'failed', 'user not authorized'
+        elif result is None:
+            job.status, job.error = 'failed', 'failed to add tracks'
+        else:
+            job.status, job.snapshot_id = 'done', result['snapshot_id']
+            job.matches = result['matches']
+    except Exception as error:
+        logger.exception('transfer job %s failed', job_id)
+        db_manager.rollback()
+        job = TransferJob.query.get(job_id)
+        job.status, job.error = 'failed', str(error)
+    db_manager.save()
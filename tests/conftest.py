@@ -0,0 +1,108 @@
+"""Shared test fixtures."""
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from helpers import TestingConfig
+from requests import Response
+from requests.adapters import BaseAdapter
+
+from rythmize import create_app, db
+from rythmize.clients.resolution import MemoryBackend, track_cache
+from rythmize.clients.spotify import SpotifyClient
+from rythmize.clients.transport import HttpTransport, transport
+from rythmize.extensions import guard
+from rythmize.models.keys import SpotifyJsonWebToken, YoutubeJsonWebToken
+from rythmize.models.user import User
+
+
+class StubAdapter(BaseAdapter):
+    """
+    Transport adapter standing in for spotify.
+    handler(request) returns (status, payload[, headers]) or a payload for a 200.
+    """
+
+    def __init__(self, handler):
+        super().__init__()
+        self.handler, self.sent = handler, []
+
+    def send(self, request, **kwargs):
+        self.sent.append((request, kwargs))
+        result = self.handler(request)
+        status, payload, headers = (result + ({},))[:3] if isinstance(result, tuple) else (200, result, {})
+        response = Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response._content = json.dumps(payload).encode()
+        response.request, response.url = request, request.url
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def memory_track_cache(monkeypatch):
+    """Empty in-memory track cache, the previous backend is restored after the test."""
+    backend = MemoryBackend()
+    monkeypatch.setattr(track_cache, 'backend', backend)
+    return backend
+
+
+@pytest.fixture
+def stub_spotify():
+    """Returns a factory: stub_spotify(handler) -> (client, adapter)."""
+    def factory(handler, user_id=1):
+        http = HttpTransport()
+        adapter = StubAdapter(handler)
+        http.mount('https://', adapter)
+        keys = SimpleNamespace(jwt_token='token', refresh_token='refresh',
+                               expires_in=datetime.now() + timedelta(hours=1))
+        client = SpotifyClient(None, SimpleNamespace(id=user_id, spotify_keys=keys))
+        client.http = http
+        return client, adapter
+    return factory
+
+
+@pytest.fixture
+def app():
+    """App with a fresh database, the app context stays pushed."""
+    app = create_app(TestingConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def user(app):
+    """Registered user, connected to spotify with a valid access token."""
+    user = User(username='user', email='user@example.com', password='password')
+    user.spotify_keys = SpotifyJsonWebToken(jwt_token='token')
+    user.spotify_keys.refresh_token = 'refresh'
+    user.spotify_keys.token_expires_on = datetime.now() + timedelta(hours=1)
+    user.youtube_keys = YoutubeJsonWebToken()
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def auth_headers(user):
+    return {'Authorization': f'Bearer {guard.encode_jwt_token(user)}'}
+
+
+@pytest.fixture
+def spotify_api(monkeypatch):
+    """Routes the shared transport to a stub: spotify_api(handler) -> adapter."""
+    monkeypatch.setattr(SpotifyClient, 'client_id', 'client-id')
+    monkeypatch.setattr(SpotifyClient, 'client_secret', 'client-secret')
+
+    def mount(handler):
+        adapter = StubAdapter(handler)
+        transport.mount('https://', adapter)
+        return adapter
+    yield mount
+    transport.unmount('https://')
@@ -0,0 +1,166 @@
+"""Fakes && helpers shared by the tests."""
+import json
+import re
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlparse
+
+from cryptography.fernet import Fernet
+from sqlalchemy import event
+
+from config import Config
+from rythmize import db
+
+
+class TestingConfig(Config):
+    """Config for tests, in-memory sqlite."""
+    TESTING = True
+    SECRET_KEY = Fernet.generate_key().decode()
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    JWT_ACCESS_LIFESPAN = {'hours': 1}
+    JWT_REFRESH_LIFESPAN = {'days': 1}
+    MAIL_SUPPRESS_SEND = True
+    TRANSFER_WORKERS = 0
+    MAIL_WORKERS = 0
+    PASSWORD_PBKDF2_ITERATIONS = 1000   # fast tests
+    TOKEN_REFRESHER_INTERVAL = 0
+    TRANSFER_REAPER_INTERVAL = 0
+    METRICS_ENABLED = True
+
+
+def search_result(url, uri):
+    """Search response whose only candidate is the searched track && artist."""
+    query = parse_qs(urlparse(url).query)['q'][0]
+    fields = re.fullmatch(r'track:(.*) artist:(.*)', query)
+    name, artist = fields.groups() if fields else (query, '')     # relaxed query
+    return {'tracks': {'items': [{'uri': uri, 'name': name, 'artists': [{'name': artist}]}]}}
+
+
+def fake_spotify(request):
+    """Minimal spotify: no playlists yet, every search finds one track."""
+    url = request.url
+    if '/search' in url:
+        if 'unknown' in url:
+            return {'tracks': {'items': []}}
+        return search_result(url, f'spotify:track:{abs(hash(url))}')
+    if request.method == 'POST' and url.endswith('/users/spotify-user/playlists'):
+        return 201, {'id': 'new-playlist'}
+    if request.method == 'POST' and url.endswith('/playlists/new-playlist/tracks'):
+        return 201, {'snapshot_id': 'snapshot'}
+    if url.endswith('/me/'):
+        return {'id': 'spotify-user'}
+    return {'items': [], 'next': None}
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def get(app, route, headers):
+    db.session.remove()     # start from an empty identity map, like a new request
+    return app.test_client().get(route, headers=headers)
+
+
+def track(number):
+    return {'id': f'id{number}', 'name': f'song{number}', 'uri': f'spotify:track:id{number}',
+            'duration_ms': 180000, 'album': {'name': 'album', 'artists': [{'name': 'artist'}]}}
+
+
+def paging(items):
+    """Serves items as spotify paging objects."""
+    def handler(request):
+        url = urlparse(request.url)
+        params = {k: int(v[0]) for k, v in parse_qs(url.query).items()}
+        offset, limit = params.get('offset', 0), params.get('limit', 20)
+        following = offset + limit
+        next_url = None
+        if following < len(items):
+            next_url = f'https://{url.netloc}{url.path}?offset={following}&limit={limit}'
+        return {'items': items[offset:following], 'next': next_url, 'total': len(items)}
+    return handler
+
+
+def throttled(handler, times, retry_after='0'):
+    """Answers the first `times` calls with a 429, then defers to handler."""
+    calls = []
+
+    def wrapper(request):
+        calls.append(request.url)
+        if len(calls) <= times:
+            return 429, {'error': {'status': 429}}, {'Retry-After': retry_after}
+        return handler(request)
+    return wrapper
+
+
+def playlist(playlist_id, name, snapshot_id='s1'):
+    return {'id': playlist_id, 'name': name, 'snapshot_id': snapshot_id, 'tracks': {'total': 0}}
+
+
+def spotify(playlists, requests):
+    def handler(request):
+        requests.append((request.method, request.url.split('?')[0]))
+        url = request.url
+        if request.method == 'POST' and url.endswith('/users/spotify-user/playlists'):
+            created = playlist(f'p{len(playlists)}', json.loads(request.body)['name'])
+            playlists.append(created)
+            return 201, created
+        if request.method == 'POST':
+            return 201, {'snapshot_id': 's2'}
+        if '/search' in url:
+            return {'tracks': {'items': [{'uri': 'spotify:track:song'}]}}
+        if url.endswith('/me/'):
+            return {'id': 'spotify-user'}
+        if '/me/playlists' in url:
+            return {'items': playlists, 'next': None}
+        path = url.split('?')[0]
+        if '/playlists/' in path and not path.endswith('/tracks'):
+            found = [data for data in playlists if path.endswith(f'/playlists/{data["id"]}')]
+            return found[0] if found else (404, {})
+        return {'items': [], 'next': None}
+    return handler
+
+
+class FakePlaylist(object):
+    """Spotify with one user && the playlists it creates, requests are logged."""
+
+    def __init__(self):
+        self.tracks, self.snapshot, self.requests = [], None, []
+
+    def add(self, uris):
+        self.tracks.extend({'track': {'id': uri.rsplit(':', 1)[-1], 'name': uri, 'uri': uri,
+                                      'duration_ms': 1000, 'album': {'name': '', 'artists': [{'name': ''}]}}}
+                           for uri in uris)
+        self.snapshot = f'snapshot{len(self.tracks)}'
+
+    def __call__(self, request):
+        path = urlparse(request.url).path
+        self.requests.append((request.method, path))
+        if path.endswith('/search'):
+            result = search_result(request.url, None)
+            item = result['tracks']['items'][0]
+            item['uri'] = f'spotify:track:{item["name"]}'
+            return result
+        if path.endswith('/me/'):
+            return {'id': 'spotify-user'}
+        if path.endswith('/me/playlists'):
+            return {'items': [], 'next': None}
+        if request.method == 'POST' and path.endswith('/users/spotify-user/playlists'):
+            self.snapshot = 'snapshot0'
+            return 201, {'id': 'mix', 'snapshot_id': self.snapshot}
+        if request.method == 'POST' and path.endswith('/playlists/mix/tracks'):
+            self.add(json.loads(request.body)['uris'])
+            return 201, {'snapshot_id': self.snapshot}
+        if path.endswith('/playlists/mix/tracks'):
+            return paging(self.tracks)(request)
+        if path.endswith('/playlists/mix'):
+            return {'snapshot_id': self.snapshot}
+        return 404, {}
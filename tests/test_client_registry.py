@@ -0,0 +1,48 @@
+"""Validated spotify tokens are kept by user, until the keys change."""
+from datetime import datetime, timedelta
+
+from helpers import count_statements, get
+
+from rythmize.clients.registry import client_registry
+from rythmize.clients.spotify import SpotifyClient
+from rythmize.extensions import db_manager
+from rythmize.models.user import User
+
+STATUS = '/api/v1/auth/connect/spotify/status'
+
+
+def test_second_request_skips_user_and_keys(app, user, auth_headers, monkeypatch):
+    assert get(app, STATUS, auth_headers).status_code == 200
+    assert client_registry.get(user.id).token == 'token'
+
+    def identify(user_id):
+        raise AssertionError('user loaded')
+    monkeypatch.setattr(User, 'identify', identify)
+    with count_statements() as statements:
+        response = get(app, STATUS, auth_headers)
+    assert response.status_code == 200
+    assert statements == []
+    assert client_registry.stats()['hits'] >= 1
+
+
+def test_key_update_invalidates(app, user, auth_headers):
+    get(app, STATUS, auth_headers)
+    db_manager.update_key_table(user.id, jwt_token='new-token')
+    assert client_registry.get(user.id) is None
+    get(app, STATUS, auth_headers)
+    assert client_registry.get(user.id).headers['Authorization'] == 'Bearer new-token'
+
+
+def test_expiring_tokens_are_left_to_handle_auth(app, user):
+    client_registry.set(user.id, 'token', datetime.now() + timedelta(seconds=30), {})
+    assert client_registry.get(user.id, SpotifyClient.refresh_window) is None
+    client = SpotifyClient.for_user(user.id)
+    # built from the user && its keys
+    assert client.keys is User.identify(user.id).spotify_keys
+
+
+def test_registry_headers_are_copied(app, user):
+    SpotifyClient.for_user(user.id).handle_auth()
+    client = SpotifyClient.for_user(user.id)
+    client.get_resource_header()['Authorization'] = 'changed'
+    assert client.get_resource_header()['Authorization'] == 'Bearer token'
@@ -0,0 +1,47 @@
+"""Authenticated users are cached across requests, until they change."""
+from helpers import count_statements, get
+
+from rythmize import db
+from rythmize.extensions import db_manager
+from rythmize.metrics import metrics
+from rythmize.models.user import User
+
+
+def test_second_request_skips_the_user_lookup(app, auth_headers):
+    get(app, '/api/v1/auth/user/current', auth_headers)
+    with count_statements() as statements:
+        response = get(app, '/api/v1/auth/connect/spotify/status', auth_headers)
+    assert response.status_code == 200
+    assert statements == []
+    assert metrics.snapshot()['identity_cache']['hit_rate'] == 0.5
+
+
+def test_validate_token_never_queries(app, auth_headers):
+    with count_statements() as statements:
+        response = get(app, '/api/v1/auth/validate/jwt', auth_headers)
+    assert response.status_code == 200
+    assert statements == []
+
+
+def test_user_update_invalidates(app, user, auth_headers):
+    get(app, '/api/v1/auth/user/current', auth_headers)
+    user = User.query.get(user.id)
+    user.email = 'changed@example.com'
+    db.session.commit()
+    response = get(app, '/api/v1/auth/user/current', auth_headers)
+    assert response.get_json()['email'] == 'changed@example.com'
+
+
+def test_key_update_invalidates(app, user, auth_headers):
+    get(app, '/api/v1/auth/user/current', auth_headers)
+    db_manager.update_key_table(user.id, jwt_token='new-token')
+    db.session.remove()
+    assert User.identify(user.id).spotify_keys.jwt_token == 'new-token'
+
+
+def test_user_delete_invalidates(app, user, auth_headers):
+    get(app, '/api/v1/auth/user/current', auth_headers)
+    db.session.delete(User.query.get(user.id))
+    db.session.commit()
+    db.session.remove()
+    assert User.identify(user.id) is None
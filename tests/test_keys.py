@@ -0,0 +1,35 @@
+"""Tests for refresh token encryption and key rotation."""
+from cryptography.fernet import Fernet
+
+from rythmize.models.keys import (Security, SpotifyJsonWebToken,
+                                  rotate_refresh_tokens)
+
+
+def test_keyring_is_built_once_per_app(app):
+    assert Security.load_configs() is Security.load_configs()
+
+
+def test_refresh_token_is_decrypted_once(app, monkeypatch):
+    keys = SpotifyJsonWebToken()
+    keys.refresh_token = 'refresh'
+    keys._refresh_token_plain = None      # as if freshly loaded from the database
+    calls = []
+    decrypt = Security.decrypt_data
+    monkeypatch.setattr(Security, 'decrypt_data', lambda self, value: calls.append(value) or decrypt(self, value))
+    assert keys.refresh_token == keys.refresh_token == 'refresh'
+    assert len(calls) == 1
+
+
+def test_rotation_reencrypts_with_the_new_key(app, user):
+    old_key = app.secret_key
+    new_key = Fernet.generate_key().decode()
+    app.secret_key = new_key
+    app.config['SECRET_KEY_FALLBACKS'] = [old_key]
+    app.extensions.pop('rythmize_keyring')
+    assert rotate_refresh_tokens(batch_size=1) == 1
+
+    app.config['SECRET_KEY_FALLBACKS'] = []
+    app.extensions.pop('rythmize_keyring')
+    keys = SpotifyJsonWebToken.query.one()
+    assert Fernet(new_key.encode()).decrypt(keys._refresh_token.encode()) == b'refresh'
+    assert keys.refresh_token == 'refresh'
@@ -0,0 +1,119 @@
+"""Tests for the outbound mail queue, against a local stub SMTP server."""
+import json
+import socket
+import socketserver
+import threading
+
+import pytest
+from helpers import TestingConfig
+
+from rythmize import create_app, db
+from rythmize.models.mail import FailedEmail
+from rythmize.tasks import mail_outbox
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: records connections and messages, refuses server.rejected."""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 stub')
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line.split(' ', 1)[0].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command == 'DATA':
+                self.reply('354 go ahead')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                self.server.messages += 1
+                self.reply('250 queued')
+            elif command == 'RCPT' and any(address in line for address in self.server.rejected):
+                self.reply('550 no such user')
+            else:
+                self.reply('250 ok')
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubSMTPHandler)
+        self.connections = self.messages = 0
+        self.rejected = set()
+
+
+@pytest.fixture
+def smtp():
+    server = StubSMTPServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def mail_app(port):
+    class MailConfig(TestingConfig):
+        MAIL_SUPPRESS_SEND = False
+        MAIL_SERVER = '127.0.0.1'
+        MAIL_PORT = port
+        MAIL_DEFAULT_SENDER = 'rythmize@example.com'
+        MAIL_RETRIES = 1
+        MAIL_RETRY_BACKOFF = 0
+    app = create_app(MailConfig)
+    return app
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_registration_returns_before_the_mail_is_sent(smtp):
+    app = mail_app(smtp.server_address[1])
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+        for number in range(3):
+            response = client.post('/api/v1/auth/user/register', data=json.dumps(
+                {'username': f'user{number}', 'email': f'user{number}@example.com', 'password': 'pw'}))
+            assert response.status_code == 200
+        assert smtp.messages == 0 and len(mail_outbox) == 3
+        mail_outbox.run_pending()
+        assert smtp.messages == 3
+        assert smtp.connections == 1    # one connection for the batch
+
+
+def test_failed_sends_are_saved_and_replayed(smtp):
+    app = mail_app(closed_port())
+    with app.app_context():
+        db.create_all()
+        from rythmize.extensions import message
+        mail_outbox.send(message('hello', recipients=['user@example.com'], body='hi'))
+        mail_outbox.run_pending()
+        assert FailedEmail.query.count() == 1
+
+        mail_outbox.app.extensions['mail'].port = smtp.server_address[1]
+        assert mail_outbox.replay_failed() == 1
+        mail_outbox.run_pending()
+        assert smtp.messages == 1 and FailedEmail.query.count() == 0
+
+
+def test_rejected_recipients_dont_hold_back_the_batch(smtp):
+    smtp.rejected.add('bad@example.com')
+    app = mail_app(smtp.server_address[1])
+    with app.app_context():
+        db.create_all()
+        from rythmize.extensions import message
+        for name in ('a', 'bad', 'b', 'c'):
+            mail_outbox.send(message('hello', recipients=[f'{name}@example.com'], body='hi'))
+        mail_outbox.run_pending()
+        assert smtp.messages == 3 and smtp.connections == 1
+        assert [row.recipients for row in FailedEmail.query] == ['bad@example.com']
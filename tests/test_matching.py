@@ -0,0 +1,74 @@
+"""Candidates of a search are scored, the best one wins over spotify's first."""
+from urllib.parse import parse_qs, urlparse
+
+from rythmize.clients.matching import TrackMatcher, clean_title
+from rythmize.clients.resolution import track_cache
+
+
+def candidate(name, *artists, duration_ms=200000, uri=None):
+    return {'name': name, 'artists': [{'name': artist} for artist in artists],
+            'duration_ms': duration_ms, 'uri': uri or f'spotify:track:{name}|{"|".join(artists)}'}
+
+
+def test_titles_are_cleaned():
+    assert clean_title('Halo (feat. Someone) - Remastered 2011') == 'halo'
+    assert clean_title('(Intro)') == 'intro'
+
+
+def test_best_candidate_is_not_the_first():
+    tracks = [candidate('Halo - Karaoke Version', 'Karaoke Hits'),
+              candidate('Halo (Live)', 'Beyoncé'),
+              candidate('Halo', 'Beyoncé', 'Someone Else'),
+              candidate('Halo', 'Another Band')]
+    best, score = TrackMatcher().best({'track': 'halo', 'artist': 'Beyonce'}, tracks)
+    assert best is tracks[2] and score > 0.9
+
+
+def test_duration_breaks_ties():
+    tracks = [candidate('Song', 'Band', duration_ms=420000), candidate('Song', 'Band', duration_ms=181000)]
+    best, _ = TrackMatcher().best({'track': 'Song', 'artist': 'Band', 'duration_ms': 180000}, tracks)
+    assert best is tracks[1]
+
+
+def test_durations_from_clients_may_be_strings():
+    tracks = [candidate('Song', 'Band', duration_ms=420000), candidate('Song', 'Band', duration_ms=181000)]
+    best, _ = TrackMatcher().best({'track': 'Song', 'artist': 'Band', 'duration_ms': '180000'}, tracks)
+    assert best is tracks[1]
+    best, score = TrackMatcher().best({'track': 'Song', 'artist': 'Band', 'duration_ms': '3:00'}, tracks)
+    assert best is tracks[0] and score > 0.9
+
+
+def test_relaxed_search_only_below_threshold(stub_spotify):
+    queries = []
+
+    def handler(request):
+        query = parse_qs(urlparse(request.url).query)['q'][0]
+        queries.append(query)
+        if query.startswith('track:'):
+            return {'tracks': {'items': [candidate('Something Else', 'Band')]}}
+        return {'tracks': {'items': [candidate('Rock & Roll', 'Band', uri='spotify:track:relaxed')]}}
+    client, _ = stub_spotify(handler)
+    uri, confidence = client.match_track({'track': 'Rock & Roll (Remastered)', 'artist': 'Band'})
+    assert uri == 'spotify:track:relaxed' and confidence > client.match_threshold
+    # the query is url-encoded, the & stays in the title
+    assert queries == ['track:Rock & Roll (Remastered) artist:Band', 'rock roll Band']
+    queries.clear()
+    assert client.get_track_uri('Something Else', 'Band')
+    assert len(queries) == 1
+
+
+def test_poor_matches_resolve_to_none(stub_spotify):
+    client, _ = stub_spotify(lambda request: {'tracks': {'items': [candidate('Unrelated', 'Nobody')]}})
+    uri, confidence = client.match_track({'track': 'Song', 'artist': 'Band'})
+    assert uri is None and confidence < client.min_confidence
+
+
+def test_failed_relaxed_search_is_not_a_miss(stub_spotify, memory_track_cache):
+    def handler(request):
+        if parse_qs(urlparse(request.url).query)['q'][0].startswith('track:'):
+            return {'tracks': {'items': []}}
+        return 503, {}
+    client, _ = stub_spotify(handler)
+    assert client.match_track({'track': 'Song', 'artist': 'Band'}) is None
+    client.resolve_track_uris([{'track': 'Song', 'artist': 'Band'}])
+    assert track_cache.get_many([track_cache.key('Song', 'Band')]) == {}
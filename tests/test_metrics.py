@@ -0,0 +1,58 @@
+"""Request, sql && spotify call instrumentation exported on /metrics."""
+from helpers import TestingConfig
+
+from rythmize import create_app, db
+from rythmize.metrics import metrics
+
+
+def scrape(app):
+    response = app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    return response.get_data(as_text=True)
+
+
+def test_endpoint_latency_and_statements(app, auth_headers):
+    db.session.remove()
+    app.test_client().get('/api/v1/auth/user/current', headers=auth_headers)
+    text = scrape(app)
+    assert ('rythmize_request_seconds_count{endpoint="api_views.user_details",'
+            'method="GET",status="200"} 1') in text
+    assert ('rythmize_request_sql_statements_bucket{endpoint="api_views.user_details",le="1"} 1'
+            in text)
+    assert 'rythmize_identity_cache_hit_rate 0.0' in text
+
+
+def test_spotify_calls_by_operation(app, auth_headers, spotify_api):
+    spotify_api(lambda request: {'items': [], 'next': None})
+    app.test_client().get('/api/v1/clients/spotify/playlists/', headers=auth_headers)
+    text = scrape(app)
+    assert 'rythmize_spotify_requests_total{operation="playlist_read",status="200"} 1' in text
+    assert 'rythmize_spotify_request_seconds_count{operation="playlist_read"} 1' in text
+    assert '# TYPE rythmize_response_cache_hits gauge' in text
+
+
+def test_server_timing_header(app, auth_headers, monkeypatch):
+    monkeypatch.setattr(metrics, 'server_timing', True)
+    db.session.remove()
+    response = app.test_client().get('/api/v1/auth/user/current', headers=auth_headers)
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('app;dur=')
+    assert 'db;desc="1 statements"' in timing
+    assert 'spotify;desc="0 calls"' in timing
+
+
+def test_disabled():
+    config = type('NoMetricsConfig', (TestingConfig,), {'METRICS_ENABLED': False})
+    app = create_app(config)
+    assert app.test_client().get('/metrics').status_code == 404
+    assert metrics.snapshot().get('rythmize_spotify_requests_total') is None
+
+
+def test_token_is_required_when_set():
+    config = type('TokenConfig', (TestingConfig,), {'METRICS_TOKEN': 'scraper'})
+    app = create_app(config)
+    client = app.test_client()
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer other'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scraper'}).status_code == 200
@@ -0,0 +1,43 @@
+"""Tests for password hashing."""
+import json
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from rythmize import db
+from rythmize.extensions import hasher
+from rythmize.models.user import User
+from rythmize.passwords import PasswordHasher
+
+SCHEMES = [
+    ('pbkdf2', {'iterations': 1000}),
+    ('scrypt', {'n': 2 ** 10, 'r': 8, 'p': 1}),
+    ('argon2', {'time_cost': 1, 'memory_cost': 1024, 'parallelism': 1}),
+]
+
+
+@pytest.mark.parametrize('scheme, params', SCHEMES)
+def test_hash_and_verify(scheme, params):
+    if scheme == 'argon2':
+        pytest.importorskip('argon2')
+    passwords = PasswordHasher(scheme, params)
+    stored = passwords.hash('secret')
+    assert passwords.verify(stored, 'secret')
+    assert not passwords.verify(stored, 'wrong')
+    assert not passwords.needs_rehash(stored)
+    assert PasswordHasher(scheme, dict(params, **{list(params)[0]: 2048})).needs_rehash(stored)
+
+
+def test_hashing_on_a_process_pool():
+    passwords = PasswordHasher('pbkdf2', {'iterations': 1000}, workers=1)
+    assert passwords.verify(passwords.hash('secret'), 'secret')
+
+
+def test_outdated_hash_is_replaced_on_login(app, user):
+    user._password = generate_password_hash('password')     # werkzeug defaults
+    db.session.commit()
+    response = app.test_client().post('/api/v1/auth/user/login', data=json.dumps(
+        {'username': 'user', 'password': 'password'}))
+    assert response.status_code == 200
+    stored = User.query.get(user.id).password
+    assert not hasher.needs_rehash(stored) and hasher.verify(stored, 'password')
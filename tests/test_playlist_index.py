@@ -0,0 +1,61 @@
+"""Tests for the local playlist index."""
+import pytest
+from helpers import playlist, spotify
+
+from rythmize.clients.spotify import SpotifyClient, SpotifyClientError
+from rythmize.models.playlists import PlaylistIndex
+
+
+def test_sync_writes_only_changed_rows(app, user):
+    assert PlaylistIndex.sync(user.id, [playlist('a', 'one'), playlist('b', 'two')]) == 2
+    assert PlaylistIndex.sync(user.id, [playlist('a', 'one'), playlist('b', 'two', 's2')]) == 1
+    assert PlaylistIndex.sync(user.id, [playlist('b', 'two', 's2')]) == 1
+    assert PlaylistIndex.lookup(user.id, 'two') == 'b'
+    assert PlaylistIndex.lookup(user.id, 'one') is None
+
+
+def test_repeated_transfers_reuse_the_created_playlist(app, user, spotify_api):
+    playlists, requests = [], []
+    spotify_api(spotify(playlists, requests))
+    songs = [{'track': 'song', 'artist': 'band'}]
+    sclient = SpotifyClient(None, user)
+    sclient.perform_transfer_tracks('mix', songs)
+    requests.clear()
+    sclient.perform_transfer_tracks('mix', songs)
+    assert len(playlists) == 1
+    # resolved from the index, without listing the user's playlists
+    assert not [url for _, url in requests if url.endswith('/me/playlists')]
+
+
+def test_renamed_or_deleted_playlists_leave_the_index(app, user, spotify_api):
+    playlists, requests = [playlist('a', 'mix'), playlist('b', 'old')], []
+    spotify_api(spotify(playlists, requests))
+    PlaylistIndex.sync(user.id, playlists)
+    sclient = SpotifyClient(None, user)
+    playlists[0] = playlist('a', 'renamed')
+    del playlists[1]
+    assert sclient.find_playlist('mix') is None
+    assert sclient.find_playlist('old') is None
+    assert PlaylistIndex.lookup(user.id, 'renamed') == 'a'
+
+
+def test_concurrent_inserts_are_ignored(app, user):
+    PlaylistIndex.insert(user.id, 'a', 'mix')
+    PlaylistIndex.insert(user.id, 'a', 'mix')
+    assert PlaylistIndex.query.filter_by(user_id=user.id).count() == 1
+
+
+def test_unreadable_destination_is_not_written(app, user, spotify_api):
+    playlists, requests = [playlist('p1', 'mix')], []
+    handler = spotify(playlists, requests)
+
+    def unavailable(request):
+        if request.url.split('?')[0].endswith('/playlists/p1/tracks') and request.method == 'GET':
+            requests.append((request.method, request.url.split('?')[0]))
+            return 503, {}
+        return handler(request)
+    spotify_api(unavailable)
+    sclient = SpotifyClient(None, user)
+    with pytest.raises(SpotifyClientError):
+        sclient.perform_transfer_tracks('mix', [{'uri': 'spotify:track:already'}])
+    assert not [method for method, _ in requests if method == 'POST']
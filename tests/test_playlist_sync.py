@@ -0,0 +1,90 @@
+"""Incremental sync: only new songs are resolved, unchanged destinations aren't read."""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from helpers import FakePlaylist
+
+from rythmize.clients.resolution import track_cache
+from rythmize.models.sync import PlaylistSyncTrack
+from rythmize.tasks import transfer_queue
+
+
+@pytest.fixture
+def sync(app, auth_headers, spotify_api, memory_track_cache):
+    """sync(songs) -> (status code, json) once the job ran."""
+    spotify = FakePlaylist()
+    spotify_api(spotify)
+    client = app.test_client()
+
+    def post(songs):
+        response = client.post('/api/v1/clients/spotify/playlist/sync', headers=auth_headers,
+                               data=json.dumps({'source': 'yt-list', 'playlist': 'mix', 'tracks': songs}))
+        transfer_queue.run_pending()
+        return response.status_code, response.get_json()
+    return post, spotify
+
+
+def songs(*names):
+    return [{'track': name, 'artist': 'band'} for name in names]
+
+
+def test_unchanged_sync_sends_nothing(sync):
+    post, spotify = sync
+    status, job = post(songs('a', 'b', 'c'))
+    assert status == 202 and job['total'] == 3 and job['sync_id']
+    assert [t['track']['uri'] for t in spotify.tracks] == ['spotify:track:a', 'spotify:track:b', 'spotify:track:c']
+    spotify.requests.clear()
+    status, state = post(songs('c', 'b', 'a'))
+    assert status == 200 and state['status'] == 'unchanged' and state['synced'] == 3
+    assert spotify.requests == []
+
+
+def test_cached_misses_count_as_synced(sync):
+    post, spotify = sync
+    # resolved by an earlier transfer: no match
+    track_cache.set_many({track_cache.key('gone', 'band'): None})
+    status, job = post(songs('a', 'gone'))
+    assert status == 202 and job['total'] == 2
+    spotify.requests.clear()
+    status, state = post(songs('a', 'gone'))
+    assert status == 200 and state['status'] == 'unchanged' and state['synced'] == 2
+    assert spotify.requests == []
+
+
+def test_misses_are_searched_again_once_expired(sync, memory_track_cache):
+    post, spotify = sync
+    key = track_cache.key('late', 'band')
+    track_cache.set_many({key: None})   # not on spotify yet
+    post(songs('a', 'late'))
+    assert post(songs('a', 'late'))[0] == 200
+    # a day later the cached miss expired, spotify has the song now
+    PlaylistSyncTrack.query.update({PlaylistSyncTrack.synced_on: datetime.utcnow() - timedelta(days=1)})
+    memory_track_cache.set_many({key: None}, -1)
+    status, job = post(songs('a', 'late'))
+    assert status == 202 and job['total'] == 1
+    assert [t['track']['uri'] for t in spotify.tracks] == ['spotify:track:a', 'spotify:track:late']
+    assert post(songs('a', 'late'))[0] == 200
+
+
+def test_only_new_songs_are_resolved(sync):
+    post, spotify = sync
+    post(songs('a', 'b'))
+    spotify.requests.clear()
+    status, job = post(songs('a', 'b', 'd'))
+    assert status == 202 and job['total'] == 1
+    # no playlist scan, no read of the unchanged destination, one search
+    assert spotify.requests == [('GET', '/v1/playlists/mix'), ('GET', '/v1/search'),
+                                ('POST', '/v1/playlists/mix/tracks')]
+    assert [t['track']['uri'] for t in spotify.tracks][-1] == 'spotify:track:d'
+
+
+def test_changed_destination_is_read_again(sync):
+    post, spotify = sync
+    post(songs('a'))
+    spotify.add(['spotify:track:e'])    # added by the user on spotify
+    spotify.requests.clear()
+    post(songs('a', 'e', 'f'))
+    assert ('GET', '/v1/playlists/mix/tracks') in spotify.requests
+    assert [t['track']['uri'] for t in spotify.tracks] == ['spotify:track:a', 'spotify:track:e',
+                                                           'spotify:track:f']
@@ -0,0 +1,19 @@
+"""SQL statements issued per authenticated route."""
+import pytest
+from helpers import count_statements
+
+from rythmize import db
+
+
+@pytest.mark.parametrize('route, status', [
+    ('/api/v1/auth/user/current', 200),
+    ('/api/v1/auth/connect/spotify/status', 200),
+    ('/api/v1/clients/spotify/playlists/', 200),
+])
+def test_user_and_keys_are_loaded_in_one_statement(app, auth_headers, spotify_api, route, status):
+    spotify_api(lambda request: {'items': [], 'next': None})
+    db.session.remove()     # start from an empty identity map, like a new request
+    with count_statements() as statements:
+        response = app.test_client().get(route, headers=auth_headers)
+    assert response.status_code == status
+    assert len(statements) == 1, statements
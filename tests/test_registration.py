@@ -0,0 +1,34 @@
+"""Registration relies on the unique constraints, not on pre-check queries."""
+from helpers import count_statements
+
+from rythmize.models.user import User
+
+
+def register(app, **fields):
+    data = dict({'username': 'new', 'email': 'New@Example.com', 'password': 'secret'}, **fields)
+    return app.test_client().post('/api/v1/auth/user/register', json=data)
+
+
+def test_email_is_stored_lowercased(app):
+    assert register(app).status_code == 200
+    assert User.query.one().email == 'new@example.com'
+
+
+def test_duplicate_email_differing_in_case_is_rejected(app):
+    assert register(app).status_code == 200
+    response = register(app, username='other', email='NEW@example.COM')
+    assert response.status_code == 401
+    assert response.get_json() == 'username or email already registred'
+    assert User.query.count() == 1
+
+
+def test_duplicate_username_is_rejected(app):
+    assert register(app).status_code == 200
+    assert register(app, email='other@example.com').status_code == 401
+    assert User.query.count() == 1
+
+
+def test_registration_issues_no_select(app):
+    with count_statements() as statements:
+        assert register(app).status_code == 200
+    assert not [s for s in statements if s.lstrip().upper().startswith('SELECT')], statements
@@ -0,0 +1,66 @@
+"""Read-only views are served by the replica bind, writes stay on the primary."""
+from datetime import datetime, timedelta
+
+import pytest
+from helpers import TestingConfig
+
+from config import engine_options
+from rythmize import create_app, db
+from rythmize.extensions import guard
+from rythmize.models.keys import SpotifyJsonWebToken
+from rythmize.models.user import User
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    """App on two sqlite files, the replica copy of the user has another email."""
+    config = type('ReplicaConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "primary.db"}',
+        'SQLALCHEMY_BINDS': {'replica': f'sqlite:///{tmp_path / "replica.db"}'}})
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+        replica = db.get_engine(app, bind='replica')
+        db.Model.metadata.create_all(replica)
+        user = User(username='user', email='primary@example.com', password='password')
+        user.spotify_keys = SpotifyJsonWebToken(jwt_token='token')
+        user.spotify_keys.token_expires_on = datetime.now() + timedelta(hours=1)
+        db.session.add(user)
+        db.session.commit()
+        replica.execute(User.__table__.insert(), id=user.id, username='user',
+                        email='replica@example.com', _password=user.password)
+        replica.execute(SpotifyJsonWebToken.__table__.insert(), user_id=user.id, jwt_token='token',
+                        token_expires_on=user.spotify_keys.token_expires_on)
+        headers = {'Authorization': f'Bearer {guard.encode_jwt_token(user)}'}
+        db.session.remove()
+        yield app, headers
+        db.session.remove()
+
+
+def test_read_only_views_use_the_replica(replicated):
+    app, headers = replicated
+    response = app.test_client().get('/api/v1/auth/user/current', headers=headers)
+    assert response.get_json()['email'] == 'replica@example.com'
+    db.session.remove()
+    response = app.test_client().get('/api/v1/auth/connect/spotify/status', headers=headers)
+    assert response.status_code == 200
+
+
+def test_writes_go_to_the_primary(replicated):
+    app, _ = replicated
+    response = app.test_client().post('/api/v1/auth/user/register', json={
+        'username': 'new', 'email': 'new@example.com', 'password': 'secret'})
+    assert response.status_code == 200
+    replica = db.get_engine(app, bind='replica')
+    assert replica.execute('SELECT count(*) FROM user').scalar() == 1
+    assert User.query.filter_by(username='new').count() == 1
+
+
+def test_engine_options_only_include_what_is_set(monkeypatch):
+    assert engine_options('sqlite://') == {'pool_pre_ping': True}
+    monkeypatch.setenv('DB_POOL_SIZE', '10')
+    monkeypatch.setenv('DB_POOL_RECYCLE', '300')
+    monkeypatch.setenv('DB_STATEMENT_TIMEOUT', '5000')
+    assert engine_options('sqlite://') == {'pool_pre_ping': True, 'pool_size': 10, 'pool_recycle': 300}
+    assert engine_options('postgresql://db/rythmize')['connect_args'] == \
+        {'options': '-c statement_timeout=5000'}
@@ -0,0 +1,38 @@
+"""Tests for the ETag response cache."""
+import pytest
+
+from rythmize.clients.response_cache import response_cache
+
+
+@pytest.fixture
+def etag_spotify(stub_spotify):
+    """Playlist tracks served with an ETag, 304 when If-None-Match matches."""
+    response_cache.invalidate(1)
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get('If-None-Match'))
+        if request.method == 'POST':
+            return 201, {'snapshot_id': 'snapshot'}
+        if request.headers.get('If-None-Match') == '"v1"':
+            return 304, {}, {'ETag': '"v1"'}
+        track = {'id': 'id', 'name': 'song', 'uri': 'spotify:track:id', 'duration_ms': 1000,
+                 'album': {'name': 'album', 'artists': [{'name': 'artist'}]}}
+        return 200, {'items': [{'track': track}], 'next': None}, {'ETag': '"v1"'}
+    client, _ = stub_spotify(handler)
+    return client, seen
+
+
+def test_not_modified_reuses_the_parsed_response(etag_spotify):
+    client, seen = etag_spotify
+    first = client.get_playlist_tracks('playlist')
+    assert client.get_playlist_tracks('playlist') == first
+    assert seen == [None, '"v1"']
+
+
+def test_writes_invalidate_the_playlist(etag_spotify):
+    client, seen = etag_spotify
+    client.get_playlist_tracks('playlist')
+    client.add_tracks_to_playlist('playlist', ['spotify:track:other'])
+    client.get_playlist_tracks('playlist')
+    assert seen == [None, None, None]
@@ -0,0 +1,110 @@
+"""AsyncSpotifyClient against the stubbed spotify handlers of the sync tests."""
+import json
+from types import SimpleNamespace
+
+import pytest
+from helpers import FakePlaylist, fake_spotify, paging, playlist, spotify, throttled, track
+
+from rythmize.clients.spotify_async import AsyncSpotifyClient, async_transport
+from rythmize.models.playlists import PlaylistIndex
+from rythmize.tasks import transfer_queue
+
+httpx = pytest.importorskip('httpx')
+
+
+@pytest.fixture
+def async_spotify(app, monkeypatch):
+    """Routes the async transport to a stub handler, spotify_api style."""
+    from rythmize.clients.spotify import SpotifyClient
+    monkeypatch.setattr(SpotifyClient, 'client_id', 'client-id')
+    monkeypatch.setattr(SpotifyClient, 'client_secret', 'client-secret')
+    app.config['SPOTIFY_ASYNC_CLIENT'] = True
+    sent = []
+
+    def mount(handler):
+        def respond(request):
+            stub = SimpleNamespace(url=str(request.url), method=request.method, body=request.content)
+            sent.append(stub)
+            result = handler(stub)
+            status, payload, headers = (result + ({},))[:3] if isinstance(result, tuple) else (200, result, {})
+            return httpx.Response(status, json=payload, headers=headers)
+        async_transport.mount('all://', httpx.MockTransport(respond))
+        return sent
+    yield mount
+    async_transport.unmount('all://')
+
+
+def test_playlist_pages_are_fetched_together(app, auth_headers, async_spotify):
+    items = [{'track': track(n)} for n in range(250)]
+    sent = async_spotify(paging(items))
+    response = app.test_client().get('/api/v1/clients/spotify/playlists/p/tracks', headers=auth_headers)
+    assert response.status_code == 200
+    assert [list(t)[0] for t in response.get_json()] == [f'id{n}' for n in range(250)]
+    assert sorted('offset=' + s.url.split('offset=')[1].split('&')[0] for s in sent) == \
+        ['offset=0', 'offset=100', 'offset=200']
+
+
+def test_transfer_job_on_the_async_client(app, auth_headers, async_spotify, memory_track_cache):
+    async_spotify(throttled(fake_spotify, 2))
+    client = app.test_client()
+    songs = [{'track': f'song{n}', 'artist': 'band'} for n in range(3)]
+    songs.append({'track': 'unknown', 'artist': 'band'})
+    job = client.post('/api/v1/clients/spotify/playlist/transfer', headers=auth_headers,
+                      data=json.dumps({'playlist': 'mix', 'tracks': songs})).get_json()
+    transfer_queue.run_pending()
+    job = client.get(f'/api/v1/clients/spotify/playlist/transfer/{job["id"]}', headers=auth_headers).get_json()
+    assert (job['status'], job['resolved'], job['added'], job['failed']) == ('done', 3, 3, 1)
+
+
+def test_sync_on_the_async_client(app, auth_headers, async_spotify, memory_track_cache):
+    spotify = FakePlaylist()
+    async_spotify(spotify)
+    client = app.test_client()
+
+    def post(names):
+        body = {'source': 'yt-list', 'playlist': 'mix', 'tracks': [{'track': n, 'artist': 'band'} for n in names]}
+        response = client.post('/api/v1/clients/spotify/playlist/sync', headers=auth_headers, data=json.dumps(body))
+        transfer_queue.run_pending()
+        return response.status_code
+    assert post('ab') == 202
+    spotify.requests.clear()
+    assert post('abc') == 202
+    assert ('GET', '/v1/playlists/mix/tracks') not in spotify.requests
+    assert post('abc') == 200
+    assert [t['track']['uri'] for t in spotify.tracks] == [f'spotify:track:{n}' for n in 'abc']
+
+
+def test_unauthorized_without_token(app, user, auth_headers, async_spotify):
+    from rythmize import db
+    user.spotify_keys.jwt_token = None
+    db.session.commit()
+    async_spotify(fake_spotify)
+    response = app.test_client().get('/api/v1/clients/spotify/playlists/', headers=auth_headers)
+    assert response.status_code == 401
+
+
+def test_renamed_playlists_leave_the_index_on_the_async_client(app, user, async_spotify):
+    playlists = [playlist('a', 'mix')]
+    async_spotify(spotify(playlists, []))
+    PlaylistIndex.sync(user.id, playlists)
+    client = AsyncSpotifyClient(None, user)
+    assert async_transport.run(client.find_playlist('mix')) == 'a'
+    playlists[0] = playlist('a', 'renamed')
+    assert async_transport.run(client.find_playlist('mix')) is None
+
+
+def test_unreadable_destination_is_not_written_on_the_async_client(app, user, async_spotify,
+                                                                   memory_track_cache):
+    from rythmize.clients.spotify import SpotifyClientError
+    playlists, requests = [playlist('p1', 'mix')], []
+    handler = spotify(playlists, requests)
+
+    def unavailable(request):
+        if request.url.split('?')[0].endswith('/playlists/p1/tracks') and request.method == 'GET':
+            return 503, {}
+        return handler(request)
+    sent = async_spotify(unavailable)
+    client = AsyncSpotifyClient(None, user)
+    with pytest.raises(SpotifyClientError):
+        async_transport.run(client.perform_transfer_tracks('mix', [{'uri': 'spotify:track:already'}]))
+    assert not [request for request in sent if request.method == 'POST']
@@ -0,0 +1,135 @@
+"""Tests for SpotifyClient against a stubbed spotify api."""
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from helpers import paging, search_result, track
+
+
+def test_get_playlist_tracks_follows_every_page(stub_spotify):
+    items = [{'track': track(n)} for n in range(250)] + [{'track': None}]
+    client, adapter = stub_spotify(paging(items))
+    tracks = client.get_playlist_tracks('playlist')
+    assert [t.id for t in tracks] == [f'id{n}' for n in range(250)]
+    assert len(adapter.sent) == 3
+
+
+@pytest.mark.parametrize('fast_json', [True, False])
+def test_tracks_are_serialized_in_the_api_shape(app, auth_headers, spotify_api, fast_json):
+    app.config['FAST_JSON'] = fast_json
+    spotify_api(paging([{'track': track(n)} for n in range(3)]))
+    client = app.test_client()
+    response = client.get('/api/v1/clients/spotify/playlists/p/tracks', headers=auth_headers)
+    assert response.status_code == 200 and response.mimetype == 'application/json'
+    expected = {'id2': {'title': 'song2', 'duration': '0:03 min', 'album': 'album',
+                        'artist': 'artist', 'service': 'spotify', 'uri': 'spotify:track:id2'}}
+    assert response.get_json()[2] == expected
+    streamed = client.get('/api/v1/clients/spotify/playlists/p/tracks?stream=1', headers=auth_headers)
+    assert json.loads(streamed.data.decode().splitlines()[2]) == expected
+    for off in ('0', 'false'):
+        response = client.get(f'/api/v1/clients/spotify/playlists/p/tracks?stream={off}', headers=auth_headers)
+        assert response.mimetype == 'application/json' and response.get_json()[2] == expected
+
+
+def test_get_user_playlists_follows_every_page(stub_spotify):
+    items = [{'id': f'p{n}', 'name': f'name{n}', 'tracks': {'total': n}} for n in range(120)]
+    client, _ = stub_spotify(paging(items))
+    playlists = client.get_user_playlists()
+    assert len(playlists) == 120
+    assert playlists[-1] == {'p119': {'title': 'name119', 'tracks': 119, 'service': 'spotify'}}
+
+
+def test_failed_page_returns_none(stub_spotify):
+    items = [{'track': track(n)} for n in range(150)]
+    pages = paging(items)
+
+    def handler(request):
+        if 'offset=100' in request.url:
+            return 500, {'error': 'boom'}
+        return pages(request)
+    client, _ = stub_spotify(handler)
+    assert client.get_playlist_tracks('playlist') is None
+
+
+def test_add_tracks_is_chunked_and_retries_only_failed_chunks(stub_spotify):
+    failures = {1: 1}   # chunk index -> remaining failures
+
+    def handler(request):
+        uris = json.loads(request.body)['uris']
+        index = int(uris[0].rsplit(':', 1)[-1]) // 100
+        if failures.get(index):
+            failures[index] -= 1
+            return 502, {'error': 'bad gateway'}
+        return 201, {'snapshot_id': f'snapshot{index}'}
+    client, adapter = stub_spotify(handler)
+    client.add_tracks_backoff = 0
+    uris = [f'spotify:track:{n}' for n in range(250)]
+    result = client.add_tracks_to_playlist('playlist', uris)
+    assert result['snapshot_id'] == 'snapshot2'
+    assert [c['size'] for c in result['chunks']] == [100, 100, 50]
+    assert [c['attempts'] for c in result['chunks']] == [1, 2, 1]
+    assert all(c['status'] == 'added' for c in result['chunks'])
+    sent = [json.loads(r.body)['uris'] for r, _ in adapter.sent]
+    assert sent[1] == sent[2]   # only the failed chunk was sent again
+    assert sent[0] + sent[2] + sent[3] == uris
+
+
+def test_songs_with_ids_skip_search(stub_spotify):
+    known = {f'{n:022d}' for n in range(120)}
+
+    def handler(request):
+        url = urlparse(request.url)
+        if url.path.endswith('/tracks'):
+            ids = parse_qs(url.query)['ids'][0].split(',')
+            assert len(ids) <= 50
+            return {'tracks': [{'uri': f'spotify:track:{i}'} if i in known else None for i in ids]}
+        return search_result(request.url, 'spotify:track:searched')
+    client, adapter = stub_spotify(handler)
+    songs = [{'uri': f'spotify:track:{n:022d}'} for n in range(60)]
+    songs += [{'id': f'{n:022d}', 'track': 'song', 'artist': 'band'} for n in range(60, 120)]
+    songs += [{'id': 'x' * 22, 'track': 'gone', 'artist': 'band'}, {'id': 'yt-id', 'track': 'song', 'artist': 'other'}]
+    uris = client.resolve_track_uris(songs)
+    assert uris[:120] == [f'spotify:track:{n:022d}' for n in range(120)]
+    assert uris[120:] == ['spotify:track:searched'] * 2
+    paths = [urlparse(request.url).path.rsplit('/', 1)[-1] for request, _ in adapter.sent]
+    assert paths.count('tracks') == 3 and paths.count('search') == 2
+
+
+def test_concurrent_searches_keep_the_song_order(stub_spotify, memory_track_cache):
+    lock, in_flight, most = threading.Lock(), [0], [0]
+
+    def handler(request):
+        with lock:
+            in_flight[0] += 1
+            most[0] = max(most[0], in_flight[0])
+        time.sleep(0.1)
+        with lock:
+            in_flight[0] -= 1
+        if 'song3' in request.url or 'song7' in request.url:
+            return 500, {}
+        return search_result(request.url, f'spotify:track:{request.url.split("song")[1][0]}')
+    client, _ = stub_spotify(handler)
+    songs = [{'track': f'song{n}', 'artist': 'band'} for n in range(10)]
+    uris = client.resolve_track_uris(songs)
+    assert uris == [None if n in (3, 7) else f'spotify:track:{n}' for n in range(10)]
+    assert most[0] > 1   # searches overlapped
+
+
+def test_existing_and_repeated_tracks_are_added_once(stub_spotify, monkeypatch):
+    existing = [{'track': track(n)} for n in range(150)]
+    added = []
+
+    def handler(request):
+        if request.method == 'POST':
+            added.extend(json.loads(request.body)['uris'])
+            return 201, {'snapshot_id': 'snapshot'}
+        return paging(existing)(request)
+    client, _ = stub_spotify(handler)
+    monkeypatch.setattr(client, 'find_playlist', lambda name, refresh=False: 'playlist')
+    songs = [{'uri': f'spotify:track:id{n}'} for n in (149, 150, 150)]
+    monkeypatch.setattr(client, 'resolve_track_matches',
+                        lambda songs, progress=None: [(s['uri'], 1.0) for s in songs])
+    client.perform_transfer_tracks('mix', songs)
+    assert added == ['spotify:track:id150']
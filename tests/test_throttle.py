@@ -0,0 +1,82 @@
+"""Spotify calls are scheduled: rate budgets, Retry-After pauses, 429s re-sent."""
+import json
+import time
+
+from helpers import fake_spotify, throttled
+
+from rythmize.clients import throttle
+from rythmize.clients.throttle import RateBudget, scheduler, user_budget
+from rythmize.metrics import metrics
+from rythmize.tasks import transfer_queue
+
+
+def test_throttled_search_is_sent_again(stub_spotify):
+    series = 'rythmize_spotify_throttled_total{operation="search"}'
+    before = metrics.snapshot().get(series, 0)
+    client, adapter = stub_spotify(throttled(fake_spotify, 2))
+    assert client.get_track_uri('song', 'band').startswith('spotify:track:')
+    assert len(adapter.sent) == 3
+    assert metrics.snapshot()[series] - before == 2
+
+
+def test_retry_after_pauses_every_caller(stub_spotify):
+    client, _ = stub_spotify(throttled(fake_spotify, 1, retry_after='0.2'), user_id=1)
+    other, adapter = stub_spotify(fake_spotify, user_id=2)
+    start = time.monotonic()
+    client.get_track_uri('song', 'band')
+    assert time.monotonic() - start >= 0.2
+    scheduler.pause(client.client_id, 0.2)
+    start = time.monotonic()
+    other.get_track_uri('song', 'band')
+    assert time.monotonic() - start >= 0.2
+    assert len(adapter.sent) == 1
+
+
+def test_gives_up_after_max_retries(stub_spotify, monkeypatch):
+    monkeypatch.setattr(scheduler, 'max_retries', 2)
+    client, adapter = stub_spotify(throttled(fake_spotify, 10))
+    assert client.search_track('song', 'band') is None
+    assert len(adapter.sent) == 3
+
+
+def test_budget_reports_time_waited():
+    budget = RateBudget(rate=20, burst=1)
+    assert budget.acquire() == 0
+    assert budget.acquire() > 0
+
+
+def test_concurrent_searches_stay_within_the_user_budget(stub_spotify, memory_track_cache):
+    sent = []
+
+    def handler(request):
+        sent.append(time.monotonic())
+        return fake_spotify(request)
+    client, _ = stub_spotify(handler, user_id='budget-test')
+    client.user_rate_limit = 20     # burst of 20, then 20 per second
+    client.resolve_track_uris([{'track': f'song{n}', 'artist': 'band'} for n in range(30)])
+    assert len(sent) == 30
+    start = min(sent)
+    for count, at in enumerate(sorted(sent), 1):
+        assert count <= 20 + 20 * (at - start) + 1
+
+
+def test_transfer_loses_no_track_to_429s(app, auth_headers, spotify_api, memory_track_cache):
+    spotify_api(throttled(fake_spotify, 3))
+    client = app.test_client()
+    songs = [{'track': f'song{n}', 'artist': 'band'} for n in range(5)]
+    response = client.post('/api/v1/clients/spotify/playlist/transfer', headers=auth_headers,
+                           data=json.dumps({'playlist': 'mix', 'tracks': songs}))
+    transfer_queue.run_pending()
+    job = client.get(f'/api/v1/clients/spotify/playlist/transfer/{response.get_json()["id"]}',
+                     headers=auth_headers).get_json()
+    assert (job['status'], job['added'], job['failed']) == ('done', 5, 0)
+    text = app.test_client().get('/metrics').get_data(as_text=True)
+    assert 'rythmize_spotify_scheduler_queue_depth 0' in text
+
+
+def test_user_budgets_are_bounded(monkeypatch):
+    monkeypatch.setattr(throttle, '_budgets', throttle.LRUCache(maxsize=2))
+    first = user_budget(1, 10)
+    assert user_budget(1, 10) is first
+    user_budget(2, 10), user_budget(3, 10)
+    assert len(throttle._budgets) == 2 and user_budget(1, 10) is not first
@@ -0,0 +1,75 @@
+"""Tests for spotify token refresh."""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from rythmize import db
+from rythmize.clients import spotify
+from rythmize.clients.spotify import SpotifyClient, active_users, refresh_lock
+from rythmize.models.keys import SpotifyJsonWebToken
+from rythmize.tasks import refresh_expiring_tokens, token_refresher
+
+
+def token_endpoint(calls, delay=0):
+    def handler(request):
+        if 'accounts.spotify.com' in request.url:
+            calls.append(request.body)
+            time.sleep(delay)
+            return {'access_token': f'token{len(calls)}', 'expires_in': 3600}
+        return {'id': 'spotify-user'}
+    return handler
+
+
+def expire_in(user, seconds):
+    user.spotify_keys.token_expires_on = datetime.now() + timedelta(seconds=seconds)
+    db.session.commit()
+
+
+def test_token_is_refreshed_early(app, user, spotify_api):
+    calls = []
+    spotify_api(token_endpoint(calls))
+    expire_in(user, 60)     # still valid, but inside the refresh window
+    sclient = SpotifyClient(None, user)
+    assert sclient.handle_auth()
+    assert sclient.token == 'token1' and len(calls) == 1
+    keys = SpotifyJsonWebToken.query.one()
+    assert keys.jwt_token == 'token1' and keys.expires_in > datetime.now() + timedelta(minutes=59)
+
+
+def test_concurrent_refreshes_are_single_flight(app, user, spotify_api):
+    calls = []
+    spotify_api(token_endpoint(calls, delay=0.1))
+    expire_in(user, -60)
+    results = []
+
+    def request():
+        with app.app_context():
+            from rythmize.models.user import User
+            sclient = SpotifyClient(None, User.identify(user.id))
+            results.append((sclient.handle_auth(), sclient.token))
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [(True, 'token1')] * 4
+
+
+def test_background_refresher_refreshes_active_users(app, user, spotify_api):
+    calls = []
+    spotify_api(token_endpoint(calls))
+    token_refresher.interval = 600
+    expire_in(user, 400)    # outside the request window, inside the next run
+    active_users.clear()
+    assert refresh_expiring_tokens() == 0
+    active_users[user.id] = datetime.now()
+    assert refresh_expiring_tokens() == 1
+    assert SpotifyJsonWebToken.query.one().jwt_token == 'token1'
+
+
+def test_refresh_locks_are_shared_then_dropped():
+    lock = refresh_lock(42)
+    assert refresh_lock(42) is lock
+    del lock
+    assert 42 not in spotify._refresh_locks
@@ -0,0 +1,54 @@
+"""Tests for the track resolution cache."""
+import pytest
+from helpers import search_result
+
+from rythmize.clients.resolution import MemoryBackend, SQLBackend, TrackResolutionCache
+
+
+def test_keys_are_normalized():
+    key = TrackResolutionCache.key
+    assert key('Beyoncé - Halo!', '  Beyoncé ') == key('beyonce halo', 'BEYONCE')
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sql'])
+def test_hits_misses_and_negative_entries(app, backend):
+    cache = TrackResolutionCache(MemoryBackend() if backend == 'memory' else SQLBackend())
+    cache.set_many({'a|x': 'spotify:track:a', 'b|x': None})
+    assert cache.get_many(['a|x', 'b|x', 'c|x']) == {'a|x': 'spotify:track:a', 'b|x': None}
+    assert cache.stats()['hits'] == 2 and cache.stats()['misses'] == 1
+
+
+def test_sql_writes_survive_a_concurrent_insert(app, monkeypatch):
+    backend = SQLBackend()
+    backend.set_many({'a|x': 'spotify:track:old'}, 60)
+    # another worker inserted a|x after this one looked for it
+    monkeypatch.setattr(SQLBackend, '_existing', staticmethod(lambda connection, row_keys: set()))
+    backend.set_many({'a|x': 'spotify:track:new'}, 60)
+    assert backend.get_many(['a|x']) == {'a|x': 'spotify:track:old'}
+    monkeypatch.undo()
+    backend.set_many({'a|x': 'spotify:track:new', 'b|x': None}, 60)
+    assert backend.get_many(['a|x', 'b|x']) == {'a|x': 'spotify:track:new', 'b|x': None}
+
+
+def test_misses_use_the_shorter_ttl():
+    cache = TrackResolutionCache(ttl=60, miss_ttl=-1)
+    cache.set_many({'a|x': 'spotify:track:a', 'b|x': None})
+    assert cache.get_many(['a|x', 'b|x']) == {'a|x': 'spotify:track:a'}
+
+
+def test_resolver_searches_each_key_once(stub_spotify, memory_track_cache):
+    searches = []
+
+    def handler(request):
+        searches.append(request.url)
+        if 'nothing' in request.url:
+            return {'tracks': {'items': []}}
+        return search_result(request.url, f'spotify:track:{len(searches)}')
+    client, _ = stub_spotify(handler)
+    songs = [{'track': 'Song', 'artist': 'Band'}, {'track': 'song!', 'artist': 'band'},
+             {'track': 'nothing', 'artist': 'Band'}, {'track': None, 'artist': 'Band'}]
+    first = client.resolve_track_uris(songs)
+    assert first[0] == first[1] and first[0] is not None and first[2:] == [None, None]
+    assert len(searches) == 3   # nothing found is searched again, relaxed
+    assert client.resolve_track_uris(songs) == first
+    assert len(searches) == 3
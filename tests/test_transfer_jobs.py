@@ -0,0 +1,75 @@
+"""Tests for background transfer jobs."""
+import json
+from datetime import datetime, timedelta
+
+from helpers import fake_spotify
+
+from rythmize.extensions import db_manager
+from rythmize.models.jobs import TransferJob
+from rythmize.tasks import (claim_transfer_job, recover_stale_transfer_jobs, run_transfer_job,
+                            transfer_queue)
+
+
+def test_transfer_returns_a_job_and_reports_progress(app, auth_headers, spotify_api, memory_track_cache):
+    spotify_api(fake_spotify)
+    client = app.test_client()
+    songs = [{'track': f'song{n}', 'artist': 'band'} for n in range(3)]
+    songs.append({'track': 'unknown', 'artist': 'band'})
+    response = client.post('/api/v1/clients/spotify/playlist/transfer', headers=auth_headers,
+                           data=json.dumps({'playlist': 'mix', 'tracks': songs}))
+    assert response.status_code == 202
+    job = response.get_json()
+    assert job['status'] == 'queued' and job['total'] == 4
+    assert len(transfer_queue) == 1
+
+    transfer_queue.run_pending()
+    response = client.get(f'/api/v1/clients/spotify/playlist/transfer/{job["id"]}', headers=auth_headers)
+    assert response.status_code == 200
+    status = response.get_json()
+    matches = status['matches']
+    assert status == dict(job, status='done', resolved=3, added=3, failed=1,
+                          snapshot_id='snapshot', matches=matches)
+    assert [(m['track'], m['confidence'], bool(m['uri'])) for m in matches] == \
+        [('song0', 1.0, True), ('song1', 1.0, True), ('song2', 1.0, True), ('unknown', 0.0, False)]
+
+
+def test_job_status_is_private(app, auth_headers):
+    response = app.test_client().get('/api/v1/clients/spotify/playlist/transfer/missing',
+                                     headers=auth_headers)
+    assert response.status_code == 404
+
+
+def queued_job(user, **attrs):
+    job = TransferJob(user_id=user.id, playlist='mix', **attrs)
+    job.tracks = [{'track': 'song', 'artist': 'band'}]
+    db_manager.add(job)
+    db_manager.save()
+    return job.id
+
+
+def test_a_job_is_claimed_once(app, user):
+    job_id = queued_job(user)
+    assert claim_transfer_job() == job_id
+    assert claim_transfer_job() is None and claim_transfer_job(job_id) is None
+    # already running elsewhere, nothing is sent
+    run_transfer_job(job_id)
+    job = TransferJob.query.get(job_id)
+    assert job.status == 'running' and job.attempts == 1
+
+
+def test_stale_jobs_are_requeued_then_failed(app, user, spotify_api, memory_track_cache):
+    stale = datetime.utcnow() - timedelta(hours=1)
+    retried = queued_job(user, status='running', attempts=1)
+    lost = queued_job(user, status='running', attempts=3)
+    fresh = queued_job(user, status='running', attempts=1)
+    TransferJob.query.filter(TransferJob.id.in_([retried, lost])).update(
+        {TransferJob.updated_on: stale}, synchronize_session=False)
+    db_manager.save()
+    assert recover_stale_transfer_jobs() == 2
+    assert [TransferJob.query.get(job_id).status for job_id in (retried, lost, fresh)] == \
+        ['queued', 'failed', 'running']
+    assert len(transfer_queue) == 1
+    spotify_api(fake_spotify)
+    transfer_queue.run_pending()
+    job = TransferJob.query.get(retried)
+    assert job.status == 'done' and job.attempts == 2
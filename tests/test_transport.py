@@ -0,0 +1,22 @@
+"""Tests for the shared Spotify transport."""
+from rythmize.clients.transport import HttpTransport
+
+
+def test_session_is_reused():
+    http = HttpTransport()
+    assert http.session is http.session
+
+
+def test_injected_adapter_and_default_timeout(stub_spotify):
+    client, adapter = stub_spotify(lambda request: {'id': 'spotify-user'})
+    assert client.get_user_id() == 'spotify-user'
+    request, kwargs = adapter.sent[0]
+    assert request.headers['Authorization'] == 'Bearer token'
+    assert kwargs['timeout'] == (client.http.connect_timeout, client.http.read_timeout)
+
+
+def test_injected_adapter_survives_reset(stub_spotify):
+    client, adapter = stub_spotify(lambda request: {'id': 'spotify-user'})
+    client.http.reset()
+    client.get_user_id()
+    assert len(adapter.sent) == 1